@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+##################################################################################
+#     Title: bench_dsrqst
+#   Purpose: offline microbenchmarks for the hot paths of dsrqst, run against an
+#            in-memory SQLite stand-in of RDADB with synthetic requests and files
+#    Github: https://github.com/NCAR/rda-python-dsrqst.git
+#
+#     Usage: python benchmarks/bench_dsrqst.py [-s 1000,10000] [-c CASE,...]
+#                   [-r REPEAT] [-o RESULT.json] [-b BASELINE.json]
+##################################################################################
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from os import path as op
+
+sys.path.insert(0, op.dirname(op.dirname(op.abspath(__file__))))
+sys.path.insert(0, op.join(op.dirname(op.dirname(op.abspath(__file__))), "src"))
+from rda_python_dsrqst.dsrqst import DsRqst
+from rda_python_dsrqst.pg_subset import PgSubset
+from tests.rdadb_standin import RDADBStandIn
+
+class BenchRqst(RDADBStandIn, DsRqst):
+   """DsRqst with the RDADB access functions served by the SQLite stand-in."""
+
+   def __init__(self, workdir):
+      """Initialize BenchRqst with an empty stand-in database and a work directory."""
+      super().__init__()  # initialize parent class
+      self.init_standin()
+      self.PGLOG['BCKGRND'] = 1
+      self.PGLOG['LOGPATH'] = workdir
+      self.PGOPT['CACT'] = 'BR'
+      self.params['LN'] = self.PGLOG['CURUID']
+      self.params['WH'] = workdir
+
+def add_requests(rqst, count, status = 'Q'):
+   """Add synthetic requests from a few users of a few datasets, returning their indices."""
+   records = []
+   for i in range(count):
+      records.append((i + 1, "BENCH{}".format(i + 1), "d{:06}".format(i%7 + 1), "U", rqst.params['LN'],
+                      "user{}@ucar.edu".format(i%37), status, 10 - i%3, i%2*1000, "2026-01-01", "00:00:00"))
+   rqst.db.executemany("INSERT INTO dsrqst (rindex, rqstid, dsid, rqsttype, specialist, email, status, priority, " +
+                       "pid, date_rqst, time_rqst) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", records)
+   return [rec[0] for rec in records]
+
+def add_files(rqst, ridx, count, status = 'R', size = 1024):
+   """Add synthetic file records of one request, returning their file names."""
+   wfiles = ["file{:07}.nc".format(i) for i in range(count)]
+   rqst.db.executemany("INSERT INTO wfrqst (rindex, wfile, ofile, size, status, srcid) VALUES (?, ?, ?, ?, ?, ?)",
+                       [(ridx, wfiles[i], wfiles[i], size, status, i + 1) for i in range(count)])
+   return wfiles
+
+def write_files(dpath, wfiles, size = 64):
+   """Write small local files into a directory."""
+   os.makedirs(dpath, exist_ok = True)
+   buf = b"x"*size
+   for wfile in wfiles:
+      with open(op.join(dpath, wfile), 'wb') as f:
+         f.write(buf)
+
+def case_reorder_requests(rqst, scale):
+   """Fair ordering of queued requests across users and datasets."""
+   ridxs = add_requests(rqst, scale)
+   pgrecs = rqst.pgmget("dsrqst", "*", "rindex > 0 ORDER BY priority, rindex")
+   return lambda: None, lambda: rqst.reorder_requests(pgrecs, len(ridxs))
+
+def case_add_one_request_partitions(rqst, scale):
+   """Partition one request of scale files by file count."""
+   add_requests(rqst, 1)
+   add_files(rqst, 1, scale)
+   rqst.PGOPT['RCNTL'] = {'cindex' : 0, 'command' : None, 'ptlimit' : 100, 'ptsize' : 0, 'ptflag' : 'N', 'empty_out' : 'N'}
+   rqst.PGOPT['PTMAX'] = scale
+   cnd = "rindex = 1"
+   def setup():
+      rqst.db.execute("DELETE FROM ptrqst")
+      rqst.db.execute("UPDATE dsrqst SET ptcount = 0, status = 'Q' WHERE rindex = 1")
+      rqst.db.execute("UPDATE wfrqst SET pindex = 0")
+      return rqst.pgget("dsrqst", "*", cnd)
+   state = {}
+   def run():
+      rqst.add_one_request_partitions(1, cnd, state['pgrqst'])
+   return lambda: state.update(pgrqst = setup()), run
+
+def case_build_tarfile(rqst, scale):
+   """Tar scale small files of one request."""
+   add_requests(rqst, 1)
+   wfiles = add_files(rqst, 1, scale, 'O', 64)
+   pgrqst = rqst.pgget("dsrqst", "*", "rindex = 1")
+   rdir = op.join(rqst.params['WH'], pgrqst['rqstid'])
+   state = {}
+   def setup():
+      shutil.rmtree(rdir, ignore_errors = True)
+      write_files(rdir, wfiles)
+      rqst.db.execute("DELETE FROM tfrqst")
+      rqst.db.execute("UPDATE wfrqst SET tindex = 0")
+      os.chdir(rdir)
+      state['fidxs'] = rqst.pgmget("wfrqst", "findex", "rindex = 1 ORDER BY wfile")['findex']
+   def run():
+      tinfo = rqst.init_tarinfo("RQST1", 1, 0, pgrqst)
+      for i in range(scale):
+         rqst.build_tarfile(tinfo, state['fidxs'][i], wfiles[i], 64)
+      rqst.build_tarfile(tinfo)
+   return setup, run
+
+def case_call_command(rqst, scale):
+   """Check and record scale files built by a request command."""
+   add_requests(rqst, 1)
+   wfiles = add_files(rqst, 1, scale)
+   rqst.PGOPT['RCNTL'] = {'cindex' : 0, 'command' : "true", 'ptlimit' : 0, 'ptsize' : 0, 'ptflag' : 'N', 'empty_out' : 'N'}
+   rdir = op.join(rqst.params['WH'], "BENCH1")
+   write_files(rdir, wfiles)
+   state = {}
+   def setup():
+      rqst.db.execute("UPDATE wfrqst SET status = 'R', date = NULL, time = NULL")
+      rqst.db.execute("UPDATE dsrqst SET ptcount = 1, pcount = 0 WHERE rindex = 1")
+      state['pgrqst'] = rqst.pgget("dsrqst", "*", "rindex = 1")
+   def run():
+      rqst.call_command(1, "rindex = 1", "true", "RQST1", state['pgrqst'], 0, None)
+   return setup, run
+
+def case_record_purge_files(rqst, scale):
+   """Copy the scale file records of one request into wfpurge."""
+   add_requests(rqst, 1, 'O')
+   add_files(rqst, 1, scale, 'O')
+   return lambda: rqst.db.execute("DELETE FROM wfpurge"), lambda: rqst.record_purge_files("rindex = 1")
+
+def case_clean_dataset_data(rqst, scale):
+   """Find unused files among scale files of a dataset directory."""
+   ridxs = add_requests(rqst, 10, 'O')
+   wfiles = ["file{:07}.nc".format(i) for i in range(scale)]
+   rqst.db.executemany("INSERT INTO wfrqst (rindex, wfile, ofile) VALUES (?, ?, ?)",
+                       [(ridxs[i%10], wfiles[i], wfiles[i]) for i in range(0, scale, 2)])
+   rqst.db.execute("UPDATE dsrqst SET dsid = 'd000001'")
+   ddir = op.join(rqst.params['WH'], "data")
+   write_files(op.join(ddir, "d000001"), wfiles, 0)
+   os.chdir(ddir)
+   return lambda: None, lambda: rqst.clean_dataset_data("d000001")
+
+def case_get_request_status(rqst, scale):
+   """Expand the status of scale queued requests."""
+   ridxs = add_requests(rqst, scale)
+   rqst.db.execute("UPDATE dsrqst SET fcount = 10, size_request = 10240, ptcount = 1, lockhost = 'host'")
+   rqst.db.executemany("INSERT INTO dscheck (oindex, otype, command, runhost, pid, lockhost, stttime) VALUES (?, 'R', 'dsrqst', 'host', 1, 'host', 1)",
+                       [(ridx,) for ridx in ridxs[::3]])
+   rqst.db.executemany("INSERT INTO wfrqst (rindex, wfile, size, status) VALUES (?, 'file.nc', 1024, 'O')",
+                       [(ridx,) for ridx in ridxs[::2]])
+   pgrecs = rqst.pgmget("dsrqst", "*", "rindex > 0")
+   state = {}
+   def setup():
+      state['pgrecs'] = dict(pgrecs)
+      state['pgrecs']['status'] = list(pgrecs['status'])
+   return setup, lambda: rqst.get_request_status(state['pgrecs'])
+
+def case_subset_coordinates(rqst, scale):
+   """Parse scale longitude and latitude range strings of subset requests."""
+   subset = PgSubset()
+   rnd = random.Random(scale)
+   lons = ["{:.2f} W, {:.2f} E".format(rnd.uniform(0, 180), rnd.uniform(0, 180)) for i in range(scale)]
+   lats = ["{:.2f} S, {:.2f} N".format(rnd.uniform(0, 90), rnd.uniform(0, 90)) for i in range(scale)]
+   def run():
+      for i in range(scale):
+         subset.get_longitudes(lons[i], 0.25)
+         subset.get_latitudes(lats[i], 0.25)
+   return lambda: None, run
+
+CASES = {   # case name: [case function, largest scale run by default]
+   'reorder_requests' : [case_reorder_requests, 10000],
+   'add_one_request_partitions' : [case_add_one_request_partitions, None],
+   'build_tarfile' : [case_build_tarfile, 1000],
+   'call_command' : [case_call_command, 10000],
+   'record_purge_files' : [case_record_purge_files, None],
+   'clean_dataset_data' : [case_clean_dataset_data, None],
+   'get_request_status' : [case_get_request_status, None],
+   'subset_coordinates' : [case_subset_coordinates, None],
+}
+
+def run_case(name, scale, repeat):
+   """Run one benchmark case at one scale in a fresh stand-in database and work directory.
+
+   Returns:
+      Result dictionary with the minimum and median seconds and the database
+      calls of one run.
+   """
+   cwd = os.getcwd()
+   workdir = tempfile.mkdtemp(prefix = "bench_dsrqst_")
+   try:
+      rqst = BenchRqst(workdir)
+      (setup, run) = CASES[name][0](rqst, scale)
+      secs = []
+      dbcalls = 0
+      for i in range(repeat):
+         setup()
+         rqst.DBCALLS = 0
+         stime = time.perf_counter()
+         run()
+         secs.append(time.perf_counter() - stime)
+         dbcalls = rqst.DBCALLS
+   finally:
+      os.chdir(cwd)
+      shutil.rmtree(workdir, ignore_errors = True)
+   return {'case' : name, 'scale' : scale, 'repeat' : repeat, 'min' : round(min(secs), 6),
+           'median' : round(statistics.median(secs), 6), 'dbcalls' : dbcalls}
+
+def git_commit():
+   """Get the current git commit of the source tree, or None."""
+   try:
+      return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output = True, text = True,
+                            cwd = op.dirname(op.abspath(__file__))).stdout.strip() or None
+   except OSError:
+      return None
+
+def compare_results(results, bfile):
+   """Print the ratios of the median seconds against a baseline result file."""
+   with open(bfile) as f:
+      baseline = json.load(f)
+   bmeds = {(res['case'], res['scale']) : res['median'] for res in baseline['results']}
+   print("\nCompared with {} ({}):".format(bfile, baseline.get('commit')))
+   for res in results:
+      bmed = bmeds.get((res['case'], res['scale']))
+      if bmed: print("{:28} {:>7} {:8.2f}x".format(res['case'], res['scale'], res['median']/bmed))
+
+def main():
+   """Parse the command line, run the selected cases and write the JSON results."""
+   parser = argparse.ArgumentParser(description = "Offline microbenchmarks of dsrqst hot paths")
+   parser.add_argument('-s', '--scales', default = "1000,10000", help = "comma separated record counts")
+   parser.add_argument('-c', '--cases', default = ','.join(CASES), help = "comma separated case names")
+   parser.add_argument('-r', '--repeat', type = int, default = 3, help = "runs per case and scale")
+   parser.add_argument('-a', '--all', action = 'store_true', help = "run every case at every scale, even the slow ones")
+   parser.add_argument('-o', '--output', help = "JSON file to save the results")
+   parser.add_argument('-b', '--baseline', help = "JSON result file to compare with")
+   args = parser.parse_args()
+   scales = [int(s) for s in args.scales.split(',')]
+   results = []
+   for name in args.cases.split(','):
+      if name not in CASES: parser.error("{}: Unknown case, must be one of {}".format(name, ', '.join(CASES)))
+      for scale in scales:
+         if not args.all and CASES[name][1] and scale > CASES[name][1]: continue
+         res = run_case(name, scale, args.repeat)
+         results.append(res)
+         print("{:28} {:>7} {:10.4f}s {:>8} db calls".format(name, scale, res['median'], res['dbcalls']))
+   if args.output:
+      with open(args.output, 'w') as f:
+         json.dump({'commit' : git_commit(), 'python' : platform.python_version(),
+                    'time' : time.strftime("%Y-%m-%d %H:%M:%S"), 'results' : results}, f, indent = 1)
+   if args.baseline: compare_results(results, args.baseline)
+
+if __name__ == "__main__": main()
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+##################################################################################
+#     Title: sim_dsrqst
+#   Purpose: end-to-end load simulator replaying a recorded or synthetic request
+#            mix through submission, approval, partitioning, parallel builds and
+#            purges against the SQLite stand-in of RDADB, on a virtual clock
+#    Github: https://github.com/NCAR/rda-python-dsrqst.git
+#
+#     Usage: python benchmarks/sim_dsrqst.py [-t TRACE.jsonl | -n REQUESTS]
+#                   [-w WORKERS] [-p PTLIMIT] [-o REPORT.json] [options]
+##################################################################################
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import shutil
+import argparse
+import tempfile
+from os import path as op
+
+sys.path.insert(0, op.dirname(op.dirname(op.abspath(__file__))))
+sys.path.insert(0, op.join(op.dirname(op.dirname(op.abspath(__file__))), "src"))
+from rda_python_dsrqst.dsrqst import DsRqst
+from rda_python_dsrqst.pg_rdarqst import PgRDARqst
+from tests.rdadb_standin import RDADBStandIn
+
+SIMCMD = "simcmd"   # request command replaced by SimRqst.fake_command()
+
+class SimRDARqst(RDADBStandIn, PgRDARqst):
+   """PgRDARqst submitting requests into the SQLite stand-in."""
+
+   def __init__(self, workdir, db):
+      """Initialize SimRDARqst on a shared stand-in database."""
+      super().__init__()  # initialize parent class
+      self.init_standin(db)
+      self.PGLOG['BCKGRND'] = 1
+      self.PGLOG['LOGPATH'] = workdir
+
+class SimRqst(RDADBStandIn, DsRqst):
+   """DsRqst building and purging requests in the SQLite stand-in.
+
+   Request commands named SIMCMD are not run; fake_command() writes sparse
+   output files instead, scaled down by option --file-scale so checksumming
+   them stays cheap, and adds the modeled command latency to self.LATENCY.
+   The usage accounting of purged requests into the dssdb usage tables is
+   not simulated.
+   """
+
+   def __init__(self, workdir, db, args):
+      """Initialize SimRqst on a shared stand-in database with the simulation options."""
+      super().__init__()  # initialize parent class
+      self.init_standin(db)
+      self.ARGS = args
+      self.RAND = random.Random(args.seed)
+      self.LATENCY = 0
+      self.PGLOG['BCKGRND'] = 1
+      self.PGLOG['LOGPATH'] = self.PGLOG['RQSTHOME'] = workdir
+      self.PGOPT['CACT'] = 'BR'
+      self.params['LN'] = self.PGLOG['CURUID']
+      self.params['WH'] = workdir
+      self.params['NE'] = 1   # no email notice
+      self.params['FP'] = 1   # purge when the simulator says so
+      self.ETIME = self.PGSIG['ETIME']
+      self.PGSIG['ETIME'] = 0   # recheck sleeps are virtual, see add_phase_time()
+
+   def pgsystem(self, pgcmd, logact = None, cmdopt = 5, instr = None, seconds = 0):
+      """Run SIMCMD request commands in process, and others as usual."""
+      if isinstance(pgcmd, str) and pgcmd.startswith(SIMCMD + " "):
+         return self.fake_command(pgcmd.split()[1:])
+      return super().pgsystem(pgcmd, logact, cmdopt, instr, seconds)
+
+   def add_phase_time(self, phase, stime):
+      """Add a recheck sleep of a build to the virtual time instead of sleeping."""
+      if phase == 'sleep': self.LATENCY += self.ETIME
+      return super().add_phase_time(phase, stime)
+
+   def fill_request_metrics(self, ridx, pgpurge):
+      """Skip the order metrics of dssdb, counted as one database call."""
+      self.DBCALLS += 1
+
+   def fake_command(self, cargs):
+      """Write the files of a request or partition into the current directory.
+
+      Args:
+         cargs: Command arguments, request index, request directory and
+                optional partition index.
+
+      Returns:
+         Empty command output.
+      """
+      self.PGLOG['SYSERR'] = None
+      cnd = "pindex = {}".format(cargs[2]) if len(cargs) > 2 else "rindex = {}".format(cargs[0])
+      files = self.db.execute("SELECT wfile, size FROM wfrqst WHERE " + cnd).fetchall()
+      args = self.ARGS
+      size = sum(file[1] for file in files)
+      self.LATENCY += ((args.cmd_base + args.cmd_file*len(files) + size/(args.cmd_rate*1000000)) *
+                       self.RAND.lognormvariate(0, args.jitter))
+      if self.RAND.random() < args.error_rate:
+         self.PGLOG['SYSERR'] = "simulated command failure"
+         return ''
+      for (wfile, fsize) in files:
+         with open(wfile, 'wb') as f:
+            f.truncate(int(fsize*args.file_scale))   # sparse file, no disk blocks
+      return ''
+
+def synthetic_trace(args):
+   """Generate a synthetic request trace of Poisson arrivals.
+
+   Datasets and users are drawn with skewed weights, and file counts and
+   file sizes are log-normally distributed.
+
+   Returns:
+      List of trace records sorted by time.
+   """
+   rnd = random.Random(args.seed)
+   dsids = ["d{:06}".format(dnum) for dnum in range(633000, 633012)]
+   dweights = [1/(i + 1) for i in range(len(dsids))]
+   emails = ["user{}@example.edu".format(i) for i in range(300)]
+   eweights = [1/(i + 1)**0.8 for i in range(len(emails))]
+   trace = []
+   for i in range(args.requests):
+      fcount = max(1, min(5000, int(rnd.lognormvariate(3, 1.2))))
+      trace.append({'time' : round(rnd.uniform(0, args.duration), 1),
+                    'rtype' : 'T' if rnd.random() < 0.2 else 'S',
+                    'dsid' : rnd.choices(dsids, dweights)[0],
+                    'email' : rnd.choices(emails, eweights)[0],
+                    'fcount' : fcount,
+                    'size' : sum(int(rnd.lognormvariate(17.5, 1)) for j in range(fcount)),
+                    'rstat' : 'W' if rnd.random() < args.approve_ratio else 'Q'})
+   return sorted(trace, key = lambda rec: rec['time'])
+
+def read_trace(tfile):
+   """Read a trace of JSON lines, one request per line.
+
+   Each line has 'time' (seconds since the start of the trace), 'rtype',
+   'dsid', 'email', 'fcount', 'size' (total bytes) and optionally 'rstat'
+   ('W' to wait for approval). Records of a production day can be exported
+   from table dspurge.
+
+   Returns:
+      List of trace records sorted by time.
+   """
+   with open(tfile) as f:
+      trace = [json.loads(line) for line in f if line.strip()]
+   return sorted(trace, key = lambda rec: rec['time'])
+
+def percentiles(vals):
+   """Get the p50/p90/p99/max of a list of seconds by the nearest rank."""
+   if not vals: return None
+   vals = sorted(vals)
+   cnt = len(vals)
+   pcts = {}
+   for p in (50, 90, 99):
+      pcts['p{}'.format(p)] = round(vals[min(cnt - 1, int(cnt*p/100))], 1)
+   pcts['max'] = round(vals[-1], 1)
+   return pcts
+
+class LoadSimulator:
+   """Replay a request trace through dsrqst on a virtual clock.
+
+   Submissions go through PgRDARqst.rda_request(), builds through
+   DsRqst.build_requests() and process_partitions(), and purges through
+   DsRqst.purge_one_request(). Each build job runs for real, then occupies
+   one of the workers for its wall time plus the modeled command latency.
+   """
+
+   def __init__(self, args, trace):
+      """Initialize the simulator with the options and the request trace."""
+      self.args = args
+      self.trace = trace
+      self.events = []
+      self.seq = 0
+      self.now = 0
+      self.busy = 0
+      self.busytime = 0
+      self.disk = self.diskmax = self.diskmaxtime = 0
+      self.rinfo = {}    # rindex: submit, queue and start times, size
+      self.dbcalls = {'submit' : 0, 'schedule' : 0, 'build' : 0, 'purge' : 0}
+      self.counts = {'submitted' : 0, 'rejected' : 0, 'built' : 0, 'failed' : 0, 'purged' : 0, 'stalled' : 0, 'jobs' : 0}
+
+   def push(self, delay, kind, data):
+      """Schedule an event after delay seconds of virtual time."""
+      self.seq += 1
+      heapq.heappush(self.events, (self.now + delay, self.seq, kind, data))
+
+   def setup(self):
+      """Create the work directory, the stand-in database and its control records."""
+      self.workdir = tempfile.mkdtemp(prefix = "sim_dsrqst_")
+      self.rqst = SimRqst(self.workdir, None, self.args)
+      self.rda = SimRDARqst(self.workdir, self.rqst.db)
+      db = self.rqst.db
+      spec = self.rqst.params['LN']
+      db.execute("INSERT INTO dssgrp VALUES (?, 'Specialist', 'Sim')", (spec,))
+      for dsid in sorted(set(rec['dsid'] for rec in self.trace)):
+         db.execute("INSERT INTO dataset VALUES (?, ?)", (dsid, "Simulated dataset " + dsid))
+         db.execute("INSERT INTO rcrqst (dsid, rqsttype, specialist, command, ptlimit, ptflag, validperiod) " +
+                    "VALUES (?, 'S', ?, ?, ?, 'P', 5)", (dsid, spec, SIMCMD, self.args.ptlimit))
+      for email in sorted(set(rec['email'] for rec in self.trace)):
+         db.execute("INSERT INTO ruser (email, lname, fname, rdate) VALUES (?, ?, 'Sim', '2000-01-01')",
+                    (email, email.split('@')[0]))
+         db.execute("INSERT INTO wuser (email, lstname, fstname, start_date) VALUES (?, ?, 'Sim', '2000-01-01')",
+                    (email, email.split('@')[0]))
+
+   def submit(self, rec):
+      """Submit one trace request and register its files as the portal does."""
+      dbc = self.rda.DBCALLS
+      rqst = {'rtype' : rec['rtype'], 'dsid' : rec['dsid'], 'email' : rec['email'], 'fromflag' : 'W',
+              'location' : 'web', 'rstat' : rec.get('rstat', 'Q'), 'fcount' : rec['fcount'],
+              'size_request' : rec['size'], 'rinfo' : "dsnum={};simseq={}".format(rec['dsid'], self.seq)}
+      msg = self.rda.rda_request(rqst)
+      self.dbcalls['submit'] += self.rda.DBCALLS - dbc
+      if isinstance(msg, dict) and 'error' in msg or isinstance(msg, str) and "submitted successfully" not in msg:
+         self.counts['rejected'] += 1
+         return
+      self.counts['submitted'] += 1
+      ridx = self.rqst.db.execute("SELECT MAX(rindex) FROM dsrqst").fetchone()[0]
+      fcnt = rec['fcount']
+      fsize = rec['size']//fcnt
+      self.rqst.db.executemany("INSERT INTO wfrqst (rindex, wfile, ofile, size) VALUES (?, ?, ?, ?)",
+                               [(ridx, "sim{}.{:05}.nc".format(ridx, i), "sim{}.{:05}.nc".format(ridx, i), fsize)
+                                for i in range(fcnt)])
+      self.rinfo[ridx] = {'submit' : self.now, 'queue' : self.now, 'start' : None, 'size' : fsize*fcnt}
+      if rqst['rstat'] == 'W': self.push(self.args.approve_delay, 'approve', ridx)
+
+   def approve(self, ridx):
+      """Approve a request waiting for the specialist."""
+      self.rqst.db.execute("UPDATE dsrqst SET status = 'Q' WHERE rindex = ? AND status = 'W'", (ridx,))
+      self.rinfo[ridx]['queue'] = self.now
+
+   def next_job(self):
+      """Get the next job, queued partitions of started requests first.
+
+      Returns:
+         Tuple of job type 'R' or 'P' and the request or partition index, or None.
+      """
+      prec = self.rqst.db.execute("SELECT pindex FROM ptrqst WHERE status = 'Q' AND pid = 0 " +
+                                  "AND pindex NOT IN ({}) ORDER BY rindex, ptorder LIMIT 1".format(
+                                  ', '.join(str(pidx) for pidx in self.running) or '0')).fetchone()
+      if prec: return ('P', prec[0])
+      dbc = self.rqst.DBCALLS
+      pgrecs = self.rqst.get_queued_requests(self.rqst.PGLOG['HOSTNAME'], 1)
+      self.dbcalls['schedule'] += self.rqst.DBCALLS - dbc
+      if isinstance(pgrecs, dict):
+         for ridx in pgrecs['rindex']:
+            if ridx not in self.running and ridx not in self.stalled: return ('R', ridx)
+      return None
+
+   def dispatch(self):
+      """Start jobs on free workers, running each job for real right away."""
+      rqst = self.rqst
+      while self.busy < self.args.workers:
+         job = self.next_job()
+         if not job: break
+         (jtype, idx) = job
+         if jtype == 'R':
+            rinfo = self.rinfo[idx]
+            if rinfo['start'] is None: rinfo['start'] = self.now
+            rinfo['tries'] = rinfo.get('tries', 0) + 1
+            if rinfo['tries'] > 3:   # still queued after its builds, stop dispatching it
+               self.stalled.add(idx)
+               self.counts['stalled'] += 1
+               continue
+         self.running.add(idx)
+         self.busy += 1
+         self.counts['jobs'] += 1
+         rqst.LATENCY = 0
+         rqst.ALLCNT = 1
+         dbc = rqst.DBCALLS
+         stime = time.perf_counter()
+         if jtype == 'R':
+            rqst.params['RI'] = [idx]
+            rqst.build_requests()
+         else:
+            rqst.params['PI'] = [idx]
+            rqst.process_partitions()
+         secs = time.perf_counter() - stime + rqst.LATENCY
+         self.dbcalls['build'] += rqst.DBCALLS - dbc
+         os.chdir(self.workdir)
+         self.busytime += secs
+         self.push(secs, 'done', job)
+
+   def done(self, job):
+      """Free the worker of a finished job and account for a built request."""
+      (jtype, idx) = job
+      self.running.discard(idx)
+      self.busy -= 1
+      ridx = idx if jtype == 'R' else self.rqst.db.execute("SELECT rindex FROM ptrqst WHERE pindex = ?", (idx,)).fetchone()[0]
+      rinfo = self.rinfo[ridx]
+      if 'ready' in rinfo: return
+      rec = self.rqst.db.execute("SELECT status FROM dsrqst WHERE rindex = ?", (ridx,)).fetchone()
+      if rec[0] == 'O':
+         rinfo['ready'] = self.now
+         self.counts['built'] += 1
+         self.disk += rinfo['size']
+         if self.disk > self.diskmax: (self.diskmax, self.diskmaxtime) = (self.disk, self.now)
+         self.push(self.args.retention, 'purge', ridx)
+      elif rec[0] == 'E':
+         rinfo['ready'] = None
+         self.counts['failed'] += 1
+
+   def purge(self, ridx):
+      """Purge a built request at the end of its retention period."""
+      rqst = self.rqst
+      dbc = rqst.DBCALLS
+      if rqst.purge_one_request(ridx, rqst.curdate(), rqst.curtime(), 1):
+         self.counts['purged'] += 1
+         self.disk -= self.rinfo[ridx]['size']
+      self.dbcalls['purge'] += rqst.DBCALLS - dbc
+      os.chdir(self.workdir)
+
+   def run(self):
+      """Replay the trace until no event is left.
+
+      Returns:
+         Report dictionary.
+      """
+      cwd = os.getcwd()
+      self.setup()
+      self.running = set()
+      self.stalled = set()
+      stime = time.perf_counter()
+      try:
+         os.chdir(self.workdir)
+         for rec in self.trace:
+            self.push(rec['time'], 'submit', rec)
+         while self.events:
+            (self.now, seq, kind, data) = heapq.heappop(self.events)
+            getattr(self, kind)(data)
+            self.dispatch()
+      finally:
+         os.chdir(cwd)
+         shutil.rmtree(self.workdir, ignore_errors = True)
+      return self.report(time.perf_counter() - stime)
+
+   def report(self, wall):
+      """Summarize the queue waits, latencies, disk high-water mark and database calls."""
+      built = [rinfo for rinfo in self.rinfo.values() if rinfo.get('ready')]
+      submitted = self.counts['submitted'] or 1
+      return {
+         'counts' : self.counts,
+         'queue_wait' : percentiles([rinfo['start'] - rinfo['queue'] for rinfo in self.rinfo.values() if rinfo['start'] is not None]),
+         'build_latency' : percentiles([rinfo['ready'] - rinfo['submit'] for rinfo in built]),
+         'build_time' : percentiles([rinfo['ready'] - rinfo['start'] for rinfo in built]),
+         'disk_high_water' : {'bytes' : self.diskmax, 'time' : round(self.diskmaxtime, 1)},
+         'db_calls' : dict(self.dbcalls, total = sum(self.dbcalls.values()),
+                           per_request = round(sum(self.dbcalls.values())/submitted, 1)),
+         'virtual_seconds' : round(self.now, 1),
+         'worker_utilization' : round(self.busytime/(self.args.workers*self.now), 3) if self.now else 0,
+         'wall_seconds' : round(wall, 2)
+      }
+
+def print_report(rpt):
+   """Print a report in readable form."""
+   print("Requests: " + ', '.join("{} {}".format(val, key) for (key, val) in rpt['counts'].items()))
+   for key in ('queue_wait', 'build_latency', 'build_time'):
+      if rpt[key]: print("{:14} ".format(key) + ', '.join("{} {}s".format(p, val) for (p, val) in rpt[key].items()))
+   print("Disk high-water mark: {} bytes at {}s".format(rpt['disk_high_water']['bytes'], rpt['disk_high_water']['time']))
+   print("DB calls: " + ', '.join("{} {}".format(val, key) for (key, val) in rpt['db_calls'].items()))
+   print("Virtual time {}s, worker utilization {}, wall time {}s".format(rpt['virtual_seconds'], rpt['worker_utilization'], rpt['wall_seconds']))
+
+def main():
+   """Parse the command line, replay the trace and print or save the report."""
+   parser = argparse.ArgumentParser(description = "Replay a request mix through dsrqst on a virtual clock")
+   parser.add_argument('-t', '--trace', help = "JSON lines trace to replay, instead of a synthetic one")
+   parser.add_argument('-n', '--requests', type = int, default = 200, help = "synthetic requests")
+   parser.add_argument('-d', '--duration', type = float, default = 86400, help = "seconds of synthetic arrivals")
+   parser.add_argument('-s', '--seed', type = int, default = 1, help = "random seed")
+   parser.add_argument('-w', '--workers', type = int, default = 8, help = "parallel build jobs")
+   parser.add_argument('-p', '--ptlimit', type = int, default = 100, help = "partition file count limit, 0 for none")
+   parser.add_argument('--cmd-base', type = float, default = 30, help = "seconds of a command call")
+   parser.add_argument('--cmd-file', type = float, default = 2, help = "command seconds per output file")
+   parser.add_argument('--cmd-rate', type = float, default = 200, help = "command output MB per second")
+   parser.add_argument('--jitter', type = float, default = 0.3, help = "log-normal sigma of command latency")
+   parser.add_argument('--error-rate', type = float, default = 0.02, help = "fraction of failing commands")
+   parser.add_argument('--file-scale', type = float, default = 0.0001, help = "size factor of the files written")
+   parser.add_argument('--approve-ratio', type = float, default = 0.1, help = "fraction of synthetic requests waiting for approval")
+   parser.add_argument('--approve-delay', type = float, default = 3600, help = "seconds until a request is approved")
+   parser.add_argument('--retention', type = float, default = 43200, help = "seconds a built request stays online")
+   parser.add_argument('--save-trace', help = "JSON lines file to save the synthetic trace")
+   parser.add_argument('-o', '--output', help = "JSON file to save the report")
+   args = parser.parse_args()
+   if args.trace:
+      trace = read_trace(args.trace)
+   else:
+      trace = synthetic_trace(args)
+      if args.save_trace:
+         with open(args.save_trace, 'w') as f:
+            for rec in trace: f.write(json.dumps(rec) + "\n")
+   rpt = LoadSimulator(args, trace).run()
+   print_report(rpt)
+   if args.output:
+      with open(args.output, 'w') as f:
+         json.dump(dict(rpt, options = vars(args)), f, indent = 1)
+
+if __name__ == "__main__": main()
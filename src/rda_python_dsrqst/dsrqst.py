@@ -14,6 +14,8 @@ import os
 import re
 import glob
 import time
+import heapq
+import calendar
 from os import path as op
 from .pg_rqst import PgRqst
 
@@ -93,6 +95,8 @@ class DsRqst(PgRqst):
       elif self.PGOPT['CACT'] == 'SC':
          self.ALLCNT = len(self.params['CI'])
          self.set_request_control()
+      elif self.PGOPT['CACT'] == 'SE':
+         self.send_outbox()
       elif self.PGOPT['CACT'] == 'SF':
          if 'WF' in self.params:
             self.ALLCNT = len(self.params['WF'])
@@ -135,13 +139,17 @@ class DsRqst(PgRqst):
          self.ALLCNT = len(self.params['PI'])
          self.process_partitions()
       elif self.PGOPT['CACT'] == 'PR':
-         self.ALLCNT = len(self.params['RI'])
-         self.purge_requests()
+         if 'RI' in self.params:
+            self.ALLCNT = len(self.params['RI'])
+            self.purge_requests()
+         else:
+            self.purge_daemon()
       if self.PGLOG['DSCHECK']:
          if self.ERRMSG:
             self.record_dscheck_error(self.ERRMSG)
          else:
             self.record_dscheck_status("D")
+      self.save_metrics()
       if self.OPTS[self.PGOPT['CACT']][2]: self.cmdlog()   # log end time if not getting action
 
    def clean_request_info(self):
@@ -227,7 +235,7 @@ class DsRqst(PgRqst):
 
       Args:
          ridx: Request index.
-         dcnt: List of 3 counters [db_records, db_deleted, disk_deleted].
+         dcnt: List of 4 counters [db_records, db_deleted, disk_deleted, disk_bytes].
          cleanusage: If nonzero, also clean usage records.
 
       Returns:
@@ -240,19 +248,17 @@ class DsRqst(PgRqst):
       if pgrqst['rqstid'] and not pgrqst['location']:  # clean the request directory
          dpath = self.get_file_path(None, pgrqst['rqstid'], None, 1)
          if dpath != self.params['WH'] and op.isdir(dpath):
-            if shared:
-               cnt = 0
+            hcnt = 1 if op.isfile(dpath + "/index.html") else 0
+            (cnt, size) = self.delete_local_paths(dpath, self.PGOPT['wrnlog'])
+            if shared or cnt < hcnt:
+               cnt = 0    # data files of shared requests are under data/dsid
             else:
-               files = glob.glob(dpath + "/*")
-               cnt = len(files)
-               if cnt > 0:
-                  file = dpath + "/index.html"
-                  if file in files: cnt -= 1
-            self.pgsystem("rm -rf " + dpath, self.PGOPT['extlog'], 5)
+               cnt -= hcnt
             if cnt > 0:
                s = 's' if cnt > 1 else ''
-               self.pglog("Directory {} and {} file{} under it are removed".format(dpath, cnt, s), self.LOGWRN)
+               self.pglog("Directory {} and {} file{} ({} bytes) under it are removed".format(dpath, cnt, s, size), self.LOGWRN)
                dcnt[2] += cnt
+               dcnt[3] += size
             else:
                self.pglog("Directory {} is removed".format(dpath), self.LOGWRN)
       if shared:
@@ -262,8 +268,9 @@ class DsRqst(PgRqst):
             s = 's' if cnt > 1 else ''
             self.pglog("Delete {} associated file{} for Request Index {} ...".format(cnt, s, ridx), self.WARNLG)
             dpath = "data/" + pgrqst['dsid']
+            refs = self.get_shared_file_refs(pgrqst)
             for j in range(cnt):
-               self.delete_one_file(pgrqst, pgrecs['wfile'][j], pgrecs['ofile'][j], dpath, 1, dcnt)
+               self.delete_one_file(pgrqst, pgrecs['wfile'][j], pgrecs['ofile'][j], dpath, 1, dcnt, refs)
       else:
          cnt = self.pgdel("wfrqst", cnd, self.PGOPT['extlog'])
          if cnt > 0:
@@ -291,7 +298,7 @@ class DsRqst(PgRqst):
       self.pglog("Delete {} request{} ...".format(self.ALLCNT, s), self.WARNLG)
       self.check_local_writable(self.params['WH'], "Delete Request", self.PGOPT['extlog'])
       self.validate_multiple_options(self.ALLCNT, ["DS"])
-      dcnt = [0]*3
+      dcnt = [0]*4
       delcnt = 0
       for i in range(self.ALLCNT):
          ridx = self.lock_request(self.params['RI'][i], 1, self.PGOPT['extlog'])
@@ -300,7 +307,7 @@ class DsRqst(PgRqst):
       self.pglog("{} of {} request{} deleted".format(delcnt, self.ALLCNT, s), self.PGOPT['wrnlog'])
       if dcnt[0] > 0:
          s = 's' if dcnt[0] > 1 else ''
-         self.pglog("{}/{} of {} request file{} deleted from RDADB/Disk".format(dcnt[1], dcnt[2], dcnt[0], s), self.PGOPT['wrnlog'])
+         self.pglog("{}/{} of {} request file{} deleted from RDADB/Disk, {} bytes freed".format(dcnt[1], dcnt[2], dcnt[0], s, dcnt[3]), self.PGOPT['wrnlog'])
 
    def delete_request_control(self):
       """Delete request controls for given request control indices."""
@@ -310,6 +317,7 @@ class DsRqst(PgRqst):
       for i in range(self.ALLCNT):
          cnd = "cindex = {}".format(self.params['CI'][i])
          delcnt += self.pgdel("rcrqst", cnd, self.PGOPT['extlog'])
+      if delcnt: self.clear_control_cache()
       self.pglog("{} of {} request control{} deleted".format(delcnt, self.ALLCNT, s), self.PGOPT['wrnlog'])
 
    def delete_web_files(self):
@@ -318,7 +326,7 @@ class DsRqst(PgRqst):
       self.pglog("Delete {} request file{} ...".format(self.ALLCNT, s), self.WARNLG)
       self.validate_multiple_options(self.ALLCNT, ["RI"])
       ridx = 0
-      dcnt = [0]*3
+      dcnt = [0]*4
       for i in range(self.ALLCNT):
          if ridx != self.params['RI'][i]:
             ridx = self.lock_request(self.params['RI'][i], 1, self.PGOPT['extlog'])
@@ -333,7 +341,7 @@ class DsRqst(PgRqst):
          if i > (self.ALLCNT - 2) or  ridx != self.params['RI'][i+1]:
             self.set_request_count(cnd, pgrec)
             self.lock_request(ridx, 0, self.PGOPT['extlog'])   # unlock requests
-      self.pglog("{}/{} of {} request file{} deleted from RDADB/Disk".format(dcnt[1], dcnt[2], self.ALLCNT, s), self.PGOPT['wrnlog'])
+      self.pglog("{}/{} of {} request file{} deleted from RDADB/Disk, {} bytes freed".format(dcnt[1], dcnt[2], self.ALLCNT, s, dcnt[3]), self.PGOPT['wrnlog'])
 
    def delete_source_files(self):
       """Delete source files for given request control indices."""
@@ -351,7 +359,7 @@ class DsRqst(PgRqst):
          dcnt += self.pgdel("sfrqst", "{} AND wfile = '{}'".format(cnd, self.params['WF'][i]), self.PGOPT['extlog'])
       self.pglog("{} of {} source file{} deleted from RDADB".format(dcnt, self.ALLCNT, s), self.PGOPT['wrnlog'])
 
-   def delete_one_file(self, pgrqst, wfile, ofile, dpath, shared, cnts):
+   def delete_one_file(self, pgrqst, wfile, ofile, dpath, shared, cnts, refs = None):
       """Remove file record from RDADB and delete file physically on disk if needed.
 
       Args:
@@ -360,67 +368,124 @@ class DsRqst(PgRqst):
          ofile: Original file name, or None.
          dpath: Data path for the file.
          shared: Whether the file is shared across requests.
-         cnts: List of 3 counters [total, db_deleted, disk_deleted].
+         cnts: List of 4 counters [total, db_deleted, disk_deleted, disk_bytes].
+         refs: Shared file references from get_shared_file_refs() for the whole
+               request; gathered for this file only if None.
       """
       ridx = pgrqst['rindex']
       cnd = "rindex = {}".format(ridx)
       cnts[0] += 1
       cnts[1] += self.pgdel("wfrqst", "{} AND wfile = '{}'".format(cnd, wfile), self.PGOPT['extlog'])
+      if shared and refs is None: refs = self.get_shared_file_refs(pgrqst, wfile, ofile)
       file = self.get_file_path(wfile, dpath, None, 1)
       info = self.check_local_file(file, 1, self.PGOPT['wrnlog'])
       if info:
          retain = 0
-         if shared:
-            pgrecs = self.pgmget("wfrqst", "*", "wfile = '{}'".format(wfile), self.PGOPT['extlog'])
-            cnt = len(pgrecs['rindex']) if pgrecs else 0
-            for i in range(cnt):
-               pgrec = self.onerecord(pgrecs, i)
-               rcnd = "rindex = {}".format(pgrec['rindex'])
-               if not self.pgget("dsrqst", "", "{} AND dsid = '{}'".format(cnd, pgrqst['dsid']), self.PGOPT['extlog']): continue
-               if pgrec['status'] == "O":
-                  retain += 1
-                  continue
-               else:
-                  record = {'status' : 'O', 'size' : pgrec['size'], 'date' : pgrec['date'], 'time' : pgrec['time']}
-                  retain += self.pgupdt("wfrqst", record, "{} AND wfile = '{}'".format(cnd, wfile), self.PGOPT['extlog'])
-         if not retain and self.pgsystem("rm -f " + file):
-            self.pglog(file + ": deleted", self.PGOPT['wrnlog'])
-            cnts[2] += 1
+         if shared and wfile in refs['wfile']:
+            (retain, ncnt) = refs['wfile'][wfile]
+            if ncnt > 0:   # file is kept online for the other requests sharing it
+               self.pgupdt("wfrqst", {'status' : 'O'}, "wfile = '{}' AND status <> 'O' AND ".format(wfile) +
+                           "rindex IN (SELECT rindex FROM dsrqst WHERE dsid = '{}')".format(pgrqst['dsid']), self.PGOPT['extlog'])
+         if not retain:
+            (cnt, size) = self.delete_local_paths(file, self.PGOPT['wrnlog'])
+            if cnt > 0:
+               self.pglog(file + ": deleted", self.PGOPT['wrnlog'])
+               cnts[2] += cnt
+               cnts[3] += size
       if ofile and ofile != wfile:
          file = self.get_file_path(ofile, dpath, None, 1)
          info = self.check_local_file(file, 1, self.PGOPT['wrnlog'])
          if info:
-            if not (shared and self.pgget("wfrqst, dsrqst", "", "wfrqst.rindex = dsrqst.rindex AND ofile = '{}' AND dsid = '{}'".format(ofile, pgrqst['dsid']))):
-               if self.pgsystem("rm -f " + ofile):
-                  self.pglog(ofile + ": deleted", self.PGOPT['wrnlog'])
-                  cnts[2] += 1
+            if not (shared and ofile in refs['ofile']):
+               (cnt, size) = self.delete_local_paths(file, self.PGOPT['wrnlog'])
+               if cnt > 0:
+                  self.pglog(file + ": deleted", self.PGOPT['wrnlog'])
+                  cnts[2] += cnt
+                  cnts[3] += size
+
+   def get_shared_file_refs(self, pgrqst, wfile = None, ofile = None):
+      """Count the references to shared files by the requests of the same dataset.
+
+      Without file names, the references to all files of the request are counted
+      by the other requests with one grouped query per file type; this is done
+      before the request's file records are deleted. With file names, all
+      references to the given files are counted; this is done after the file
+      record is deleted from the request.
+
+      Args:
+         pgrqst: Request record dictionary.
+         wfile: Web file name, or None for all files of the request.
+         ofile: Original file name, or None.
+
+      Returns:
+         Dictionary with key 'wfile' for web file names mapped to [reference count,
+         count of references not in status 'O'], and key 'ofile' for original file
+         names mapped to reference counts; unreferenced files are not included.
+      """
+      ridx = pgrqst['rindex']
+      refs = {'wfile' : {}, 'ofile' : {}}
+      for fld in refs:
+         fname = wfile if fld == 'wfile' else ofile
+         if fname:
+            fcnd = "w.{} = '{}'".format(fld, fname)
+         elif wfile:
+            continue
+         else:
+            fcnd = "w.rindex <> {0} AND w.{1} IN (SELECT {1} FROM wfrqst WHERE rindex = {0})".format(ridx, fld)
+         fields = "w.{} fname, count(*) rcnt, sum(CASE WHEN w.status = 'O' THEN 0 ELSE 1 END) ncnt".format(fld)
+         pgrecs = self.pgmget("wfrqst w, dsrqst d", fields, "w.rindex = d.rindex AND d.dsid = '{}' AND {} GROUP BY w.{}".format(pgrqst['dsid'], fcnd, fld), self.PGOPT['extlog'])
+         cnt = len(pgrecs['fname']) if pgrecs else 0
+         for i in range(cnt):
+            if fld == 'wfile':
+               refs[fld][pgrecs['fname'][i]] = [pgrecs['rcnt'][i], pgrecs['ncnt'][i]]
+            else:
+               refs[fld][pgrecs['fname'][i]] = pgrecs['rcnt'][i]
+      return refs
+
+   def set_request_columns(self, pgrecs):
+      """Fill computed request columns: detailed status strings for -CS and phase times for -PT."""
+      if 'CS' in self.params: pgrecs['status'] = self.get_request_status(pgrecs)
+      if 'PT' in self.params: self.set_phase_times(pgrecs)
+
+   def set_partition_columns(self, pgrecs):
+      """Fill computed partition columns: detailed status strings for -CS and phase times for -PT."""
+      if 'CS' in self.params: pgrecs['status'] = self.get_partition_status(pgrecs)
+      if 'PT' in self.params: self.set_phase_times(pgrecs)
+
+   def set_source_files(self, pgrecs):
+      """Replace source file ids in request file records with file names."""
+      if 'srcid' in pgrecs:
+         dsids = self.get_request_dsids(pgrecs['rindex'])
+         pgrecs['srcid'] = self.fid2fname(pgrecs['srcid'], dsids, pgrecs['srctype'])
 
    def get_request_info(self):
       """Get and display request information from RDADB."""
       tname = "dsrqst"
       hash = self.TBLHASH[tname]
       self.pglog("Get request information from RDADB ...", self.WARNLG)
-      lens = oflds = fnames = None
+      oflds = fnames = None
       if 'FN' in self.params: fnames = self.params['FN']
       fnames = self.fieldname_string(fnames, self.PGOPT[tname], self.PGOPT['dsall'])
       if 'CS' in self.params:
           if 'A' not in fnames: fnames += "A"
           if 'R' not in fnames: fnames = "R" + fnames
+      if 'PT' in self.params:
+         hash = self.phase_time_hash(hash)
+         fnames += "#"
       onames = self.params['ON'] if 'ON' in self.params else "R"
       condition = self.get_hash_condition(tname, None, None, 1)
       if 'ON' in self.params and 'OB' in self.params:
          oflds = onames
       else:
          condition += self.get_order_string(onames, tname)
-      pgrecs = self.pgmget(tname, "*", condition, self.PGOPT['extlog'])
       if self.PGOPT['CACT'] == "GB": self.OUTPUT.write("[DSRQST]\n")
-      if pgrecs:
-          if 'CS' in self.params: pgrecs['status'] = self.get_request_status(pgrecs)
-          if 'FO' in self.params: lens = self.all_column_widths(pgrecs, fnames, hash)
-          if oflds: pgrecs = self.sorthash(pgrecs, oflds, hash, self.params['OB'])
-      self.OUTPUT.write(self.get_string_titles(fnames, hash, lens) + "\n")
-      if pgrecs:
-         cnt = self.print_column_format(pgrecs, fnames, hash, lens)
+      pagefunc = self.set_request_columns if ('CS' in self.params or 'PT' in self.params) else None
+      if oflds:
+         pgrecs = self.pgmget(tname, "*", condition, self.PGOPT['extlog'])
+         cnt = self.print_sorted_records(pgrecs, fnames, hash, oflds, pagefunc)
+      else:
+         cnt = self.stream_column_format(tname, "*", condition, fnames, hash, pagefunc)
+      if cnt > 0:
          s = "s" if cnt > 1 else ""
          self.pglog("{} request{} retrieved".format(cnt, s), self.PGOPT['wrnlog'])
       else:
@@ -431,7 +496,7 @@ class DsRqst(PgRqst):
       tname = "rcrqst"
       hash = self.TBLHASH[tname]
       self.pglog("Get request control information from RDADB ...", self.WARNLG)
-      lens = oflds = fnames = None
+      oflds = fnames = None
       if 'FN' in self.params: fnames = self.params['FN']
       fnames = self.fieldname_string(fnames, self.PGOPT[tname], self.PGOPT['rcall'])
       onames = self.params['ON'] if 'ON' in self.params else "BIT"
@@ -440,13 +505,12 @@ class DsRqst(PgRqst):
          oflds = onames
       else:
          condition += self.get_order_string(onames, tname)
-      pgrecs = self.pgmget(tname, "*", condition, self.PGOPT['extlog'])
-      if pgrecs:
-          if 'FO' in self.params: lens = self.all_column_widths(pgrecs,fnames, hash)
-          if oflds: pgrecs = self.sorthash(pgrecs, oflds, hash, self.params['OB'])
-      self.OUTPUT.write(self.get_string_titles(fnames, hash, lens) + "\n")
-      if pgrecs:
-         cnt = self.print_column_format(pgrecs, fnames, hash, lens)
+      if oflds:
+         pgrecs = self.pgmget(tname, "*", condition, self.PGOPT['extlog'])
+         cnt = self.print_sorted_records(pgrecs, fnames, hash, oflds)
+      else:
+         cnt = self.stream_column_format(tname, "*", condition, fnames, hash)
+      if cnt > 0:
          s = 's' if cnt > 1 else ''
          self.pglog("{} request control{} retrieved".format(cnt, s), self.PGOPT['wrnlog'])
       else:
@@ -457,26 +521,28 @@ class DsRqst(PgRqst):
       tname = "ptrqst"
       hash = self.TBLHASH[tname]
       self.pglog("Get request partition information from RDADB ...", self.WARNLG)
-      lens = oflds = fnames = None
+      oflds = fnames = None
       if 'FN' in self.params: fnames = self.params['FN']
       fnames = self.fieldname_string(fnames, self.PGOPT[tname], self.PGOPT['ptall'])
       if 'CS' in self.params:
           if 'A' not in fnames: fnames += "A"
           if 'P' not in fnames: fnames = "P" + fnames
+      if 'PT' in self.params:
+         hash = self.phase_time_hash(hash)
+         fnames += "#"
       onames = self.params['ON'] if 'ON' in self.params else "P"
       condition = self.get_hash_condition(tname, None, None, 1)
       if 'ON' in self.params and 'OB' in self.params:
          oflds = self.append_order_fields(onames, None, tname)
       else:
          condition += self.get_order_string(onames, tname)
-      pgrecs = self.pgmget(tname, "*", condition, self.PGOPT['extlog'])
-      if pgrecs:
-          if 'CS' in self.params: pgrecs['status'] = self.get_partition_status(pgrecs)
-          if 'FO' in self.params: lens = self.all_column_widths(pgrecs, fnames, hash)
-          if oflds: pgrecs = self.sorthash(pgrecs, oflds, hash, self.params['OB'])
-      self.OUTPUT.write(self.get_string_titles(fnames, hash, lens) + "\n")
-      if pgrecs:
-         cnt = self.print_column_format(pgrecs, fnames, hash, lens)
+      pagefunc = self.set_partition_columns if ('CS' in self.params or 'PT' in self.params) else None
+      if oflds:
+         pgrecs = self.pgmget(tname, "*", condition, self.PGOPT['extlog'])
+         cnt = self.print_sorted_records(pgrecs, fnames, hash, oflds, pagefunc)
+      else:
+         cnt = self.stream_column_format(tname, "*", condition, fnames, hash, pagefunc)
+      if cnt > 0:
          s = 's' if cnt > 1 else ''
          self.pglog("{} request partition{} retrieved".format(cnt, s), self.PGOPT['wrnlog'])
       else:
@@ -489,7 +555,7 @@ class DsRqst(PgRqst):
       hash = self.TBLHASH[tname]
       self.pglog("Get request file information from RDADB ...", self.WARNLG)
       dojoin = 0
-      lens = oflds = fnames = None
+      oflds = fnames = None
       if 'FN' in self.params: fnames = self.params['FN']
       fnames = self.fieldname_string(fnames, self.PGOPT[tname], self.PGOPT['wfall'])
       if 'WD' in self.params:
@@ -505,17 +571,15 @@ class DsRqst(PgRqst):
          oflds = self.append_order_fields(onames, None, tname)
       else:
          condition += self.get_order_string(onames, tname)
-      pgrecs = self.pgmget(tables if dojoin else tname, self.get_string_fields(qnames, tname), condition, self.PGOPT['extlog'])
+      tables = tables if dojoin else tname
+      fields = self.get_string_fields(qnames, tname)
       if self.PGOPT['CACT'] == "GB": self.OUTPUT.write("[{}]\n".format(tname.upper()))
-      if pgrecs:
-         if 'srcid' in pgrecs:
-            dsids = self.get_request_dsids(pgrecs['rindex'])
-            pgrecs['srcid'] = self.fid2fname(pgrecs['srcid'], dsids, pgrecs['srctype'])
-         if 'FO' in self.params: lens = self.all_column_widths(pgrecs, fnames, hash)
-         if oflds: pgrecs = self.sorthash(pgrecs, oflds, hash, self.params['OB'])
-      self.OUTPUT.write(self.get_string_titles(fnames, hash, lens) + "\n")
-      if pgrecs:
-         cnt = self.print_column_format(pgrecs, fnames, hash, lens)
+      if oflds:
+         pgrecs = self.pgmget(tables, fields, condition, self.PGOPT['extlog'])
+         cnt = self.print_sorted_records(pgrecs, fnames, hash, oflds, self.set_source_files)
+      else:
+         cnt = self.stream_column_format(tables, fields, condition, fnames, hash, self.set_source_files)
+      if cnt > 0:
          s = "s" if cnt > 1 else ""
          self.pglog("{} request file record{} retrieved".format(cnt, s), self.PGOPT['wrnlog'])
       else:
@@ -528,7 +592,7 @@ class DsRqst(PgRqst):
       hash = self.TBLHASH[tname]
       self.pglog("Get tar file information from RDADB ...", self.WARNLG)
       dojoin = 0
-      lens = oflds = fnames = None
+      oflds = fnames = None
       if 'FN' in self.params: fnames = self.params['FN']
       fnames = self.fieldname_string(fnames, self.PGOPT[tname], self.PGOPT['tfall'])
       if 'WD' in self.params:
@@ -543,13 +607,14 @@ class DsRqst(PgRqst):
          oflds = self.append_order_fields(onames, None, tname)
       else:
          condition += self.get_order_string(onames, tname)
-      pgrecs = self.pgmget(tables if dojoin else tname, self.get_string_fields(qnames, tname), condition, self.PGOPT['extlog'])
-      if pgrecs:
-         if 'FO' in self.params: lens = self.all_column_widths(pgrecs, fnames, hash)
-         if oflds: pgrecs = self.sorthash(pgrecs, oflds, hash, self.params['OB'])
-      self.OUTPUT.write(self.get_string_titles(fnames, hash, lens) + "\n")
-      if pgrecs:
-         cnt = self.print_column_format(pgrecs, fnames, hash, lens)
+      tables = tables if dojoin else tname
+      fields = self.get_string_fields(qnames, tname)
+      if oflds:
+         pgrecs = self.pgmget(tables, fields, condition, self.PGOPT['extlog'])
+         cnt = self.print_sorted_records(pgrecs, fnames, hash, oflds)
+      else:
+         cnt = self.stream_column_format(tables, fields, condition, fnames, hash)
+      if cnt > 0:
          s = "s" if cnt > 1 else ""
          self.pglog("{} tar file record{} retrieved".format(cnt, s), self.PGOPT['wrnlog'])
       else:
@@ -624,6 +689,9 @@ class DsRqst(PgRqst):
                   if pgrec['status'] == 'E':
                      if pgrec['ptcount'] > 1: pcnt = self.pgexec("UPDATE ptrqst SET status = 'Q' WHERE {} AND status = 'E'".format(cnd), self.PGOPT['extlog'])
                      record['ecount'] = 0
+               if ('rinfo' in record or 'dsid' in record or 'gindex' in record or 'rqsttype' in record) and self.has_request_fingerprint():
+                  rhash = self.request_fingerprint(dict(pgrec, **record))
+                  if rhash != pgrec['rhash']: record['rhash'] = rhash
                modcnt += self.pgupdt(tname, record, cnd, self.PGOPT['extlog']|self.DODFLT)
                if pcnt: self.pglog("RQST{}: SET {} Partition Status E to Q".format(ridx, pcnt), self.PGOPT['wrnlog'])
             else:
@@ -632,18 +700,16 @@ class DsRqst(PgRqst):
                elif 'MD' not in self.params and record['specialist'] != self.params['LN'] and self.params['LN'] != self.PGLOG['GDEXUSER']:
                   self.action_error("Must be '{}' to add request record".format(record['specialist']))
                if 'rqsttype' not in record: record['rqsttype'] = "C"  # default to customized request type
-               nidx = self.new_request_id()
+               if 'rinfo' in record and self.has_request_fingerprint(): record['rhash'] = self.request_fingerprint(record)
                lname = self.convert_chars(unames['lstname'], 'RQST')
-               record['rqstid'] = "{}{}".format(lname.upper(), nidx)   # auto set request ID
                record['fromflag'] = 'M'
                if 'date_rqst' not in record: record['date_rqst'] = self.curdate()
                if 'time_rqst' not in record: record['time_rqst'] = self.curtime()
-               ridx = self.pgadd(tname, record, self.PGOPT['extlog']|self.AUTOID|self.DODFLT)
+               ridx = self.add_request_with_id(record, lname.upper(), self.PGOPT['extlog']|self.DODFLT)   # auto set request ID
                if ridx > 0:
                   cnd = "rindex = {}".format(ridx)
                   record = {}
                   pgrec = self.pgget(tname, "*", cnd, self.PGOPT['extlog'])
-                  if ridx != nidx: record['rqstid'] = "{}{}".format(lname.upper(), ridx)   # auto reset request ID
                   if self.cache_request_control(ridx, pgrec, self.PGOPT['CACT'], 0):
                      if (self.PGOPT['RCNTL']['ptlimit'] or self.PGOPT['RCNTL']['ptsize']):
                         record['ptcount'] = 0
@@ -662,18 +728,6 @@ class DsRqst(PgRqst):
             self.lock_request(ridx, 0, self.PGOPT['extlog'])
       self.pglog("{}/{} of {} request{} added/modified in RDADB!".format(addcnt, modcnt, self.ALLCNT, s), self.PGOPT['wrnlog'])
 
-   def new_request_id(self):
-      """Find a unique request ID by returning (existing maximum rindex + 1).
-
-      Returns:
-         Next available request index integer, or 0 if no requests exist.
-      """
-      pgrec = self.pgget("dsrqst", "MAX(rindex) maxid", '', self.LOGERR)
-      if pgrec:
-         return (pgrec['maxid'] + 1)
-      else:
-         return 0
-
    def set_request_partitions(self):
       """Modify request partition information in RDADB."""
       tname = "ptrqst"
@@ -766,6 +820,7 @@ class DsRqst(PgRqst):
                if rtype not in pcnts[dsid]:
                   pcnts[dsid][rtype] = self.pgget(tname, "", "dsid = '{}' AND rqsttype = '{}'".format(dsid, rtype))
                   if pcnts[dsid][rtype] == 1: dsids[dsid] = 1
+      if addcnt or modcnt: self.clear_control_cache()
       self.pglog("{}/{} of {} request control{} added/modified in RDADB!".format(addcnt, modcnt, self.ALLCNT, s), self.PGOPT['wrnlog'])
 
    def set_tar_files(self, rindex):
@@ -1047,6 +1102,7 @@ class DsRqst(PgRqst):
          errmsg: Error message string.
       """
       self.lock_request(ridx, 0, self.PGOPT['extlog'])
+      self.add_metric('dsrqst_errors_total', 1, 'type="request"')
       return self.pglog(errmsg, self.PGOPT['errlog'])
 
    def partition_error(self, pidx, errmsg):
@@ -1057,6 +1113,7 @@ class DsRqst(PgRqst):
          errmsg: Error message string.
       """
       self.lock_partition(pidx, 0, self.PGOPT['extlog'])
+      self.add_metric('dsrqst_errors_total', 1, 'type="partition"')
       return self.pglog(errmsg, self.PGOPT['errlog'])
 
    def add_one_request_partitions(self, ridx, cnd, pgrqst, ptcmp = 0):
@@ -1106,6 +1163,7 @@ class DsRqst(PgRqst):
       elif pcnt == 1:
          self.pgexec("UPDATE dsrqst set ptcount = 0 WHERE " + cnd, self.PGOPT['extlog'])
          self.pgdel("ptrqst", cnd, self.PGOPT['extlog'])
+      if ptcmp < 1: self.reset_request_pcount(ridx, cnd, pgrqst)   # counted again by the new partitions
       syserr = ''
       if cmd:
          self.create_request_directory(pgrqst)   # create directory before set partitions 
@@ -1374,6 +1432,7 @@ class DsRqst(PgRqst):
       rstat = pgrqst['status']
       rtype = pgrqst['rqsttype']
       rstr = "RQST{}-{}".format(ridx, pgrqst['dsid'])
+      self.TRACEIDS = [ridx, 0]
       if pgrqst['specialist'] != self.params['LN']:
          return self.request_error(ridx, "{}: Must be '{}' to build {}".format(self.params['LN'], pgrqst['specialist'], rstr))
       if rstat != 'Q':
@@ -1395,6 +1454,10 @@ class DsRqst(PgRqst):
          return self.pglog("Set Partitions for partition-controlled request: dsrqst SP -NP -RI {}".format(ridx), self.PGOPT['errlog'])
       if pgrqst['ptcount'] < 2 or 'BF'.find(pgcntl['ptflag']) > -1:
          etime = time.time()
+         self.PHASES = {}
+         if pgrqst['ptcount'] < 2: self.reset_request_pcount(ridx, cnd, pgrqst)
+         if pgrqst['date_rqst']:
+            self.observe_metric('dsrqst_queue_wait_seconds', etime - self.datetime_epoch(pgrqst['date_rqst'], pgrqst['time_rqst']))
          cmd = pgcntl['command']
          if not (fcount or cmd or rtype == "C" and 'LF' in self.params):  # should not happen normally
             record = {'status' : 'E', 'pid' : 0}
@@ -1410,12 +1473,17 @@ class DsRqst(PgRqst):
             if 'pgrqst' in cret: pgrqst = cret['pgrqst']
             if 'errmsg' in cret:
                rstat = 'E'
+               self.add_metric('dsrqst_errors_total', 1, 'type="command"')
                if cret['errmsg']: errmsg += cret['errmsg'] + "\n"
             elif self.CMPCNT > 0:
                self.CMPCNT = 0
                rstat = 'Q'
                fcount = pgrqst['fcount']
-         etime = int(time.time() - etime)
+         etime = time.time() - etime
+         self.observe_metric('dsrqst_build_seconds', etime, 'action="BR"')
+         if pgrqst['ptcount'] < 2: self.add_staged_metrics('rindex', ridx)
+         self.save_phase_times("dsrqst", cnd, pgrqst)
+         etime = int(etime)
       else:
          etime = 0
       cdate = self.curdate()
@@ -1462,6 +1530,7 @@ class DsRqst(PgRqst):
             rstr += " processed with No data by " + self.PGLOG['CURUID']
             if self.PGLOG['CURUID'] != self.params['LN']: rstr += " for " + self.params['LN']
          self.pglog("{} at {}".format(rstr, self.curtime(1)), self.PGOPT['wrnlog']|self.FRCLOG)
+         self.add_metric('dsrqst_builds_total', 1, 'action="BR"')
          return 1
       else:
          return 0
@@ -1484,6 +1553,7 @@ class DsRqst(PgRqst):
       rtype = pgrqst['rqsttype']
       rstr = "RPT{}-RQST{}-{}".format(pidx, ridx, pgpart['dsid'])
       rcnd = "rindex = {}".format(ridx)
+      self.TRACEIDS = [ridx, pidx]
       if pgpart['specialist'] != self.params['LN']:
          return self.partition_error(pidx, "{}: Must be '{}' to process {}".format(self.params['LN'], pgrqst['specialist'], rstr))
       if rstat != 'Q':
@@ -1493,6 +1563,7 @@ class DsRqst(PgRqst):
          else:
             return self.partition_error(pidx, "{}: Status '{}', must be 'Q' to process".format(rstr, rstat))
       etime = time.time()
+      self.PHASES = {}
       pgcntl = self.PGOPT['RCNTL']
       cmd = pgcntl['command']
       fcount = pgpart['fcount']
@@ -1510,8 +1581,13 @@ class DsRqst(PgRqst):
          if 'pgpart' in cret: pgpart = cret['pgpart']
          if 'errmsg' in cret:
             rstat = 'E'
+            self.add_metric('dsrqst_errors_total', 1, 'type="command"')
             if cret['errmsg']: errmsg += cret['errmsg'] + "\n"
-      etime = int(time.time() - etime)
+      etime = time.time() - etime
+      self.observe_metric('dsrqst_build_seconds', etime, 'action="PP"')
+      self.add_staged_metrics('pindex', pidx)
+      self.save_phase_times("ptrqst", cnd, pgpart)
+      etime = int(etime)
       if self.pgget("ptrqst", "", cnd + " AND status = 'I'"):
          rstat = 'I'
          errmsg = rstr + ": is interrupted during process\n"
@@ -1532,6 +1608,7 @@ class DsRqst(PgRqst):
             rstr += " built Successfully by {}".format(self.PGLOG['CURUID'])
             if self.PGLOG['CURUID'] != self.params['LN']: rstr += " for {}".format(self.params['LN'])
             self.pglog("{} at {}".format(rstr, self.curtime(1)), self.PGOPT['wrnlog']|self.FRCLOG)
+            self.add_metric('dsrqst_builds_total', 1, 'action="PP"')
             ret = 1
          ecnt = 0
          qcnt = self.pgget('ptrqst', '', rcnd + " AND status = 'Q'", self.PGOPT['extlog'])
@@ -1594,7 +1671,9 @@ class DsRqst(PgRqst):
             fstat = 'O'
             pgrec = self.onerecord(pgfiles, i)
             wfile = pgrec['wfile']
+            ptime = time.time()
             pstat = self.check_processed(wfile, pgrec, pgrqst['dsid'], ridx, rstr)
+            self.add_phase_time('check', ptime)
             if pstat > 0:
                self.pglog("{}-{}: converted already".format(pgrec['wfile'], rstr), self.PGOPT['wrnlog']|self.FRCLOG)
                doconv = 0
@@ -1602,33 +1681,40 @@ class DsRqst(PgRqst):
                cnts['P'] += 1
                continue
             else:
+               ctime = time.time()
                if rtype == 'F':
                   (wfile, msg) = self.convert_data_format(pgrec, pgrqst, cmd, rstr)
                else:
                   (wfile, msg) = self.convert_archive_format(pgrec, pgrqst, cmd, rstr)
+               self.observe_metric('dsrqst_conversion_seconds', self.add_phase_time('convert', ctime))
                if msg:
                   if emlcnt < self.EMLMAX or (i+1) == cnts['F']:  errmsg += msg
                   emlcnt += 1
                   cnts['E'] += 1
+                  self.add_metric('dsrqst_errors_total', 1, 'type="conversion"')
                   fstat = 'E'
                elif wfile is None:
                   self.pgexec("UPDATE wfrqst SET pid = 0 WHERE findex = {}".format(pgrec['findex']), self.PGOPT['extlog'])
                   cnts['P'] += 1
                   continue
+            ptime = time.time()
             msg = self.set_file_record(wfile, fstat, pgrec, pgfiles, cnts, i, pgrqst, pgrec['srctype'], rstr)
+            self.add_phase_time('db', ptime)
             if msg:
                if emlcnt < self.EMLMAX or (i+1) == cnts['F']:  errmsg += msg
                emlcnt += 1
             elif fstat == 'O':
                efiles[i] = 0
                cnts['O'] += 1
-               if self.PGLOG['DSCHECK']:
-                  self.add_dscheck_dcount(1, pgfiles['size'][i], self.PGOPT['errlog'])
+               self.add_request_pcount(ridx, 1, pgfiles['size'][i], 1)
          if cnts['P'] == 0 and (cnts['E'] == 0 or cnts['E'] >= ecnt): break
          ecnt = cnts['E'] + cnts['P']
          errmsg += self.pglog("{}: Reconvert {}/{} file{} in {} seconds".format(rstr, ecnt, cnts['F'], s, self.PGSIG['ETIME']), self.PGOPT['wrnlog']|self.FRCLOG|self.RETMSG)
          cnts['P'] = cnts['E'] = 0
+         ptime = time.time()
          time.sleep(self.PGSIG['ETIME'])
+         self.add_phase_time('sleep', ptime)
+      self.add_request_pcount(ridx, 0, 0, 1, True)
       self.pglog("{}/{} of {} file{} staged Online/Error for {}".format(cnts['O'], cnts['E'], cnts['F'], s, rstr), self.PGOPT['wrnlog']|self.FRCLOG)
       if cnts['E'] > 0:
          errmsg += self.pglog("{}/{} file{} failed conversion for {}".format(cnts['E'], cnts['F'], s, rstr), self.PGOPT['errlog']|self.RETMSG)
@@ -1689,6 +1775,7 @@ class DsRqst(PgRqst):
                self.params['FT'][i] = info['time_modified']
                scnt += 1
       self.pglog("{} of {} file{} staged Online for {}".format(scnt, lcnt, s, rstr), self.PGOPT['wrnlog'])
+      if scnt > 0: self.add_request_pcount(ridx, scnt, 0, 0, True)
       scnt = self.ALLCNT
       self.ALLCNT = lcnt
       self.set_web_files(ridx)
@@ -1739,12 +1826,14 @@ class DsRqst(PgRqst):
       if callcmd:
    #      cmdopt = 305 if empty_out else 49   # 49=1+16+32; 305=49+256
          cmdopt = 305
+         ctime = time.time()
          for loop in range(3):
             cmddump = self.pgsystem(cmd, self.PGOPT['wrnlog'], cmdopt)
             if loop < 2 and self.PGLOG['SYSERR'] and 'Connection timed out' in self.PGLOG['SYSERR']:
                time.sleep(self.PGSIG['ETIME'])
             else:
                break
+         self.observe_metric('dsrqst_command_seconds', self.add_phase_time('command', ctime))
          cmddump = "\nCommand dump for {}:\n{}".format(cmd, cmddump) if cmddump else ""
          if empty_out and self.PGLOG['SYSERR']: empty_out = self.check_empty_error(self.PGLOG['SYSERR'])
          if pidx:
@@ -1877,6 +1966,7 @@ class DsRqst(PgRqst):
                         ecnt += 1
                         continue
                      efiles[i] = 0
+                     if not callcmd: self.add_request_pcount(ridx)
                      continue   # included in a tar file already
                elif ostat and callcmd:
                   efiles[i] = 0
@@ -1896,7 +1986,9 @@ class DsRqst(PgRqst):
                      continue
                efiles[i] = 0
                continue   # file is built via call command and no check online
+            ptime = time.time()
             finfo = self.check_local_file(wfile, chkopt)
+            self.add_phase_time('check', ptime)
             if finfo:
                if ostat and not afmt and finfo['data_size'] == pgrec['size']:
                   if tinfo and dtype:
@@ -1907,6 +1999,7 @@ class DsRqst(PgRqst):
                         ecnt += 1
                         continue
                   efiles[i] = 0
+                  if not callcmd: self.add_request_pcount(ridx)
                   continue   # file is built and online already
             if afmt:
                cinfo = self.check_local_file(cfile, chkopt)
@@ -1933,7 +2026,9 @@ class DsRqst(PgRqst):
                # build file if not (exist and O-status)
                fcmd = self.get_file_command(fcmd, pgrec)
                cmdopt = 304 if empty_file else 48   # 48=16+32; 304=48+256
+               ptime = time.time()
                cmddump = self.pgsystem(fcmd, self.PGOPT['wrnlog'], cmdopt)
+               self.add_phase_time('filecommand', ptime)
                cmddump = "\nCommand dump for {}:\n{}".format(fcmd, cmddump) if cmddump else ""
                if empty_file and self.PGLOG['SYSERR']: empty_file = self.check_empty_error(self.PGLOG['SYSERR'])
                pgrec = self.pgget("wfrqst", fields, "findex = {}".format(fidx), self.PGOPT['extlog'])
@@ -1949,7 +2044,9 @@ class DsRqst(PgRqst):
                   if afmt:
                      if afmt: (cfile, tmpfmt) = self.compress_local_file(wfile, afmt, 3)
                      if cfile == wfile: afmt = None
+               ptime = time.time()
                finfo = self.check_local_file(wfile, chkopt)
+               self.add_phase_time('check', ptime)
             if not finfo:
                if finfo != None:
                   if emlcnt < self.EMLMAX or (i+1) == cnt:
@@ -1977,7 +2074,10 @@ class DsRqst(PgRqst):
                ecnt += 1
                continue
             if afmt:
-               if self.pgsystem("rdazip -f {} {}".format(afmt, wfile), self.PGOPT['wrnlog']|self.FRCLOG, 257):  # 257=1+256
+               ptime = time.time()
+               zipped = self.pgsystem("rdazip -f {} {}".format(afmt, wfile), self.PGOPT['wrnlog']|self.FRCLOG, 257)  # 257=1+256
+               self.add_phase_time('compress', ptime)
+               if zipped:
                   cinfo = self.check_local_file(cfile, chkopt)
                   if cinfo:
                      wfile = cfile
@@ -1999,6 +2099,7 @@ class DsRqst(PgRqst):
             if progress: size += finfo['data_size']
             # record request file info
             self.set_local_mode(wfile, 1, self.PGLOG['FILEMODE'], finfo['mode'], finfo['logname'])
+            ptime = time.time()
             record = self.get_file_record(pgrec, finfo, pgrqst, wfile, i, "W")
             if record:
                if fidx:
@@ -2006,7 +2107,9 @@ class DsRqst(PgRqst):
                else:
                   fidx = self.pgadd("wfrqst", record, self.AUTOID|self.PGOPT['extlog'])
                   if fidx: acnt += 1
+            self.add_phase_time('db', ptime)
             efiles[i] = 0
+            if not callcmd: self.add_request_pcount(ridx)   # a called command counts its own files
             if tinfo and dtype:
                msg = self.build_tarfile(tinfo, fidx, wfile, finfo['data_size'], ffmt)
                if msg:
@@ -2019,7 +2122,10 @@ class DsRqst(PgRqst):
                                        "{}/{} file{} in {} seconds".format(ecnt, cnt, s, self.PGSIG['ETIME'])),
                                       self.PGOPT['wrnlog']|self.FRCLOG|self.RETMSG)
          errcnt = ecnt
+         ptime = time.time()
          time.sleep(self.PGSIG['ETIME'])
+         self.add_phase_time('sleep', ptime)
+      if not callcmd: self.add_request_pcount(ridx, 0, 0, 0, True)
       if zcnt > 0:
          s = "s" if zcnt > 1 else ""
          self.pglog("{} file{} {} compressed for {}".format(zcnt, s, zfmt, rstr), self.PGOPT['wrnlog']|self.FRCLOG)
@@ -2190,6 +2296,7 @@ class DsRqst(PgRqst):
             tfmt = afmt + ".TAR"
          else:
             tfmt = "TAR"
+         ttime = time.time()
          tfile = self.join_filenames(tinfo['files'][ii], tinfo['files'][ln - 1], "-", afmt, "tar")
          tarfile = self.PGOPT['TARPATH'] + tfile
          s = "s" if fn > 1 else ""
@@ -2281,6 +2388,7 @@ class DsRqst(PgRqst):
             self.pgupdt("tfrqst", record, "tindex = {}".format(tindex), xlog)
             if tfcnt < fn:
                self.pglog("{}-{}: Tarred {} of {} file{} to an existing {}".format(tinfo['rstr'], tfile, tfcnt, fn, s, tarfile), self.PGOPT['wrnlog']|self.FRCLOG)
+            self.observe_metric('dsrqst_tar_seconds', self.add_phase_time('tar', ttime))
       if not fidx and tinfo['otcnt'] > 0:
          # delete unused old tar file info
          for tidx in tinfo['otars']:
@@ -2397,9 +2505,7 @@ class DsRqst(PgRqst):
          rcnt = self.ALLCNT
          indices = self.params['RI']
       else:
-         rcnd = ("specialist = '{}' AND (status = 'P' OR status = 'O') AND ".format(self.params['LN']) +
-                 "(date_purge < '{}' OR date_purge = '{}' AND time_purge < '{}')".format(cdate, cdate, ctime))
-         pgrecs = self.pgmget("dsrqst", "rindex", rcnd, self.PGOPT['extlog'])
+         pgrecs = self.pgmget("dsrqst", "rindex", self.purge_due_condition(cdate, ctime), self.PGOPT['extlog'])
          rcnt = len(pgrecs['rindex']) if pgrecs else 0
          if not rcnt:
              return self.pglog("No Request owned by '{}' due to be purged by {} {}".format(self.params['LN'], cdate, ctime), self.PGOPT['wrnlog'])
@@ -2410,8 +2516,204 @@ class DsRqst(PgRqst):
       for i in range(rcnt):
          dcnt += self.purge_one_request(indices[i], cdate, ctime, 1)
       self.pglog("{} of {} request{} Purged by '{}' at {}".format(dcnt, rcnt , s, self.params['LN'], self.curtime(1)), self.PGOPT['wrnlog'])
+      if 'HW' in self.params or 'LW' in self.params: self.evict_requests()
       return rcnt
 
+   def purge_due_condition(self, cdate, ctime):
+      """Build the SQL condition for requests of the specialist due for purge by a given time.
+
+      Args:
+         cdate: Date string the requests are due by.
+         ctime: Time string the requests are due by.
+
+      Returns:
+         SQL condition string on table dsrqst.
+      """
+      return ("specialist = '{}' AND (status = 'P' OR status = 'O') AND ".format(self.params['LN']) +
+              "(date_purge < '{}' OR date_purge = '{}' AND time_purge < '{}')".format(cdate, cdate, ctime))
+
+   def purge_daemon(self):
+      """Purge requests as they become due, sleeping until the earliest purge time.
+
+      Purge times of the requests due within the next two -PW (-PurgeWait)
+      intervals are kept in a min-heap that is refreshed from dsrqst once per
+      interval, so the process wakes at the earliest purge time instead of
+      polling. On every other wakeup, at least once per PGOPT['PDWAKE']
+      seconds, only the requests already due are read, so a purge time moved
+      earlier is caught without waiting for the next refresh. Up to -PM
+      (-PurgeMax) due requests are purged concurrently in child processes.
+      """
+      wtime = self.get_wait_time(self.params['PW'][0], 7200, "Purge Wait Time")
+      pmax = int(self.params['PM']) if 'PM' in self.params else self.PGOPT['PRMAX']
+      if pmax > 1: self.PGSIG['MPROC'] = pmax
+      s = 'es' if pmax > 1 else ''
+      self.pglog("Purge daemon by '{}' started with up to {} purge process{}, refreshed every {} seconds".format(self.params['LN'], pmax, s, wtime), self.PGOPT['wrnlog'])
+      self.start_metrics_server()
+      pheap = []    # [purge time, request index] pairs
+      pdues = {}    # current purge times of the request indices in pheap
+      pstarts = set()   # (request index, purge time) pairs purged since the last refresh
+      rtime = 0
+      while not self.PGSIG['QUIT']:
+         ntime = int(time.time())
+         if ntime >= rtime:
+            pstarts.clear()
+            self.refresh_purge_heap(pheap, pdues, ntime + 2*wtime)
+            rtime = ntime + wtime
+         else:
+            self.refresh_purge_heap(pheap, pdues, ntime, pstarts)   # purge times moved earlier
+         if 'HW' in self.params or 'LW' in self.params: self.evict_requests()
+         while pheap and pheap[0][0] <= ntime:
+            (ptime, ridx) = heapq.heappop(pheap)
+            if pdues.get(ridx) != ptime: continue   # purge time changed or request gone
+            del pdues[ridx]
+            pstarts.add((ridx, ptime))
+            if self.start_child("PR{}".format(ridx), self.PGOPT['wrnlog'], 1) <= 0: continue
+            if self.PGSIG['MPROC'] > 1: continue   # in parent, child does the purge
+            if self.PGSIG['PPID'] > 1: self.METRICS = {}   # parent counts saved by parent
+            cdate = self.curdate()
+            ctime = self.curtime()
+            if self.pgget("dsrqst", "", "rindex = {} AND {}".format(ridx, self.purge_due_condition(cdate, ctime)), self.PGOPT['extlog']):
+               self.purge_one_request(ridx, cdate, ctime, 1)
+            if self.PGSIG['PPID'] > 1:   # child process is done
+               self.save_metrics()
+               sys.exit(0)
+         self.save_metrics()
+         ntime = min(pheap[0][0] if pheap else rtime, rtime, ntime + self.PGOPT['PDWAKE'])
+         stime = ntime - int(time.time())
+         if stime > 0: time.sleep(stime)
+      self.check_child(None, 0, self.PGOPT['wrnlog'], 1)   # wait for running purges to finish
+      self.pglog("Purge daemon by '{}' stopped".format(self.params['LN']), self.PGOPT['wrnlog'])
+
+   def send_outbox(self):
+      """Send the emails queued in the outbox, in batches every -EW (-EmailWait) seconds if given.
+
+      Submissions and builds only write their emails into the outbox, so they
+      do not wait on the mail server; this action delivers them over one SMTP
+      connection per batch.
+      """
+      obox = self.outbox_path()
+      if not obox: self.action_error("Email outbox directory '{}' not exists".format(self.PGOPT['OUTBOX']))
+      wtime = self.get_wait_time(self.params['EW'], 60, "Email Wait Time") if 'EW' in self.params else 0
+      if wtime: self.pglog("Outbox sender by '{}' started for {}, every {} seconds".format(self.params['LN'], obox, wtime), self.PGOPT['wrnlog'])
+      while True:
+         self.send_outbox_emails(self.PGOPT['wrnlog'])
+         if not wtime or self.PGSIG['QUIT']: break
+         time.sleep(wtime)
+      if wtime: self.pglog("Outbox sender by '{}' stopped".format(self.params['LN']), self.PGOPT['wrnlog'])
+
+   def refresh_purge_heap(self, pheap, pdues, etime, pstarts = None):
+      """Add purge times of requests due before a given time into the purge heap.
+
+      Only requests whose purge times are new or changed are pushed; the heap
+      entries left behind by changed or removed requests are skipped when popped.
+
+      Args:
+         pheap: Min-heap list of [purge time, request index] pairs.
+         pdues: Dictionary of request index to its current purge time in pheap.
+         etime: Epoch seconds the requests are due by.
+         pstarts: Set of (request index, purge time) pairs already being purged,
+                  given to only add the requests due now; pdues is refreshed in
+                  full if None.
+      """
+      ct = time.gmtime(etime) if self.PGLOG['GMTZ'] else time.localtime(etime)
+      edate = time.strftime("%Y-%m-%d", ct)
+      etm = time.strftime("%H:%M:%S", ct)
+      pgrecs = self.pgmget("dsrqst", "rindex, date_purge, time_purge", self.purge_due_condition(edate, etm), self.PGOPT['extlog'])
+      cnt = len(pgrecs['rindex']) if pgrecs else 0
+      ridxs = set()
+      acnt = 0
+      for i in range(cnt):
+         ridx = pgrecs['rindex'][i]
+         ptime = self.datetime_epoch(pgrecs['date_purge'][i], pgrecs['time_purge'][i])
+         ridxs.add(ridx)
+         if pdues.get(ridx) == ptime or pstarts and (ridx, ptime) in pstarts: continue
+         pdues[ridx] = ptime
+         heapq.heappush(pheap, [ptime, ridx])
+         acnt += 1
+      if pstarts is None:
+         for ridx in [r for r in pdues if r not in ridxs]:
+            del pdues[ridx]
+      if acnt > 0:
+         s = 's' if acnt > 1 else ''
+         self.pglog("{} Request{} scheduled to purge by {} {}".format(acnt, s, edate, etm), self.PGOPT['wrnlog'])
+
+   def datetime_epoch(self, cdate, ctime):
+      """Convert a date and time of RDADB into epoch seconds.
+
+      Args:
+         cdate: Date value.
+         ctime: Time value, or None for midnight.
+
+      Returns:
+         Epoch seconds, in GMT if -GZ is set or local time otherwise.
+      """
+      pt = time.strptime("{} {}".format(cdate, ctime if ctime else "00:00:00")[0:19], "%Y-%m-%d %H:%M:%S")
+      return int(calendar.timegm(pt) if self.PGLOG['GMTZ'] else time.mktime(pt))
+
+   def disk_usage_percent(self, dpath):
+      """Get the used disk space of the file system holding a local directory.
+
+      Args:
+         dpath: Local directory path.
+
+      Returns:
+         Used disk space in percent of the total.
+      """
+      st = os.statvfs(dpath)
+      if not st.f_blocks: return 0
+      return 100.0*(st.f_blocks - st.f_bavail)/st.f_blocks
+
+   def evict_requests(self):
+      """Purge online requests ahead of their purge times when disk space under WH runs short.
+
+      When the disk usage under -WH crosses the high-water mark -HW, online requests
+      of the specialist are purged through purge_one_request(), the least valuable
+      first, until the usage drops to the low-water mark -LW. Requests ready the
+      longest and holding the most data are the least valuable; ones whose
+      directory was accessed since the last day are evicted last. Only requests
+      whose data are in their own directories under -WH are evicted; those on
+      hold (status 'H'), with a location set, or of a shared request type,
+      whose files stay under data/dsid, are not.
+
+      Returns:
+         Number of requests evicted.
+      """
+      hwm = int(self.params['HW']) if 'HW' in self.params else self.PGOPT['HWM']
+      lwm = int(self.params['LW']) if 'LW' in self.params else self.PGOPT['LWM']
+      if lwm > hwm: lwm = hwm
+      usage = self.disk_usage_percent(self.params['WH'])
+      if usage < hwm: return 0
+      self.pglog("Disk usage {:.1f}% under {} crosses high-water mark {}%".format(usage, self.params['WH'], hwm), self.PGOPT['wrnlog'])
+      fields = "rindex, rqstid, rqsttype, size_request, date_ready, time_ready"
+      pgrecs = self.pgmget("dsrqst", fields, "specialist = '{}' AND (status = 'O' OR status = 'P') AND (location IS NULL OR location = '')".format(self.params['LN']), self.PGOPT['extlog'])
+      cnt = len(pgrecs['rindex']) if pgrecs else 0
+      ntime = int(time.time())
+      rqsts = []
+      for i in range(cnt):
+         pgrec = self.onerecord(pgrecs, i)
+         if self.request_type(pgrec['rqsttype'], 1): continue   # shared data files are not freed
+         rtime = ntime
+         if pgrec['date_ready']: rtime = self.datetime_epoch(pgrec['date_ready'], pgrec['time_ready'])
+         score = (ntime - rtime + 1)*((pgrec['size_request'] if pgrec['size_request'] else 0) + 1)
+         accessed = 0
+         if pgrec['rqstid']:
+            dpath = self.get_file_path(None, pgrec['rqstid'], None, 1)
+            try:
+               accessed = 1 if (ntime - os.stat(dpath).st_atime) < 86400 else 0
+            except OSError:
+               pass
+         rqsts.append([accessed, -score, pgrec['rindex']])
+      if not rqsts: return self.pglog("No online Request owned by '{}' to evict".format(self.params['LN']), self.PGOPT['wrnlog'])
+      rqsts.sort()
+      ecnt = 0
+      for rqst in rqsts:
+         if self.disk_usage_percent(self.params['WH']) <= lwm: break
+         ecnt += self.purge_one_request(rqst[2], self.curdate(), self.curtime(), 2)
+      usage = self.disk_usage_percent(self.params['WH'])
+      s = 's' if ecnt > 1 else ''
+      self.pglog("{} Request{} evicted by '{}', disk usage {:.1f}% under {}".format(ecnt, s, self.params['LN'], usage, self.params['WH']), self.PGOPT['wrnlog'])
+      return ecnt
+
    def purge_one_request(self, ridx, cdate, ctime, dopurge = 0):
       """Purge one request.
 
@@ -2419,7 +2721,8 @@ class DsRqst(PgRqst):
          ridx: Request index.
          cdate: Current date string.
          ctime: Current time string.
-         dopurge: If <= 0, record purge info only; if > 0, also delete request.
+         dopurge: If <= 0, record purge info only; if > 0, also delete request;
+                  if 2, evict the request ahead of its purge time.
 
       Returns:
          1 on success, 0 or error log result on failure.
@@ -2427,13 +2730,16 @@ class DsRqst(PgRqst):
       cnd = "rindex = {}".format(ridx)
       pgrqst = self.pgget("dsrqst", "*", cnd, self.PGOPT['extlog'])
       if not pgrqst: return self.pglog("can not get Request info for " + cnd, self.PGOPT['errlog'])
+      self.TRACEIDS = [ridx, 0]
       rstr = "Request {} of {}".format(ridx, pgrqst['dsid'])
+      if dopurge > 1 and 'OP'.find(pgrqst['status']) < 0:
+         return self.pglog("{} in Status '{}' and cannot be evicted".format(rstr, pgrqst['status']), self.PGOPT['wrnlog'])
       if self.ALLCNT > 0 and dopurge > 0:
          if pgrqst['specialist'] != self.params['LN']:
             return self.pglog("{}: Specialist '{}' to purge {}".format(self.params['LN'], pgrqst['specialist'], rstr), self.PGOPT['errlog'])
          if 'POH'.find(pgrqst['status']) < 0:
             return self.pglog("{} in Status '{}' and cannot be purged".format(rstr, pgrqst['status']), self.PGOPT['errlog'])
-         elif 'FP' not in self.params: 
+         elif 'FP' not in self.params and dopurge < 2:
             pstr = ", adds Mode option -FP (-ForcePurge) to force purge"
             if pgrqst['status'] == 'O':
                pdt = '{} {}'.format(pgrqst['date_purge'], pgrqst['time_purge'])
@@ -2493,9 +2799,11 @@ class DsRqst(PgRqst):
       self.fill_request_metrics(ridx, pgrec)
       if ret:
          if dopurge > 0:
-            dcnt = [0]*3
+            dcnt = [0]*4
             self.delete_one_request(ridx, dcnt)
-            self.pglog("{}/{} of {} request file{} purged from RDADB/Disk".format(dcnt[1], dcnt[2], pgrqst['fcount'], s), self.PGOPT['wrnlog']|self.FRCLOG)
+            self.add_metric('dsrqst_purges_total')
+            self.add_metric('dsrqst_purge_bytes_total', dcnt[3])
+            self.pglog("{}/{} of {} request file{} purged from RDADB/Disk, {} bytes freed".format(dcnt[1], dcnt[2], pgrqst['fcount'], s, dcnt[3]), self.PGOPT['wrnlog']|self.FRCLOG)
             self.pglog("{} purged by {}".format(rstr, self.curtime(1)), self.PGOPT['wrnlog']|self.FRCLOG)
          else:
             self.pglog("{} recorded into dspurge at {}".format(rstr, self.curtime(1)), self.PGOPT['wrnlog']|self.FRCLOG)
@@ -2506,20 +2814,23 @@ class DsRqst(PgRqst):
 
       Args:
          cnd: SQL condition string for the request.
+
+      Returns:
+         Number of file records newly added into wfpurge.
       """
-      # gather all file records for the request
+      fcnt = self.pgget("wfrqst", "", cnd, self.PGOPT['extlog'])
+      if not fcnt: return 0
+      # copy all file records of the request in one statement, skipping the
+      # ones already recorded, instead of a check and an insert per file
       fields = "rindex, gindex, srcid, srctype, size, type, data_format, file_format, wfile"
-      pgfiles = self.pgmget("wfrqst", fields, cnd, self.PGOPT['extlog'])
-      fcnt = len(pgfiles['wfile']) if pgfiles else 0
-      pcnt = 0
-      for i  in range(fcnt):
-         pgrec = self.onerecord(pgfiles, i)
-         if not self.pgget("wfpurge", "", "{} AND wfile = '{}'".format(cnd, pgrec['wfile']), self.PGOPT['extlog']):
-            # add purge file record only if not created yet
-            pcnt += self.pgadd("wfpurge", pgrec, self.PGOPT['extlog'])
+      sqlstr = ("INSERT INTO wfpurge ({0}) SELECT {0} FROM wfrqst w WHERE w.{1} AND NOT EXISTS " +
+                "(SELECT 1 FROM wfpurge p WHERE p.rindex = w.rindex AND p.wfile = w.wfile)").format(fields, cnd)
+      pcnt = self.pgexec(sqlstr, self.PGOPT['extlog'])
       s = "s" if fcnt > 1 else ""
       self.pglog("{} of {} request file{} recorded for usage".format(pcnt, fcnt, s), self.PGOPT['wrnlog']|self.FRCLOG)
 
+      return pcnt
+
    def reset_purge_time(self):
       """Modify purge date/time information for given request indices."""
       tname = "dsrqst"
@@ -2674,19 +2985,24 @@ class DsRqst(PgRqst):
       Returns:
          Number of unused files found/cleaned.
       """
-      files = glob.glob(dsid + "/*")
-      if not files: return 0
-      cnt = 0
-      for file in files:
-         wfile = op.basename(file)
-         if self.pgget("wfrqst", "", "wfile = '{}'".format(wfile), self.LGEREX): continue
-         if self.pgget("wfrqst", "", "ofile = '{}'".format(wfile), self.LGEREX): continue
-         if 'FP' in self.params:
-            self.pgsystem("rm -rf " + file, self.LGWNEX, 5)
-         else:
-            self.pglog(file + " unused", self.WARNLG)
-         cnt += 1
+      fnames = set(name for name in self.get_local_entries(dsid) if name[0] != '.')
+      if not fnames: return 0
+      # one query for all file names referenced by requests of the dataset; directories
+      # may be named in the old dsNNN.N form while dsrqst holds the new dNNNNNN form
+      dsids = sorted(set([dsid, self.format_dataset_id(dsid, True, 0), self.format_dataset_id(dsid, False, 0)]))
+      dstr = ','.join("'{}'".format(d) for d in dsids)
+      pgrecs = self.pgmget("wfrqst w, dsrqst d", "w.wfile, w.ofile", "w.rindex = d.rindex AND d.dsid = ANY(ARRAY[{}])".format(dstr), self.LGEREX)
+      if pgrecs:
+         fnames.difference_update(pgrecs['wfile'])
+         fnames.difference_update(pgrecs['ofile'])
+      ufiles = []
+      for wfile in sorted(fnames):
+         file = "{}/{}".format(dsid, wfile)
+         if 'FP' not in self.params: self.pglog(file + " unused", self.WARNLG)
+         ufiles.append(file)
+      cnt = len(ufiles)
       if cnt > 0:
+         if 'FP' in self.params: self.delete_local_paths(ufiles, self.LOGWRN)
          s = "s" if cnt > 1 else ""
          self.pglog("{} unused File{} {} for {}".format(cnt, s, ('cleaned' if 'FP' in self.params else 'found'), dsid), self.LOGWRN)
       return cnt
@@ -2695,18 +3011,22 @@ class DsRqst(PgRqst):
       """Clean request directories on disk that are not in RDADB."""
       self.check_local_writable(self.params['WH'], "Delete Directories for Requested Purged Already", self.PGOPT['extlog'])
       self.change_local_directory(self.params['WH'], self.PGOPT['extlog'])
-      rids = self.params['RN'] if 'RN' in self.params else glob.glob("*")
-      rcnt = 0
+      if 'RN' in self.params:
+         rids = self.params['RN']
+      else:
+         rids = sorted(self.get_local_entries("."))
+      rdirs = {}
       for rid in rids:
          ms = re.match(r'^[A-Z]+(\d+)$', rid)
-         if ms:
-            ridx = ms.group(1)
-            if self.pgget("dsrqst", "", "rindex = {}".format(ridx), self.PGOPT['extlog']): continue
-            if 'FP' in self.params:
-               self.pgsystem("rm -rf " + rid, self.PGOPT['extlog'], 5)
-            else:
-               self.pglog(rid + " unused", self.WARNLG)
-            rcnt += 1
+         if ms: rdirs[rid] = int(ms.group(1))
+      ridxs = self.get_table_indices("dsrqst", "rindex", rdirs.values(), self.PGOPT['extlog'])
+      urids = []
+      for rid in rdirs:
+         if rdirs[rid] in ridxs: continue
+         if 'FP' not in self.params: self.pglog(rid + " unused", self.WARNLG)
+         urids.append(rid)
+      rcnt = len(urids)
+      if rcnt > 0 and 'FP' in self.params: self.delete_local_paths(urids, self.PGOPT['wrnlog'])
       s = "ies" if rcnt > 1 else "y"
       if 'FP' in self.params:
          self.pglog("{} unused Request Director{} cleaned".format(rcnt, s), self.LOGWRN)
@@ -2751,16 +3071,17 @@ class DsRqst(PgRqst):
       if self.check_local_file(dpath):
          s = 's' if cnt > 1 else ''
          self.pglog("{}: checking {} online file record{}...".format(rstr, cnt, s), self.WARNLG)
-         mcnt = 0
+         fnames = [self.get_file_path(wfile, dpath, None, 2) for wfile in pgrecs['wfile']]
+         sizes = self.get_local_file_sizes(dpath, fnames)
+         findices = []
          for i in range(cnt):
-            pgrec = self.onerecord(pgrecs, i)
-            file = self.get_file_path(pgrec['wfile'], dpath)
-            info = self.check_local_file(file, 1, self.PGOPT['wrnlog'])
-            if not (info and info['data_size'] == pgrec['size']):
-               if 'FP' in self.params:
-                  mcnt += self.pgexec("UPDATE wfrqst SET status = 'R' WHERE findex = {}".format(pgrec['findex']), self.PGOPT['extlog'])
-               else:
-                  mcnt += 1
+            if sizes.get(fnames[i]) != pgrecs['size'][i]: findices.append(pgrecs['findex'][i])
+         mcnt = len(findices)
+         if mcnt > 0 and 'FP' in self.params:
+            mcnt = 0
+            for j in range(0, len(findices), self.PGOPT['ANYLMT']):
+               fstr = ','.join(map(str, findices[j:j+self.PGOPT['ANYLMT']]))
+               mcnt += self.pgexec("UPDATE wfrqst SET status = 'R' WHERE findex = ANY(ARRAY[{}])".format(fstr), self.PGOPT['extlog'])
       elif 'FP' in self.params:
          mcnt += self.pgexec("UPDATE wfrqst SET status = 'R' WHERE rindex = {} AND status ='O'".format(ridx), self.PGOPT['extlog'])
       else:
@@ -2936,7 +3257,10 @@ def main():
    """Main entry point for the dsrqst command-line utility."""
    object = DsRqst()
    object.read_parameters()
-   object.start_actions()
+   if 'PA' in object.params:
+      object.profile_actions(object.start_actions)
+   else:
+      object.start_actions()
    object.pgexit(0)
 
 # call main() to start program
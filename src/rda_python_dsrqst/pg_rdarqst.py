@@ -48,7 +48,9 @@ class PgRDARqst(PgRqst):
       "   'rnote'   : RequestNote (optional, readable version of 'rinfo')\n\n" +
       "     logact - optional logging action flag, self.LOGWRN as default.\n\n" +
       "      Return: message for the request being added.\n" +
-      " For example: msg = rda_request(rqst)\n")
+      " For example: msg = rda_request(rqst)\n\n" +
+      " To submit a list of requests in one call, use rda_request_many(rqsts, logact),\n" +
+      " which returns a list of messages, one for each request in the same order.\n")
    SUSG = (
       "\n\nUsage for function rda_request_status(ridx, email, logact)\n\n" +
       "    ridx - Request index\n" +
@@ -91,6 +93,7 @@ class PgRDARqst(PgRqst):
       super().__init__()  # initialize parent class
       self.VLDCMD = None
       self.PTLIMIT = self.PTSIZE = 0
+      self.BATCH = None    # lookup key: result shared by a batch of requests in rda_request_many()
 
    def rda_request(self, rqst = None, logact = None):
       """Submit an RDA data request.
@@ -126,6 +129,130 @@ class PgRDARqst(PgRqst):
          response_msg['summary'] = msg
          return response_msg
 
+   def rda_request_many(self, rqsts = None, logact = None):
+      """Submit a batch of RDA data requests.
+
+      Each request is validated as in rda_request(), with the user names,
+      request controls, outstanding request counts, dataset titles and
+      specialist names looked up once for the batch. The valid requests are
+      added in one transaction and read back in one query, and their emails
+      are sent, or queued if the email outbox is used. Each request is added
+      under its own savepoint, so a failed one is rolled back and gets its
+      error message while the others are still added; the transaction is
+      rolled back in full if the batch is interrupted.
+
+      Args:
+         rqsts: List of request dictionaries, each as for rda_request().
+         logact: Logging action flag, defaults to LOGWRN.
+
+      Returns:
+         List of String messages or dictionaries, one for each request in the
+         same order, as returned by rda_request().
+      """
+      if logact is None: logact = self.LOGWRN
+      if not rqsts:
+         self.pglog(self.USG, self.WARNLG)
+         return [self.pglog("Miss request information in form of a list of dictionary arrays", logact|self.RETMSG)]
+      rcnt = len(rqsts)
+      results = [None]*rcnt
+      pgrqsts = {}    # request list index: request record to add
+      dups = {}       # request list index: index of the same request earlier in the list
+      rkeys = {}      # request key: request list index
+      acnt = 0
+      self.BATCH = {}
+      try:
+         for i in range(rcnt):
+            pgrqst = {}
+            msg = self.common_request_info(pgrqst, rqsts[i], logact)
+            if not msg: msg = self.process_request_detail(pgrqst, rqsts[i], logact)
+            if msg:
+               results[i] = msg
+               continue
+            rkey = (pgrqst['email'], pgrqst['rhash'] if pgrqst.get('rhash') else
+                    (pgrqst['dsid'], pgrqst['gindex'], pgrqst['rqsttype'], pgrqst.get('rinfo')))
+            if rkey in rkeys:
+               dups[i] = rkeys[rkey]
+               continue
+            rkeys[rkey] = i
+            pgrqsts[i] = pgrqst
+            ckey = ('rqstcnt', pgrqst['cindex'], pgrqst['email'])
+            if ckey in self.BATCH: self.BATCH[ckey] += 1   # counted for the rest of the batch
+         if pgrqsts:
+            mtrans = self.PGDBI['MTRANS']
+            self.PGDBI['MTRANS'] = mtrans + len(pgrqsts)   # no commit in the middle of the batch
+            self.starttran()
+            try:
+               self.batch_savepoint("SAVEPOINT rqst")
+               for i in pgrqsts:
+                  msg = self.add_request_record(pgrqsts[i], logact, 1)
+                  if msg:
+                     self.batch_savepoint("ROLLBACK TO SAVEPOINT rqst")   # kept for the next request
+                     results[i] = msg
+                  else:
+                     self.batch_savepoint("RELEASE SAVEPOINT rqst; SAVEPOINT rqst")
+            except BaseException:
+               self.aborttran()
+               raise
+            finally:
+               self.PGDBI['MTRANS'] = mtrans
+            self.endtran()
+            ridxs = [pgrqsts[i]['rindex'] for i in pgrqsts if not results[i]]
+            acnt = len(ridxs)
+            pgrecs = self.pgmget("dsrqst", "*", "rindex = ANY(ARRAY[{}])".format(','.join(map(str, ridxs))), logact|self.EXITLG) if ridxs else None
+            cnt = len(pgrecs['rindex']) if pgrecs else 0
+            rrecs = {}
+            for j in range(cnt):
+               rrecs[pgrecs['rindex'][j]] = self.onerecord(pgrecs, j)
+            for i in pgrqsts:
+               if results[i]: continue
+               pgrqst = pgrqsts[i] = rrecs[pgrqsts[i]['rindex']]
+               msg = self.build_request_message(pgrqst, logact)
+               self.send_request_email(pgrqst, msg, logact)
+               response_msg = self.return_request_message(pgrqst, 1, logact)
+               if isinstance(response_msg, str):
+                  results[i] = response_msg + msg
+               else:
+                  response_msg['summary'] = msg
+                  results[i] = response_msg
+         for i in dups:
+            j = dups[i]
+            results[i] = self.duplicate_request_message(pgrqsts[j], logact) if pgrqsts[j].get('rindex') else results[j]
+      finally:
+         self.BATCH = None
+      s = 's' if rcnt > 1 else ''
+      self.pglog("{} of {} Request{} added in one batch".format(acnt, rcnt, s), logact&~self.EXITLG)
+      return results
+
+   def batch_savepoint(self, sqlstr):
+      """Execute SAVEPOINT, RELEASE SAVEPOINT or ROLLBACK TO SAVEPOINT commands.
+
+      The command is run on a plain cursor, so it is not counted as changed
+      records of the current transaction; a database error is raised to the
+      caller to abort the batch.
+
+      Args:
+         sqlstr: Savepoint command string, or commands separated by ';'.
+      """
+      pgcur = self.pgcursor()
+      if not pgcur: self.pglog("Error connect RDADB for " + sqlstr, self.LGEREX)
+      pgcur.execute(sqlstr)
+      pgcur.close()
+
+   def batch_lookup(self, key, func, *args):
+      """Call a lookup function, sharing its result while a batch of requests is submitted.
+
+      Args:
+         key: Hashable key of the lookup in the batch.
+         func: Lookup function.
+         args: Arguments passed to func.
+
+      Returns:
+         Result of func(*args), cached by key within rda_request_many().
+      """
+      if self.BATCH is None: return func(*args)
+      if key not in self.BATCH: self.BATCH[key] = func(*args)
+      return self.BATCH[key]
+
    def common_request_info(self, pgrqst, rqst, logact):
       """Fill in common request information fields from the request dictionary.
 
@@ -154,7 +281,7 @@ class PgRDARqst(PgRqst):
          if ms: gindex = int(ms.group(2))
       if 'email' in rqst and rqst['email']: email = rqst['email']
       if not email: email = self.PGLOG['CURUID'] + "@ucar.edu"
-      unames = self.get_ruser_names(email, 1)
+      unames = self.batch_lookup(('ruser', email), self.get_ruser_names, email, 1)
       if not unames: return f"Please register your email {email} at https://gdex.ucar.edu/dashboard/ to submit a data request."
       if 'location' in rqst and rqst['location']: wdir = rqst['location']
       if wdir:
@@ -225,7 +352,8 @@ class PgRDARqst(PgRqst):
       Returns:
          Error message/dictionary if denied, None if allowed.
       """
-      cnt = self.pgget("dsrqst", "", "cindex = {} AND email = '{}' AND status <> 'P'".format(pgctl['cindex'], unames['email']))
+      cnt = self.batch_lookup(('rqstcnt', pgctl['cindex'], unames['email']), self.pgget, "dsrqst", "",
+                              "cindex = {} AND email = '{}' AND status <> 'P'".format(pgctl['cindex'], unames['email']))
       if cnt < pgctl['maxrqst']:
          return None
       else:
@@ -332,6 +460,7 @@ class PgRDARqst(PgRqst):
             pgrqst['note'] = rqst['rnote']
          else:
             pgrqst['note'] = rqst['rinfo']
+         if self.has_request_fingerprint(): pgrqst['rhash'] = self.request_fingerprint(pgrqst)
          msg = self.subset_request_submitted(pgrqst, logact)
          if msg: return msg
          if self.VLDCMD:
@@ -359,61 +488,64 @@ class PgRDARqst(PgRqst):
       self.pgsystem("echo {} | {} {}".format(rinfo, self.VLDCMD, dsid), logact, 262+1024)
       return self.PGLOG['SYSERR']
 
-   def add_request_record(self, pgrqst, logact):
+   def add_request_record(self, pgrqst, logact, batch = 0):
       """Add a new request record to the dsrqst table.
 
       Args:
          pgrqst: Request record dictionary to insert.
          logact: Logging action flag.
+         batch: 1 if added in a batch by rda_request_many(), to return the
+                error message of a failed insert instead of exiting.
 
       Returns:
          Error message string on failure, None on success.
       """
-      unames = self.get_ruser_names(pgrqst['email'], 1)
-      nidx = self.new_request_id(logact)
+      unames = self.batch_lookup(('ruser', pgrqst['email']), self.get_ruser_names, pgrqst['email'], 1)
       lname = self.convert_chars(unames.get('lstname', None), 'RQST').upper()
-      pgrqst['rqstid'] = "{}{}".format(lname, nidx)   # set request ID
       (pgrqst['date_rqst'], pgrqst['time_rqst']) = self.get_date_time()
-      ridx = self.pgadd("dsrqst", pgrqst, logact|self.EXITLG|self.AUTOID|self.DODFLT)
+      dbact = (logact&~self.EXITLG) if batch else (logact|self.EXITLG)
+      ridx = self.add_request_with_id(pgrqst, lname, dbact|self.DODFLT)
       if ridx > 0:
-         if ridx != nidx:  # reset request ID
-            record = {'rqstid' : "{}{}".format(lname, ridx)}
-            self.pgupdt("dsrqst", record, "rindex = {}".format(ridx), logact|self.EXITLG)
          self.pglog("{}: Request Index {} added for <{}> {}".format(pgrqst['dsid'], ridx, unames['name'], pgrqst['email']), self.LOGWRN)
          pgrqst['rindex'] = ridx
          return None
       else:
          return self.pglog("Fail to add request record for '{}'".format(pgrqst['dsid']), logact|self.RETMSG)
 
-   def new_request_id(self, logact):
-      """Find a unique request ID by getting the next available rindex value.
+   def subset_request_submitted(self, rqst, logact):
+      """Check if an identical subset request was already submitted.
+
+      The indexed request fingerprint rhash is matched if it is set; the full
+      rinfo string is compared otherwise, and also for the records added
+      before field rhash was filled.
 
       Args:
+         rqst: Request record dictionary with dsid, gindex, rqsttype, email, rinfo and rhash if any.
          logact: Logging action flag.
 
       Returns:
-         Next available request index (max rindex + 1), or 0 if no records.
+         Message string or dictionary if duplicate found, None otherwise.
       """
-      pgrec = self.pgget("dsrqst", "MAX(rindex) maxid", '', logact)
-      if pgrec:
-         return (pgrec['maxid'] + 1)
+      cnd = ("dsid = '{}' AND gindex = {} ".format(rqst['dsid'], rqst['gindex']) +
+             "AND rqsttype = '{}' AND rinfo = '{}'".format(rqst['rqsttype'], rqst['rinfo']))
+      if 'rhash' in rqst and rqst['rhash']:
+         cnd = "email = '{}' AND (rhash = '{}' OR rhash IS NULL AND {})".format(rqst['email'], rqst['rhash'], cnd)
       else:
-         return 0
+         cnd = "email = '{}' AND {}".format(rqst['email'], cnd)
+      pgrqst = self.pgget("dsrqst", "*", cnd, logact|self.EXITLG)
+      if not pgrqst: return None
+      return self.duplicate_request_message(pgrqst, logact)
 
-   def subset_request_submitted(self, rqst, logact):
-      """Check if an identical subset request was already submitted.
+   def duplicate_request_message(self, pgrqst, logact):
+      """Build the message declining a request as a duplicate of a submitted one.
 
       Args:
-         rqst: Request record dictionary with dsid, gindex, rqsttype, email, rinfo.
+         pgrqst: Request record dictionary of the submitted request.
          logact: Logging action flag.
 
       Returns:
-         Message string or dictionary if duplicate found, None otherwise.
+         Message string or dictionary of the duplicate request.
       """
-      pgrqst = self.pgget("dsrqst", "*", "dsid = '{}' AND gindex = {} ".format(rqst['dsid'], rqst['gindex']) +
-                           "AND rqsttype = '{}' AND email = '{}' ".format(rqst['rqsttype'], rqst['email']) +
-                           "AND rinfo = '{}'".format(rqst['rinfo']), logact|self.EXITLG)
-      if not pgrqst: return None
       msg = self.build_request_message(pgrqst, logact)
       response_msg = self.return_request_message(pgrqst, 0, logact)
       if isinstance(response_msg, dict):
@@ -425,6 +557,21 @@ class PgRDARqst(PgRqst):
       else:
          return response_msg + msg
 
+   def built_subset_request(self, rqst, logact):
+      """Find the latest online request, by any user, built for the same subset.
+
+      Args:
+         rqst: Request record dictionary with dsid, gindex, rqsttype and rinfo.
+         logact: Logging action flag.
+
+      Returns:
+         Request record dictionary if found, None otherwise or if dsrqst has no field rhash.
+      """
+      if not self.has_request_fingerprint(): return None
+      rhash = rqst['rhash'] if 'rhash' in rqst and rqst['rhash'] else self.request_fingerprint(rqst)
+      if not rhash: return None
+      return self.pgget("dsrqst", "*", "rhash = '{}' AND status = 'O' ORDER BY rindex DESC".format(rhash), logact|self.EXITLG)
+
    def build_request_message(self, rqst, logact):
       """Build a summary string message for a submitted request.
 
@@ -438,7 +585,7 @@ class PgRDARqst(PgRqst):
       ridx = rqst['rindex']
       dsid = rqst['dsid']
       rstr = self.request_type(rqst['rqsttype'])
-      drec = self.pgget("dataset", "title", "dsid = '{}'".format(dsid), logact|self.EXITLG)
+      drec = self.batch_lookup(('dataset', dsid), self.pgget, "dataset", "title", "dsid = '{}'".format(dsid), logact|self.EXITLG)
       buf = ("Request Summary:\n" +
              "Index    : {}\n".format(ridx) +
              "ID       : {}\n".format(rqst['rqstid']) +
@@ -525,6 +672,7 @@ class PgRDARqst(PgRqst):
          logmsg += f", CC: {ccemail}"
       email_msg.set_content(header + msg)
       logmsg += f", Subject: {subject}\n"
+      if self.queue_email(email_msg, logact): return
       try:
          with smtplib.SMTP(self.PGLOG['EMLSRVR'], self.PGLOG['EMLPORT']) as smtp:
             smtp.send_message(email_msg)
@@ -535,7 +683,8 @@ class PgRDARqst(PgRqst):
       """Get the request control record for a request.
 
       Searches for matching control record by dataset, group, and request type,
-      traversing parent groups if no match found at the current level.
+      traversing parent groups if no match found at the current level. Records
+      are cached by get_control_record(), so a submission reads them once.
 
       Args:
          dsid: Dataset ID string.
@@ -546,36 +695,7 @@ class PgRDARqst(PgRqst):
       Returns:
          Control record dictionary, or None if not found.
       """
-      gcnd = f"dsid = '{dsid}' AND gindex = {gindex}"
-      if rtype == "T" or rtype == "S":
-         tcnd = " AND (rqsttype = 'T' OR rqsttype = 'S')"
-         ocnd = " ORDER BY rqsttype DESC"
-      else:
-         tcnd = f" AND rqsttype = '{rtype}'"
-         ocnd = ""
-      i = 0
-      while True:
-         cnd = gcnd + tcnd + ocnd
-         pgctl = self.pgget("rcrqst", "*", cnd, logact)
-         if not pgctl:
-            if gindex:
-               pgrec = self.pgget("dsgroup", "pindex", gcnd, logact)
-               if pgrec:
-                  gindex = pgrec['pindex']
-                  gcnd = "dsid = '{}' AND gindex = {}".format(dsid, gindex)
-                  i += 1
-                  continue
-            elif i == 0:
-               if ocnd:
-                  ocnd += ", gindex"
-               else:
-                  ocnd = " ORDER BY gindex"
-               gcnd = "dsid = '{}'".format(dsid)
-               i += 1
-               continue
-            return None
-         break
-      return pgctl
+      return self.get_control_record(dsid, gindex, rtype, logact, 1)
 
    def return_request_message(self, rqst, success, logact):
       """Create and return the response message for a request submission.
@@ -594,7 +714,7 @@ class PgRDARqst(PgRqst):
       title  = "{} Request {}".format(rstr, ridx)
       name = rqst['specialist']
       email = name + "@ucar.edu"
-      rec = self.pgget("dssgrp", "lstname, fstname", "logname = '{}'".format(name), logact)
+      rec = self.batch_lookup(('dssgrp', name), self.pgget, "dssgrp", "lstname, fstname", "logname = '{}'".format(name), logact)
       if rec: name = "{} {}".format(rec['fstname'], rec['lstname'])
       error = None
       msg = "{}:\n\nYour {} request has been ".format(title, rstr)
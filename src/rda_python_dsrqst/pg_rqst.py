@@ -10,14 +10,38 @@
 #    Github : https://github.com/NCAR/rda-python-dsrqst.git
 # 
 ###############################################################################
+import io
 import os
 import re
+import csv
+import sys
+import json
 import time
 import glob
+import hashlib
+import pstats
+import cProfile
+import fcntl
+import shlex
+import smtplib
+import resource
+import threading
+import subprocess
+from email import message_from_bytes, policy
+from email.message import EmailMessage
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from os import path as op 
+from concurrent.futures import ThreadPoolExecutor
+from rda_python_common import pg_log
 from rda_python_common.pg_split import PgSplit
 from rda_python_common.pg_cmd import PgCMD
 from rda_python_common.pg_opt import PgOPT
+from rda_python_common.pg_dbi import PgSQL
+try:
+   import pyarrow
+   import pyarrow.ipc
+except ImportError:   # Arrow output is optional
+   pyarrow = None
 
 class PgRqst(PgOPT, PgCMD, PgSplit):
    """Common variables and functions for the dsrqst utility.
@@ -32,6 +56,30 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
       """Initialize PgRqst with option definitions, table hashes, and default settings."""
       super().__init__()  # initialize parent class
       self.CORDERS = {}
+      self.PCOUNTS = {}     # request index: [unwritten processed file count, byte size, last write time]
+      self.DSIDS = {}       # table name: {request/control index: dataset id}
+      self.FIDS = {}        # dataset id: {wid: wfile}
+      self.FNAMES = {}      # dataset id: {(wfile, type): wid}
+      self.METRICS = {}     # metric name: {label string: counter value or histogram list}
+      self.PHASES = {}      # build phase name: seconds spent in the current build
+      self.TRACEIDS = [0, 0]   # [request index, partition index] of traced commands
+      self.RCNTLS = {}      # (dsid, gindex, request type, anygroup): [cached time, control record or None]
+      self.DBSITES = {}     # RDADB call site: [call count, seconds], counted for option -PA
+      self.DBDEPTH = 0      # depth of counted RDADB calls in progress
+      self.RHASH = None     # True if dsrqst has the request fingerprint field rhash, checked once
+      self.MTDEFS = {       # metric name: [metric type, help string]
+         'dsrqst_files_staged_total' : ['counter', "Request files staged online"],
+         'dsrqst_bytes_staged_total' : ['counter', "Bytes of request files staged online"],
+         'dsrqst_builds_total' : ['counter', "Requests and partitions built successfully"],
+         'dsrqst_build_seconds' : ['histogram', "Seconds to build a request or partition"],
+         'dsrqst_queue_wait_seconds' : ['histogram', "Seconds from request submission to build start"],
+         'dsrqst_conversion_seconds' : ['histogram', "Seconds to convert one request file"],
+         'dsrqst_command_seconds' : ['histogram', "Seconds of build command calls"],
+         'dsrqst_tar_seconds' : ['histogram', "Seconds to build one tar file"],
+         'dsrqst_errors_total' : ['counter', "Request processing errors by type"],
+         'dsrqst_purges_total' : ['counter', "Requests purged"],
+         'dsrqst_purge_bytes_total' : ['counter', "Bytes freed by purging requests"],
+      }
       self.OPTS.update({                         # (!= 0) - setting actions
          'BR' : [0x00000010, 'BuildRequest',   1], 
          'PR' : [0x00000020, 'PurgeRequest',   1], # clean missed requested files too
@@ -51,6 +99,7 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
          'IR' : [0x00080000, 'InterruptRequest', 1],
          'IP' : [0x00100000, 'InterruptParition', 4],
          'RR' : [0x00200000, 'RestoreRequest',   1],
+         'SE' : [0x00400000, 'SendEmail',      1],
          'ER' : [0x00800000, 'EmailRequest',   0],
          'GT' : [0x04000000, 'GetTarfile',     0],
          'ST' : [0x08000000, 'SetTarfile',     1],
@@ -68,6 +117,7 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
          'NO' : [0, 'NotOnline',     0],
          'NP' : [0, 'NewPartition',  0],   # for SP, allow adding new request partitions
          'NR' : [0, 'NewRequest',    0],   # for SR, allow adding new requests
+         'PT' : [0, 'PhaseTime',     0],   # for GR and GP, show build phase times
          'RO' : [0, 'ResetOrder',    2],
          'UD' : [0, 'UnusedData',    2],
          'UF' : [0, 'UnstagedFile',  2],
@@ -77,11 +127,19 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
          'DV' : [1, 'Divider',       1],  # default to <:>
          'EL' : [1, 'EmailLimit',    1],  # default to 20
          'ES' : [1, 'EqualSign',     1],  # default to <=>
+         'EW' : [1, 'EmailWait',     1],  # outbox sender wait interval, default to 60 seconds
          'FN' : [1, 'FieldNames',    0],
+         'HW' : [1, 'HighWater',    17],  # default to 90 (percent)
          'LN' : [1, 'LoginName',     1],
+         'LW' : [1, 'LowWater',     17],  # default to 80 (percent)
          'OF' : [1, 'OutputFile',    0],
+         'PA' : [1, 'ProfileAction', 16],  # number of top functions in the profile summary
+         'ME' : [1, 'MetricsExport', 0],  # Prometheus text file name or [host]:port
+         'OM' : [1, 'OutputMode',    1],  # JSON, CSV or ARROW, default to column text
+         'PM' : [1, 'PurgeMax',     17],  # default to 4
          'ON' : [1, 'OrderNames',    0],
          'AO' : [1, 'ActOption',     1],  # default to <!>
+         'TL' : [1, 'TraceLog',      0],  # JSON lines file of traced external commands
          'TS' : [1, 'totalSize',    17],
          'WH' : [1, 'WebHomeDir',    1],
          'AF' : [2, 'ArchiveFormat', 1],
@@ -162,22 +220,30 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
          'EV' : ['Envs'],
          'GZ' : ['GMT', 'GreenwichZone', 'UTC'],
          'HN' : ['HostMachine'],
+         'HW' : ['HighWaterMark'],
          'IR' : ['InterRupt'],
          'LF' : ['LocFile'],
          'LM' : ['UpLimit'],
+         'LW' : ['LowWaterMark'],
+         'ME' : ['Metrics'],
          'MO' : ['Mods'],
          'MP' : ['MaxrequestPeriod'],
          'MR' : ['MaximumRequest'],
          'OB' : ['OrderByPattern'],
+         'OM' : ['RecordFormat'],
+         'PA' : ['Profile'],
          'PC' : ['Command', 'SpecialCommand'],
+         'PM' : ['PurgeLimit'],
          'QS' : ['PBSOptions'],
          'RF' : ['RequestInformation'],
          'RL' : ['RequestHome', 'RequestPath'],
          'RN' : ['RequestID'],
          'RO' : ['Reorder'],
          'RP' : ['ResetPurgeTime', 'RePublish'],
+         'SE' : ['SendOutbox'],
          'SL' : ['SourceID'],
          'TF' : ['OutputFormat', 'ProductFormat'],
+         'TL' : ['TraceFile'],
          'UA' : ['URLAddress', 'URLLink'],
          'UL' : ['UnLockRequest', 'UnLockParition'],
          'UZ' : ['Uncompress', 'UncompressData', 'Unzip'],
@@ -306,6 +372,21 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
       self.PGOPT['FLMT'] = 1000 
       self.PGOPT['PTMAX'] = 24    # max number of partitions for a signle request
       self.PGOPT['TARPATH'] = "TarFiles/"
+      self.PGOPT['DLTHRD'] = 8    # number of threads to unlink or stat local files
+      self.PGOPT['PRMAX'] = 4     # max number of requests purged concurrently in purge daemon
+      self.PGOPT['PDWAKE'] = 60   # max seconds the purge daemon sleeps before checking for due requests
+      self.PGOPT['PCINTV'] = 5    # min seconds between writes of coalesced request progress counters
+      self.PGOPT['ANYLMT'] = 5000 # max number of values in one '= ANY(ARRAY[...])' condition
+      self.PGOPT['PGSIZE'] = 5000 # number of rows fetched per page from a server-side cursor
+      self.PGOPT['MTFILE'] = "dsrqst_metrics.json"   # metrics state file under PGLOG['LOGPATH']
+      self.PGOPT['RCTTL'] = 300   # seconds a cached request control record stays valid
+      self.PGOPT['PFTOP'] = 30    # default number of top functions in a profile summary
+      self.PGOPT['OUTBOX'] = "outbox"   # email outbox directory under PGLOG['RQSTHOME'], used if it exists
+      self.PGOPT['OBMAX'] = 200   # max number of queued emails sent in one batch
+      self.PGOPT['OBTRY'] = 3     # tries to send one queued email before leaving it for the next batch
+      self.PGOPT['MTBKTS'] = [1, 5, 15, 60, 300, 900, 3600, 14400, 86400]   # histogram buckets in seconds
+      self.PGOPT['HWM'] = 90      # disk usage percent under WH to start evicting online requests
+      self.PGOPT['LWM'] = 80      # disk usage percent under WH to stop evicting online requests
       # set default parameters
       self.PGOPT['DTS'] = self.PGOPT['TS'] = 90000  # total size of all downloads, in GB
       self.params['WH'] = self.PGLOG['RQSTHOME']
@@ -350,6 +431,10 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
          if 'RI' not in self.params:
             if cact == 'UL':
                if 'PI' not in self.params: erridx = 8
+            elif cact == 'PR':
+               if 'PW' not in self.params: erridx = 0   # purge daemon needs no request index
+            elif cact == 'SE':
+               pass    # outbox sender needs no request index
             elif cact != 'DL' or not ('CI' in self.params or 'UD' in self.params or 'UR' in self.params or 'UF' in self.params):
                erridx = 0
          elif cact == 'SF':
@@ -754,6 +839,34 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
          if not pgrec: self.action_error("No Request matches given Index condition")
          return pgrec['rqstid']
 
+   def get_index_dsids(self, tname, fname, idxs, errmsg):
+      """Get dataset IDs for given integer indices of a request table.
+
+      Indices not cached in self.DSIDS yet are looked up with '= ANY(ARRAY[...])'
+      conditions in chunks of up to PGOPT['ANYLMT'] values.
+
+      Args:
+         tname: Table name, 'dsrqst' or 'rcrqst'.
+         fname: Integer index field name, 'rindex' or 'cindex'.
+         idxs: List of indices.
+         errmsg: Error message prefix for an index not in RDADB.
+
+      Returns:
+         List of dataset ID strings.
+      """
+      cache = self.DSIDS.setdefault(tname, {})
+      nidxs = list(set(int(idx) for idx in idxs if idx and int(idx) not in cache))
+      for i in range(0, len(nidxs), self.PGOPT['ANYLMT']):
+         astr = ','.join(map(str, nidxs[i:i+self.PGOPT['ANYLMT']]))
+         pgrecs = self.pgmget(tname, "{}, dsid".format(fname), "{} = ANY(ARRAY[{}])".format(fname, astr), self.PGOPT['extlog'])
+         if pgrecs: cache.update(zip(pgrecs[fname], pgrecs['dsid']))
+      dsids = [None]*len(idxs)
+      for i in range(len(idxs)):
+         idx = int(idxs[i]) if idxs[i] else 0
+         if idx not in cache: self.action_error("{} {} not in RDADB".format(errmsg, idxs[i]))
+         dsids[i] = cache[idx]
+      return dsids
+
    def get_request_dsids(self, ridxs):
       """Get dataset IDs for given request indices.
 
@@ -763,15 +876,8 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
       Returns:
          List of dataset ID strings.
       """
-      count = len(ridxs) if ridxs else 0
-      dsids = [None]*count
-      for i in range(count):
-         ridx = ridxs[i]
-         if i == 0 or (ridx != ridxs[i-1]):
-            pgrec = self.pgget("dsrqst", "dsid", "rindex = {}".format(ridx), self.PGOPT['extlog'])
-            if not pgrec: self.action_error("Request Index {} not in RDADB".format(ridx))
-         dsids[i] = pgrec['dsid']
-      return dsids
+      if not ridxs: return []
+      return self.get_index_dsids("dsrqst", "rindex", ridxs, "Request Index")
 
    def get_control_dsids(self, cidxs):
       """Get dataset IDs for given request control indices.
@@ -782,19 +888,15 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
       Returns:
          List of dataset ID strings.
       """
-      count = len(cidxs) if cidxs else 0
-      dsids = [None]*count
-      for i in range(count):
-         cidx = cidxs[i]
-         if i == 0 or (cidx != cidxs[i - 1]):
-            pgrec = self.pgget("rcrqst", "dsid", "cindex = {}".format(cidx), self.PGOPT['extlog'])
-            if not pgrec: self.action_error("Request Control Index {} not in RDADB".format(cidx)) 
-         dsids[i] = pgrec['dsid']
-      return dsids
+      if not cidxs: return []
+      return self.get_index_dsids("rcrqst", "cindex", cidxs, "Request Control Index")
 
    def fname2fid(self, files, dsids, stypes):
       """Convert file names to file IDs.
 
+      The names are grouped by dataset and looked up with one query per chunk
+      of names; found IDs are cached in self.FNAMES for the process.
+
       Args:
          files: List of file name strings.
          dsids: List of dataset IDs corresponding to each file.
@@ -804,21 +906,36 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
          List of integer file IDs.
       """
       count = len(files) if files else 0
-      fids = [0]*count   
+      fids = [0]*count
+      types = [None]*count
+      dfiles = {}
       for i in range(count):
-         file = files[i]
-         if not file: continue   # missing file name
-         dsid = dsids[i]
-         type = stypes[i]
+         if not files[i]: continue   # missing file name
+         type = stypes[i] if stypes else None
          if not type or type == 'W': type = 'D'
-         pgrec = self.pgget_wfile(dsid, 'wid', "wfile = '{}' AND type = '{}'".format(file, type), self.PGOPT['extlog'])
-         if not pgrec: self.action_error("wfile_{}-{}: Error find Source File".format(dsid, file))
-         fids[i] = pgrec['wid']
+         types[i] = type
+         cache = self.FNAMES.setdefault(dsids[i], {})
+         if (files[i], type) not in cache: dfiles.setdefault(dsids[i], set()).add(files[i])
+      for dsid in dfiles:
+         cache = self.FNAMES[dsid]
+         names = list(dfiles[dsid])
+         for i in range(0, len(names), self.PGOPT['ANYLMT']):
+            astr = ','.join("'{}'".format(name.replace("'", "''")) for name in names[i:i+self.PGOPT['ANYLMT']])
+            pgrecs = self.pgmget_wfile(dsid, 'wid, wfile, type', "wfile = ANY(ARRAY[{}])".format(astr), self.PGOPT['extlog'])
+            if pgrecs: cache.update(zip(zip(pgrecs['wfile'], pgrecs['type']), pgrecs['wid']))
+      for i in range(count):
+         if not files[i]: continue
+         key = (files[i], types[i])
+         if key not in self.FNAMES[dsids[i]]: self.action_error("wfile_{}-{}: Error find Source File".format(dsids[i], files[i]))
+         fids[i] = self.FNAMES[dsids[i]][key]
       return fids
 
    def fid2fname(self, fids, dsids, stypes):
       """Convert file IDs to file names.
 
+      The IDs are grouped by dataset and looked up with one query per chunk
+      of IDs; found names are cached in self.FIDS for the process.
+
       Args:
          fids: List of integer file IDs.
          dsids: List of dataset IDs corresponding to each file.
@@ -829,17 +946,98 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
       """
       count = len(fids) if fids else 0
       files = ['']*count
+      dfids = {}
       for i in range(count):
-         fid = fids[i]
-         if not fid: continue   # missing file id
-         stype = stypes[i] if stypes else ''
-         dsid = dsids[i]
-         condition = "wid = '{}'".format(fid)
-         pgrec = self.pgget_wfile(dsid, 'wfile', condition, self.PGOPT['extlog'])
-         if not pgrec: self.action_error("wfile_{}-{}: Error find Source File".format(dsid, fid))
-         files[i] = pgrec['wfile']
+         if not fids[i]: continue   # missing file id
+         cache = self.FIDS.setdefault(dsids[i], {})
+         if int(fids[i]) not in cache: dfids.setdefault(dsids[i], set()).add(int(fids[i]))
+      for dsid in dfids:
+         cache = self.FIDS[dsid]
+         wids = list(dfids[dsid])
+         for i in range(0, len(wids), self.PGOPT['ANYLMT']):
+            astr = ','.join(map(str, wids[i:i+self.PGOPT['ANYLMT']]))
+            pgrecs = self.pgmget_wfile(dsid, 'wid, wfile', "wid = ANY(ARRAY[{}])".format(astr), self.PGOPT['extlog'])
+            if pgrecs: cache.update(zip(pgrecs['wid'], pgrecs['wfile']))
+      for i in range(count):
+         if not fids[i]: continue
+         fid = int(fids[i])
+         if fid not in self.FIDS[dsids[i]]: self.action_error("wfile_{}-{}: Error find Source File".format(dsids[i], fid))
+         files[i] = self.FIDS[dsids[i]][fid]
       return files
 
+   def get_table_indices(self, tname, fname, idxs, logact = 0):
+      """Get the given integer indices that exist in a table.
+
+      The indices are looked up with '= ANY(ARRAY[...])' conditions in chunks of
+      up to PGOPT['ANYLMT'] values, instead of one query per index.
+
+      Args:
+         tname: Table name, e.g. 'dsrqst'.
+         fname: Integer index field name, e.g. 'rindex'.
+         idxs: Iterable of integer indices to look up.
+         logact: Logging action flags for the queries.
+
+      Returns:
+         Set of the indices found in the table.
+      """
+      idxs = sorted(set(int(idx) for idx in idxs))
+      found = set()
+      for i in range(0, len(idxs), self.PGOPT['ANYLMT']):
+         astr = ','.join(map(str, idxs[i:i+self.PGOPT['ANYLMT']]))
+         pgrecs = self.pgmget(tname, fname, "{} = ANY(ARRAY[{}])".format(fname, astr), logact)
+         if pgrecs: found.update(pgrecs[fname])
+      return found
+
+   def get_local_entries(self, dpath):
+      """Get the entries right under a local directory by os.scandir(), without stat'ing them.
+
+      Args:
+         dpath: Local directory path.
+
+      Returns:
+         Dictionary of entry name to True for a regular file or False otherwise;
+         empty if the directory is not accessible.
+      """
+      entries = {}
+      try:
+         with os.scandir(dpath) as dentries:
+            for entry in dentries:
+               try:
+                  entries[entry.name] = entry.is_file()
+               except OSError:
+                  continue
+      except OSError:
+         pass
+      return entries
+
+   def get_local_file_sizes(self, dpath, fnames):
+      """Get the sizes of local files under a directory without checking them one by one.
+
+      Files right under the directory are first matched against its entries
+      from get_local_entries(), so missing ones are not stat'ed; the files
+      found and those in sub-directories are stat'ed by a pool of threads.
+
+      Args:
+         dpath: Local directory path.
+         fnames: List of file names relative to dpath.
+
+      Returns:
+         Dictionary of file name to size in bytes for the files found.
+      """
+      entries = self.get_local_entries(dpath)
+      snames = [fname for fname in fnames if '/' in fname or entries.get(fname)]
+      sizes = {}
+      if snames:
+         def stat_one(fname):
+            try:
+               return os.stat(op.join(dpath, fname)).st_size
+            except OSError:
+               return None
+         with ThreadPoolExecutor(max_workers = min(self.PGOPT['DLTHRD'], len(snames))) as pool:
+            for (fname, size) in zip(snames, pool.map(stat_one, snames)):
+               if size is not None: sizes[fname] = size
+      return sizes
+
    def get_file_path(self, fname, dpath, rtpath, opt = 0):
       """Get WEB file path for given dataset and file name.
 
@@ -869,6 +1067,96 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
          fname = self.join_paths(rtpath, dpath)
       return fname
 
+   def delete_local_paths(self, paths, logact = 0):
+      """Delete local files and directories in process with a pool of unlink threads.
+
+      Directories are walked with os.scandir(), all files found are unlinked
+      concurrently and the emptied directories are then removed deepest first.
+      Paths vanishing in the middle, such as ones removed by another process,
+      are skipped quietly.
+
+      Args:
+         paths: A file/directory path string, or a list of them.
+         logact: Logging action flags for paths that cannot be deleted.
+
+      Returns:
+         Tuple (fcnt, fsize) of the number of files deleted and their total size in bytes.
+      """
+      if isinstance(paths, str): paths = [paths]
+      files = []
+      dirs = []
+      errmsgs = []
+      for path in paths:
+         try:
+            if op.isdir(path) and not op.islink(path):
+               self.scan_local_paths(path, files, dirs, errmsgs)
+            else:
+               files.append([path, os.lstat(path).st_size])
+         except FileNotFoundError:
+            continue
+         except OSError as e:
+            errmsgs.append("{}: {}".format(path, e.strerror))
+      fcnt = fsize = 0
+      fnum = len(files)
+      if fnum > 0:
+         def unlink_one(finfo):
+            try:
+               os.unlink(finfo[0])
+               return (finfo[1], None)
+            except FileNotFoundError:
+               return (None, None)
+            except OSError as e:
+               return (None, "{}: {}".format(finfo[0], e.strerror))
+         tcnt = min(self.PGOPT['DLTHRD'], fnum)
+         with ThreadPoolExecutor(max_workers = tcnt) as pool:
+            for (size, errmsg) in pool.map(unlink_one, files):
+               if size is not None:
+                  fcnt += 1
+                  fsize += size
+               elif errmsg:
+                  errmsgs.append(errmsg)
+      for dpath in reversed(dirs):   # children are always listed after their parents
+         try:
+            os.rmdir(dpath)
+         except FileNotFoundError:
+            continue
+         except OSError as e:
+            errmsgs.append("{}: {}".format(dpath, e.strerror))
+      for errmsg in errmsgs:
+         self.pglog(errmsg, logact)
+
+      return (fcnt, fsize)
+
+   def scan_local_paths(self, dpath, files, dirs, errmsgs):
+      """Gather files and sub-directories under a local directory with os.scandir().
+
+      Args:
+         dpath: Directory path to scan.
+         files: List to append [file, size] pairs to.
+         dirs: List to append directory paths to, each parent before its children.
+         errmsgs: List to append error messages to.
+      """
+      dstack = [dpath]
+      while dstack:
+         dpath = dstack.pop()
+         dirs.append(dpath)
+         try:
+            with os.scandir(dpath) as entries:
+               for entry in entries:
+                  try:
+                     if entry.is_dir(follow_symlinks = False):
+                        dstack.append(entry.path)
+                     else:
+                        files.append([entry.path, entry.stat(follow_symlinks = False).st_size])
+                  except FileNotFoundError:
+                     continue
+                  except OSError as e:
+                     errmsgs.append("{}: {}".format(entry.path, e.strerror))
+         except FileNotFoundError:
+            continue
+         except OSError as e:
+            errmsgs.append("{}: {}".format(dpath, e.strerror))
+
    def request_limit(self):
       """Check if enough disk space is allowed for the request.
 
@@ -1386,6 +1674,54 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
       if rstat not in RSTATUS: rstat = 'U'
       return RSTATUS[rstat]
 
+   def get_control_record(self, dsid, gindex, rtype, logact, anygroup = 0):
+      """Get the request control record for a dataset group and request type.
+
+      The group chain is walked up through dsgroup until a group has a control
+      record. Found and missing records are cached in self.RCNTLS for
+      PGOPT['RCTTL'] seconds, so the chain is resolved once for all requests
+      of the same dataset group and type.
+
+      Args:
+         dsid: Dataset ID string.
+         gindex: Group index (0 if no group).
+         rtype: Request type character; 'S' and 'T' share control records.
+         logact: Logging action flag.
+         anygroup: If nonzero and gindex is 0, fall back to the control record
+                   of any group in the dataset.
+
+      Returns:
+         A copy of the control record dictionary, or None if not found.
+      """
+      subset = (rtype == 'S' or rtype == 'T')
+      key = (dsid, gindex, 'ST' if subset else rtype, anygroup)
+      cache = self.RCNTLS.get(key)
+      if cache and time.time() - cache[0] < self.PGOPT['RCTTL']:
+         return dict(cache[1]) if cache[1] else None
+      if subset:
+         tcnd = " AND (rqsttype = 'T' OR rqsttype = 'S')"
+         ocnd = " ORDER BY rqsttype DESC"
+      else:
+         tcnd = " AND rqsttype = '{}'".format(rtype)
+         ocnd = ""
+      gidx = gindex
+      while True:
+         gcnd = "dsid = '{}' AND gindex = {}".format(dsid, gidx)
+         pgctl = self.pgget("rcrqst", "*", gcnd + tcnd + ocnd, logact)
+         if pgctl or not gidx: break
+         pgrec = self.pgget("dsgroup", "pindex", gcnd, logact)
+         if not pgrec: break
+         gidx = pgrec['pindex']
+      if not pgctl and anygroup and not gindex:
+         ocnd = (ocnd + ", gindex") if ocnd else " ORDER BY gindex"
+         pgctl = self.pgget("rcrqst", "*", "dsid = '{}'{}{}".format(dsid, tcnd, ocnd), logact)
+      self.RCNTLS[key] = [time.time(), pgctl]
+      return dict(pgctl) if pgctl else None
+
+   def clear_control_cache(self):
+      """Clear the cached request control records after request controls are changed."""
+      self.RCNTLS = {}
+
    def cache_request_control(self, ridx, pgrqst, action, pidx = 0):
       """Cache request control information for a request.
 
@@ -1407,20 +1743,7 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
       pgrec = self.PGOPT['RCNTL'] = None
       rtype = pgrqst['rqsttype']
       if rtype != 'C':
-         gcnd = "dsid = '{}' AND gindex = ".format(pgrqst['dsid'])
-         if rtype in "ST":
-            tcnd = " AND (rqsttype = 'T' OR rqsttype = 'S')"
-         else:
-            tcnd = " AND rqsttype = '{}'".format(rtype)
-         gindex = pgrqst['gindex']
-         while True:
-            pgrec = self.pgget("rcrqst", "*", "{}{}{}".format(gcnd, gindex, tcnd), self.PGOPT['errlog'])
-            if not pgrec and gindex > 0:
-               pgrec = self.pgget("dsgroup", "pindex", "{}{}".format(gcnd, gindex), self.PGOPT['errlog'])
-               if pgrec:
-                  gindex = pgrec['pindex']
-                  continue
-            break
+         pgrec = self.get_control_record(pgrqst['dsid'], pgrqst['gindex'], rtype, self.PGOPT['errlog'])
       if not pgrec:
          pgrec = self.pgtable('rcrqst', self.PGOPT['extlog'])
          pgrec['rqsttype'] = rtype
@@ -1461,6 +1784,424 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
       tcolors = ("#CDBCDC", "#DFD8F8", "#EAEAFC", "#F8F6FE", "#E0C8B1")
       return tcolors[idx]
 
+   def add_request_pcount(self, ridx, fcnt = 1, size = 0, dscheck = 0, flush = False):
+      """Count processed files into the progress counter dsrqst.pcount of a request.
+
+      The counts are coalesced in memory and written at most every PGOPT['PCINTV']
+      seconds, or when flushed, so the status queries can read the progress
+      instead of counting file records.
+
+      Args:
+         ridx: Request index.
+         fcnt: Number of files processed.
+         size: Total size of the files processed, in bytes.
+         dscheck: If nonzero, also add the counts to the dscheck record.
+         flush: If True, write the unwritten counts now.
+      """
+      pcnt = self.PCOUNTS.get(ridx)
+      if pcnt is None: self.PCOUNTS[ridx] = pcnt = [0, 0, time.time()]
+      pcnt[0] += fcnt
+      pcnt[1] += size
+      ntime = time.time()
+      if pcnt[0] and (flush or (ntime - pcnt[2]) >= self.PGOPT['PCINTV']):
+         self.pgexec("UPDATE dsrqst SET pcount = COALESCE(pcount, 0) + {} WHERE rindex = {}".format(pcnt[0], ridx), self.PGOPT['extlog'])
+         if dscheck and self.PGLOG['DSCHECK']: self.add_dscheck_dcount(pcnt[0], pcnt[1], self.PGOPT['errlog'])
+         pcnt[0] = pcnt[1] = 0
+         pcnt[2] = ntime
+
+   def reset_request_pcount(self, ridx, cnd, pgrqst):
+      """Reset the progress counter dsrqst.pcount of a request before it is (re)built.
+
+      Args:
+         ridx: Request index.
+         cnd: SQL condition string for the request.
+         pgrqst: Request record dictionary, updated in place.
+      """
+      self.PCOUNTS.pop(ridx, None)
+      if pgrqst.get('pcount') != 0 and self.pgexec("UPDATE dsrqst SET pcount = 0 WHERE " + cnd, self.PGOPT['extlog']):
+         pgrqst['pcount'] = 0
+
+   def add_staged_metrics(self, fname, idx):
+      """Count the online files of a built request or partition into the staged metrics.
+
+      The counts are read from wfrqst at the end of a build, so files staged by
+      a called command are counted the same way as those staged by dsrqst.
+
+      Args:
+         fname: Index field name, 'rindex' or 'pindex'.
+         idx: Request or partition index.
+      """
+      fstat = self.get_online_file_stats(fname, [idx]).get(idx)
+      if not fstat: return
+      self.add_metric('dsrqst_files_staged_total', fstat[0])
+      if fstat[1]: self.add_metric('dsrqst_bytes_staged_total', fstat[1])
+
+   def add_metric(self, name, val = 1, label = ''):
+      """Increase a counter metric of the current process.
+
+      Args:
+         name: Metric name defined in self.MTDEFS.
+         val: Value to add (default 1).
+         label: Prometheus label string, e.g. 'type="command"'.
+      """
+      mets = self.METRICS.setdefault(name, {})
+      mets[label] = mets.get(label, 0) + val
+
+   def observe_metric(self, name, val, label = ''):
+      """Record an observed value into a histogram metric of the current process.
+
+      A histogram is kept as a list of the cumulative counts of buckets
+      PGOPT['MTBKTS'], followed by the total count and the sum of values.
+
+      Args:
+         name: Metric name defined in self.MTDEFS.
+         val: Observed value, in seconds.
+         label: Prometheus label string, e.g. 'action="BR"'.
+      """
+      mets = self.METRICS.setdefault(name, {})
+      bkts = self.PGOPT['MTBKTS']
+      hist = mets.get(label)
+      if hist is None: mets[label] = hist = [0]*(len(bkts) + 2)
+      for i in range(len(bkts)):
+         if val <= bkts[i]: hist[i] += 1
+      hist[-2] += 1
+      hist[-1] += val
+
+   def save_metrics(self):
+      """Merge the metrics of the current process into the shared metrics state file.
+
+      The state file PGOPT['MTFILE'] under PGLOG['LOGPATH'] is locked while the
+      metrics are merged, so the counts of all dsrqst processes accumulate. If
+      option -ME gives a file name, the Prometheus text file is rewritten too.
+      """
+      if not self.METRICS: return
+      mfile = self.join_paths(self.PGLOG['LOGPATH'], self.PGOPT['MTFILE'])
+      try:
+         with open(mfile, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            buf = f.read()
+            mets = json.loads(buf) if buf else {}
+            for name in self.METRICS:
+               smets = mets.setdefault(name, {})
+               for label, val in self.METRICS[name].items():
+                  sval = smets.get(label)
+                  if isinstance(val, list):
+                     smets[label] = [sval[i] + val[i] for i in range(len(val))] if sval and len(sval) == len(val) else val
+                  else:
+                     smets[label] = (sval if sval else 0) + val
+            f.seek(0)
+            f.truncate()
+            json.dump(mets, f)
+      except (OSError, ValueError) as e:
+         return self.pglog("{}: Error save metrics, {}".format(mfile, e), self.PGOPT['wrnlog'])
+      self.METRICS = {}
+      if 'ME' in self.params and not self.metrics_address():
+         tfile = self.params['ME'] + ".tmp"
+         with open(tfile, 'w') as f:
+            f.write(self.format_metrics(mets))
+         os.replace(tfile, self.params['ME'])
+
+   def load_metrics(self):
+      """Read the accumulated metrics from the shared metrics state file.
+
+      Returns:
+         Dictionary of metric name to {label string: value}.
+      """
+      mfile = self.join_paths(self.PGLOG['LOGPATH'], self.PGOPT['MTFILE'])
+      try:
+         with open(mfile, 'r') as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            buf = f.read()
+         return json.loads(buf) if buf else {}
+      except (OSError, ValueError):
+         return {}
+
+   def format_metrics(self, mets):
+      """Format metrics in the Prometheus text exposition format.
+
+      Args:
+         mets: Dictionary of metric name to {label string: value}.
+
+      Returns:
+         Metrics text string.
+      """
+      bkts = self.PGOPT['MTBKTS']
+      lines = []
+      for name in sorted(mets):
+         (mtype, mhelp) = self.MTDEFS[name] if name in self.MTDEFS else ['untyped', name]
+         lines.append("# HELP {} {}".format(name, mhelp))
+         lines.append("# TYPE {} {}".format(name, mtype))
+         for label in sorted(mets[name]):
+            val = mets[name][label]
+            if isinstance(val, list):
+               sep = ',' if label else ''
+               for i in range(len(bkts)):
+                  lines.append('{}_bucket{{{}{}le="{}"}} {}'.format(name, label, sep, bkts[i], val[i]))
+               lines.append('{}_bucket{{{}{}le="+Inf"}} {}'.format(name, label, sep, val[-2]))
+               lines.append("{}_count{} {}".format(name, "{{{}}}".format(label) if label else '', val[-2]))
+               lines.append("{}_sum{} {}".format(name, "{{{}}}".format(label) if label else '', val[-1]))
+            else:
+               lines.append("{}{} {}".format(name, "{{{}}}".format(label) if label else '', val))
+      return "\n".join(lines) + "\n"
+
+   def metrics_address(self):
+      """Get the local HTTP address given by option -ME as [host]:port.
+
+      Returns:
+         Tuple of (host, port), or None if -ME gives a file name.
+      """
+      ms = re.match(r'^([\w\.\-]*):(\d+)$', self.params['ME']) if 'ME' in self.params else None
+      if not ms: return None
+      return (ms.group(1) if ms.group(1) else 'localhost', int(ms.group(2)))
+
+   def start_metrics_server(self):
+      """Serve the accumulated metrics over HTTP at the address given by option -ME.
+
+      The server runs in a daemon thread of the current process, so it is
+      meant for the long running dsrqst daemon modes.
+      """
+      addr = self.metrics_address()
+      if not addr: return
+      rqst = self
+      class MetricsHandler(BaseHTTPRequestHandler):
+         def do_GET(self):
+            buf = rqst.format_metrics(rqst.load_metrics()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(buf)))
+            self.end_headers()
+            self.wfile.write(buf)
+         def log_message(self, format, *args):
+            pass
+      try:
+         server = ThreadingHTTPServer(addr, MetricsHandler)
+      except OSError as e:
+         return self.pglog("{}:{}: Cannot serve metrics, {}".format(addr[0], addr[1], e), self.PGOPT['errlog'])
+      threading.Thread(target = server.serve_forever, daemon = True).start()
+      self.pglog("Metrics served at http://{}:{}/metrics".format(addr[0], addr[1]), self.PGOPT['wrnlog'])
+
+   def add_phase_time(self, phase, stime):
+      """Add the seconds since a start time into a phase of the current build.
+
+      Args:
+         phase: Phase name, e.g. 'command', 'tar' or 'db'.
+         stime: Start time of the phase, from time.time().
+
+      Returns:
+         Seconds added.
+      """
+      secs = time.time() - stime
+      self.PHASES[phase] = self.PHASES.get(phase, 0) + secs
+      return secs
+
+   def save_phase_times(self, tname, cnd, pgrec):
+      """Add the phase times of the current build into field phasetime of a request or partition.
+
+      The phase times of the build are always logged. They accumulate over
+      rebuilds in field phasetime, like field exectime, if the table has it;
+      add it with 'ALTER TABLE {dsrqst|ptrqst} ADD COLUMN phasetime text'.
+
+      Args:
+         tname: Table name, 'dsrqst' or 'ptrqst'.
+         cnd: SQL condition string of the record.
+         pgrec: Request or partition record dictionary read before the build.
+      """
+      if not self.PHASES: return
+      phases = sorted(self.PHASES, key = lambda p: self.PHASES[p], reverse = True)
+      self.pglog("{} {}: build phase times {}".format(tname, cnd, ' '.join("{}={:.1f}s".format(p, self.PHASES[p]) for p in phases)), self.LOGWRN)
+      if 'phasetime' not in pgrec:
+         self.PHASES = {}
+         return
+      ptimes = pgrec['phasetime']
+      if isinstance(ptimes, str): ptimes = json.loads(ptimes) if ptimes else None
+      if not ptimes: ptimes = {}
+      for phase in self.PHASES:
+         ptimes[phase] = round(ptimes.get(phase, 0) + self.PHASES[phase], 3)
+      self.pgexec("UPDATE {} SET phasetime = '{}' WHERE {}".format(tname, json.dumps(ptimes), cnd), self.PGOPT['errlog'])
+      pgrec['phasetime'] = ptimes
+      self.PHASES = {}
+
+   def phase_time_hash(self, hash):
+      """Get a copy of a table hash with field '#' added for the phase times of option -PT.
+
+      Args:
+         hash: Table hash of dsrqst or ptrqst.
+
+      Returns:
+         Table hash including field '#'.
+      """
+      hash = dict(hash)
+      hash['#'] = ['PT', "phasetime", -1]
+      return hash
+
+   def set_phase_times(self, pgrecs):
+      """Replace the phase time values in records with readable strings, longest phase first.
+
+      Args:
+         pgrecs: Multiple records dictionary of dsrqst or ptrqst.
+      """
+      cnt = len(next(iter(pgrecs.values()))) if pgrecs else 0
+      ptimes = pgrecs['phasetime'] if 'phasetime' in pgrecs else [None]*cnt
+      pstrs = ['']*cnt
+      for i in range(cnt):
+         ptime = ptimes[i]
+         if not ptime: continue
+         if isinstance(ptime, str): ptime = json.loads(ptime)
+         phases = sorted(ptime, key = lambda p: ptime[p], reverse = True)
+         pstrs[i] = ' '.join("{}={:.1f}s".format(p, ptime[p]) for p in phases)
+      pgrecs['phasetime'] = pstrs
+
+   def pgsystem(self, pgcmd, logact = None, cmdopt = 5, instr = None, seconds = 0):
+      """Run a system command, tracing it into the JSON lines file of option -TL if given.
+
+      Each traced command writes one line with the request and partition
+      indices in self.TRACEIDS, the wall time, the user and system CPU time
+      of the command from the rusage deltas of the child processes, the
+      peak RSS if the command raised the peak of all children so far, and
+      if the command succeeded. A command run with cmdopt&16 returns its
+      output instead of its status, so its exit code is caught from the
+      subprocess to tell the success.
+
+      Args:
+         pgcmd: Command string or list.
+         logact: Logging action flags.
+         cmdopt: Command option bits, see PgLOG.pgsystem().
+         instr: String fed to the command via stdin.
+         seconds: Timeout in seconds, 0 for no timeout.
+
+      Returns:
+         Same as PgLOG.pgsystem().
+      """
+      if 'TL' not in self.params or not pgcmd:
+         return super().pgsystem(pgcmd, logact, cmdopt, instr, seconds)
+      stime = time.time()
+      bru = resource.getrusage(resource.RUSAGE_CHILDREN)
+      if cmdopt&16:
+         rcodes = []   # exit codes of the command tries
+         class StatusPopen(subprocess.Popen):
+            def communicate(self, *args, **kwargs):
+               try:
+                  return super().communicate(*args, **kwargs)
+               finally:
+                  rcodes.append(self.returncode)
+         popen = pg_log.Popen
+         pg_log.Popen = StatusPopen
+         try:
+            ret = super().pgsystem(pgcmd, logact, cmdopt, instr, seconds)
+         finally:
+            pg_log.Popen = popen
+         success = True if rcodes and rcodes[-1] == 0 else False
+      else:
+         ret = super().pgsystem(pgcmd, logact, cmdopt, instr, seconds)
+         success = (ret == self.SUCCESS)
+      eru = resource.getrusage(resource.RUSAGE_CHILDREN)
+      span = {
+         'time' : round(stime, 3),
+         'host' : self.PGLOG['HOSTNAME'],
+         'pid' : os.getpid(),
+         'action' : self.PGOPT['CACT'],
+         'rindex' : self.TRACEIDS[0],
+         'pindex' : self.TRACEIDS[1],
+         'command' : pgcmd if isinstance(pgcmd, str) else shlex.join(pgcmd),
+         'wall' : round(time.time() - stime, 3),
+         'utime' : round(eru.ru_utime - bru.ru_utime, 3),
+         'stime' : round(eru.ru_stime - bru.ru_stime, 3),
+         'maxrss' : eru.ru_maxrss if eru.ru_maxrss > bru.ru_maxrss else None,   # in KB
+         'success' : success
+      }
+      try:
+         with open(self.params['TL'], 'a') as f:
+            f.write(json.dumps(span) + "\n")
+      except OSError as e:
+         self.pglog("{}: Error write trace, {}".format(self.params['TL'], e), self.PGOPT['wrnlog'])
+      return ret
+
+   def profile_actions(self, func):
+      """Run an action function under cProfile, counting the RDADB calls per call site.
+
+      The profile is dumped into a .prof file under PGLOG['LOGPATH'], and a
+      text summary of the top functions by cumulative time and of the RDADB
+      calls by call site is written next to it, even if the action exits.
+      A forked child process, such as a purge child, saves its own profile
+      files named by its process ID.
+
+      Args:
+         func: Action function to profile, such as start_actions.
+      """
+      self.DBSITES = {}
+      pdir = op.dirname(op.abspath(__file__))
+      for fname in ("pgget", "pgmget", "pgadd", "pgupdt", "pgdel", "pgexec"):
+         setattr(self, fname, self.db_call_counter(fname, getattr(self, fname), pdir))
+      prof = cProfile.Profile()
+      prof.enable()
+      try:
+         func()
+      finally:
+         prof.disable()
+         self.save_profile(prof)
+
+   def db_call_counter(self, fname, func, pdir):
+      """Wrap one RDADB access function to count its calls and seconds in self.DBSITES.
+
+      A call site is the line in this package, with its method, that calls the
+      function directly or through a common library function; calls nested in
+      another counted call are not counted again.
+
+      Args:
+         fname: Name of the access function, e.g. 'pgget'.
+         func: The bound access function.
+         pdir: Directory of this package.
+
+      Returns:
+         The counting function.
+      """
+      def counter(*args, **kwargs):
+         if self.DBDEPTH: return func(*args, **kwargs)
+         frame = sys._getframe(1)
+         while frame and op.dirname(frame.f_code.co_filename) != pdir: frame = frame.f_back
+         if frame:
+            site = "{}:{} {}() {}".format(op.basename(frame.f_code.co_filename), frame.f_lineno, frame.f_code.co_name, fname)
+         else:
+            site = fname
+         stime = time.time()
+         self.DBDEPTH += 1
+         try:
+            return func(*args, **kwargs)
+         finally:
+            self.DBDEPTH -= 1
+            rec = self.DBSITES.setdefault(site, [0, 0])
+            rec[0] += 1
+            rec[1] += time.time() - stime
+      return counter
+
+   def save_profile(self, prof):
+      """Dump a profile into dsrqst_<action>_<pid>.prof and its summary into a .txt file.
+
+      The file names are built from the ID of the current process, so the
+      profile of a forked child does not overwrite the one of its parent.
+
+      Args:
+         prof: The cProfile.Profile of the action.
+      """
+      pfile = self.join_paths(self.PGLOG['LOGPATH'], "dsrqst_{}_{}".format(self.PGOPT['CACT'], os.getpid()))
+      cnt = self.params['PA'] if self.params['PA'] else self.PGOPT['PFTOP']
+      buf = io.StringIO()
+      buf.write("Profile of dsrqst {} by {} in process {} at {}\n".format(self.PGOPT['CACT'], self.PGLOG['CURUID'], os.getpid(), self.curtime(1)))
+      pstats.Stats(prof, stream = buf).sort_stats('cumulative').print_stats(cnt)
+      dbcnt = sum(rec[0] for rec in self.DBSITES.values())
+      buf.write("{} RDADB calls from {} call sites:\n".format(dbcnt, len(self.DBSITES)))
+      buf.write("{:>8} {:>10}  {}\n".format("calls", "seconds", "call site"))
+      for site, rec in sorted(self.DBSITES.items(), key = lambda item: -item[1][0]):
+         buf.write("{:>8} {:>10.3f}  {}\n".format(rec[0], rec[1], site))
+      try:
+         prof.dump_stats(pfile + ".prof")
+         with open(pfile + ".txt", 'w') as f:
+            f.write(buf.getvalue())
+      except OSError as e:
+         return self.pglog("{}: Error save profile, {}".format(pfile, e), self.PGOPT['wrnlog'])
+      self.pglog("Profile saved in {}.prof, summary in {}.txt".format(pfile, pfile), self.PGOPT['wrnlog'])
+
    def add_request_id(self, ridx, email, updtdb = 0):
       """Generate a unique request ID from user last name and request index.
 
@@ -1478,9 +2219,308 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
       if updtdb: self.pgexec("UPDATE dsrqst SET rqstid = '{}' WHERE rindex = {}".format(rqstid, ridx), self.PGOPT['extlog'])
       return rqstid
 
+   def add_request_with_id(self, record, lname, logact):
+      """Add a dsrqst record with its request ID set from the new request index.
+
+      The index is taken from the rindex sequence inside the INSERT statement
+      and rqstid is built from it in the same statement, so concurrent
+      submissions neither scan for MAX(rindex) nor update rqstid afterwards.
+
+      Args:
+         record: Request record dictionary to insert; any rindex and rqstid
+                 in it are ignored, as both are set from the new index.
+         lname: Upper-cased user last name to prefix the request ID.
+         logact: Logging action flag, with DODFLT to fill empty values with defaults.
+
+      Returns:
+         New request index on success, or FAILURE (0) on error.
+      """
+      record = {fld: record[fld] for fld in record if fld != 'rindex' and fld != 'rqstid'}
+      if logact&self.DODFLT: self.prepare_default("dsrqst", record, logact)
+      flds = list(record)
+      sqlstr = ("WITH s AS (SELECT nextval(pg_get_serial_sequence('dsrqst', 'rindex')) AS n) " +
+                "INSERT INTO dsrqst (rindex, rqstid, {}) ".format(', '.join(flds)) +
+                "SELECT n, concat(%s::text, n){} FROM s RETURNING rindex".format(', %s'*len(flds)))
+      values = tuple([lname] + list(record.values()))
+      if self.PGLOG['DBGLEVEL']: self.pgdbg(1000, "Insert: " + str(values))
+      ridx = pgcnt = 0
+      while True:
+         pgcur = self.pgcursor()
+         if not pgcur: return self.FAILURE
+         try:
+            pgcur.execute(sqlstr, values)
+            ridx = pgcur.fetchone()[0]
+            pgcur.close()
+         except PgSQL.Error as pgerr:
+            if not self.check_dberror(pgerr, pgcnt, sqlstr, values, logact): return self.FAILURE
+         else:
+            break
+         pgcnt += 1
+      if logact&self.ENDLCK:
+         self.endtran()
+      elif self.curtran:
+         self.curtran += 1
+         if self.curtran > self.PGDBI['MTRANS']: self.starttran()
+      return ridx
+
+   def has_request_fingerprint(self):
+      """Check if table dsrqst has the indexed field rhash for request fingerprints.
+
+      Returns:
+         True if field rhash exists, False otherwise.
+      """
+      if self.RHASH is None:
+         table = self.pgtable("dsrqst", self.PGOPT['extlog'])
+         self.RHASH = True if table and 'rhash' in table else False
+      return self.RHASH
+
+   def request_fingerprint(self, pgrqst):
+      """Build a fingerprint of a subset request from its normalized request information.
+
+      The 'key=value' pairs of rinfo are stripped and sorted, so the same subset
+      requested with a different parameter ordering gets the same fingerprint.
+      The email address is not included, so the fingerprint also finds the same
+      subset requested by other users.
+
+      Args:
+         pgrqst: Request record dictionary with dsid, gindex, rqsttype and rinfo.
+
+      Returns:
+         SHA-256 hex digest string, or None if the request has no rinfo.
+      """
+      rinfo = pgrqst['rinfo'] if 'rinfo' in pgrqst else None
+      if not rinfo: return None
+      items = sorted(' '.join(item.split()) for item in rinfo.split(';') if item.strip())
+      rstr = "{}|{}|{}|{}".format(pgrqst['dsid'], pgrqst.get('gindex') or 0, pgrqst.get('rqsttype') or '', ';'.join(items))
+      return hashlib.sha256(rstr.encode()).hexdigest()
+
+   def outbox_path(self):
+      """Get the email outbox directory, relative to PGLOG['RQSTHOME'] if not absolute.
+
+      Returns:
+         Outbox directory path if it exists, None otherwise to send emails directly.
+      """
+      obox = self.PGOPT['OUTBOX']
+      if not obox: return None
+      if obox[0] != '/': obox = "{}/{}".format(self.PGLOG['RQSTHOME'], obox)
+      return obox if op.isdir(obox) else None
+
+   def queue_email(self, emlmsg, logact):
+      """Write an email message into the outbox for the sender to deliver later.
+
+      The message is written to a temporary file and renamed, so the sender
+      never picks up a partially written message.
+
+      Args:
+         emlmsg: EmailMessage object with From, To, Cc and Subject set.
+         logact: Logging action flag.
+
+      Returns:
+         SUCCESS if queued, FAILURE if there is no outbox or writing fails.
+      """
+      obox = self.outbox_path()
+      if not obox: return self.FAILURE
+      efile = "{}/{}_{}.eml".format(obox, time.time_ns(), os.getpid())
+      try:
+         with open(efile + ".tmp", 'wb') as ef:
+            ef.write(emlmsg.as_bytes())
+            ef.flush()
+            os.fsync(ef.fileno())
+         os.rename(efile + ".tmp", efile)
+      except OSError as e:
+         self.pglog("{}: Error queue email to {}\n{}".format(efile, emlmsg['To'], str(e)), (logact|self.ERRLOG)&~self.EXITLG)
+         return self.FAILURE
+      self.pglog("Email {} queued, Subject: {}".format(emlmsg['To'], emlmsg['Subject']), logact&~self.EXITLG)
+      return self.SUCCESS
+
+   def send_customized_email(self, logmsg, emlmsg, logact = None):
+      """Queue a customized email into the outbox, or send it directly if there is no outbox.
+
+      Args:
+         logmsg: Prefix string for log messages.
+         emlmsg: Email text with embedded From, To, Cc and Subject lines.
+         logact: Logging action flag.
+
+      Returns:
+         SUCCESS on success, FAILURE on error.
+      """
+      if logact is None: logact = self.LOGWRN
+      if self.outbox_path():
+         msg = emlmsg
+         heads = {}
+         for entry in ("From", "To", "Cc", "Subject"):
+            ms = re.search(r'(^|\n)({}: *(.*)\n)'.format(entry), msg, re.I)
+            if not ms: continue
+            msg = msg[:ms.start(2)] + msg[ms.end(2):]
+            if ms.group(3): heads[entry] = ms.group(3)
+         if 'From' in heads and 'To' in heads and 'Subject' in heads and msg.strip():
+            eml = EmailMessage()
+            eml.set_content(msg)
+            for entry in heads: eml[entry] = heads[entry]
+            if self.queue_email(eml, logact): return self.SUCCESS
+      return super().send_customized_email(logmsg, emlmsg, logact)
+
+   def send_outbox_emails(self, logact):
+      """Send the queued outbox emails in one batch over one SMTP connection.
+
+      Each message is claimed first by renaming it to a work name with the
+      host name and PID of the sender, so concurrent senders never send the
+      same message. A message is removed once sent, and moved into the
+      subdirectory failed/ if the mail server rejects it with a 5xx reply.
+      Other errors are retried up to PGOPT['OBTRY'] times before the message
+      is put back in the outbox for the next batch; the batch stops there if
+      the mail server cannot be reached.
+
+      Args:
+         logact: Logging action flag.
+
+      Returns:
+         Number of emails sent.
+      """
+      obox = self.outbox_path()
+      if not obox: return 0
+      self.reclaim_outbox_emails(obox, logact)
+      efiles = sorted(f for f in os.listdir(obox) if f.endswith(".eml"))[:self.PGOPT['OBMAX']]
+      smtp = None
+      scnt = fcnt = 0
+      for efile in efiles:
+         epath = "{}/{}".format(obox, efile)
+         wpath = "{}.{}.{}".format(epath, self.PGLOG['HOSTNAME'], os.getpid())
+         try:
+            os.rename(epath, wpath)
+         except OSError:
+            continue     # claimed by another sender
+         try:
+            with open(wpath, 'rb') as ef:
+               emlmsg = message_from_bytes(ef.read(), policy = policy.default)
+         except OSError as e:
+            self.pglog("{}: Error read queued email\n{}".format(wpath, str(e)), (logact|self.ERRLOG)&~self.EXITLG)
+            continue
+         sent = False
+         for i in range(self.PGOPT['OBTRY']):
+            code = 0
+            try:
+               if not smtp: smtp = smtplib.SMTP(self.PGLOG['EMLSRVR'], self.PGLOG['EMLPORT'], timeout = 60)
+               smtp.send_message(emlmsg)
+               sent = True
+               break
+            except smtplib.SMTPRecipientsRefused as e:
+               err = e
+               code = min(rcpt[0] for rcpt in e.recipients.values()) if e.recipients else 0
+            except smtplib.SMTPResponseException as e:
+               err = e
+               code = e.smtp_code
+            except (smtplib.SMTPException, OSError) as e:
+               err = e
+            if code >= 500: break
+            if not code and smtp:
+               try:
+                  smtp.close()
+               except Exception:
+                  pass
+               smtp = None
+         if sent:
+            os.remove(wpath)
+            scnt += 1
+         elif code >= 500:
+            self.make_local_directory(obox + "/failed", logact)
+            os.rename(wpath, "{}/failed/{}".format(obox, efile))
+            self.pglog("{}: Email {} rejected, moved to {}/failed\n{}".format(efile, emlmsg['To'], obox, str(err)), (logact|self.ERRLOG)&~self.EXITLG)
+            fcnt += 1
+         else:
+            os.rename(wpath, epath)
+            self.pglog("{}: Error send email to {}, retry later\n{}".format(efile, emlmsg['To'], str(err)), (logact|self.ERRLOG)&~self.EXITLG)
+            if not code: break   # mail server not reachable
+      if smtp:
+         try:
+            smtp.quit()
+         except Exception:
+            pass
+      if scnt or fcnt:
+         s = 's' if scnt > 1 else ''
+         self.pglog("{} queued email{} sent, {} rejected".format(scnt, s, fcnt), logact&~self.EXITLG)
+      return scnt
+
+   def reclaim_outbox_emails(self, obox, logact):
+      """Put back into the outbox the emails claimed by senders on this host that are gone.
+
+      Args:
+         obox: Outbox directory path.
+         logact: Logging action flag.
+
+      Returns:
+         Number of emails put back.
+      """
+      rcnt = 0
+      for wfile in os.listdir(obox):
+         ms = re.match(r'^(\d+_\d+\.eml)\.(.+)\.(\d+)$', wfile)
+         if not ms or ms.group(2) != self.PGLOG['HOSTNAME']: continue
+         pid = int(ms.group(3))
+         if pid == os.getpid() or self.check_process(pid): continue
+         try:
+            os.rename("{}/{}".format(obox, wfile), "{}/{}".format(obox, ms.group(1)))
+            rcnt += 1
+         except OSError:
+            continue
+      if rcnt:
+         s = 's' if rcnt > 1 else ''
+         self.pglog("{} email{} claimed by stopped senders put back to {}".format(rcnt, s, obox), logact&~self.EXITLG)
+      return rcnt
+
+   def get_status_dschecks(self, oidxs, otype):
+      """Get the dscheck records of dsrqst processes for multiple requests or partitions.
+
+      Args:
+         oidxs: List of request or partition indices.
+         otype: 'P' for partitions; requests otherwise.
+
+      Returns:
+         Dictionary of index to its dscheck record; the first one found if
+         more than one.
+      """
+      ckrecs = {}
+      if not oidxs: return ckrecs
+      ocnd = "otype = 'P'" if otype == 'P' else "otype <> 'P'"
+      idxs = sorted(set(oidxs))
+      for i in range(0, len(idxs), self.PGOPT['ANYLMT']):
+         astr = ','.join(map(str, idxs[i:i+self.PGOPT['ANYLMT']]))
+         pgrecs = self.pgmget("dscheck", "oindex, runhost, pid, lockhost, stttime",
+                              "oindex = ANY(ARRAY[{}]) AND command = 'dsrqst' AND {}".format(astr, ocnd), self.PGOPT['extlog'])
+         cnt = len(pgrecs['oindex']) if pgrecs else 0
+         for j in range(cnt):
+            oidx = pgrecs['oindex'][j]
+            if oidx not in ckrecs: ckrecs[oidx] = self.onerecord(pgrecs, j)
+      return ckrecs
+
+   def get_online_file_stats(self, fname, idxs):
+      """Count the online request files and sum their sizes for multiple requests or partitions.
+
+      Args:
+         fname: Index field name, 'rindex' or 'pindex'.
+         idxs: List of request or partition indices.
+
+      Returns:
+         Dictionary of index to [file count, total size]; indices without online
+         files are not included.
+      """
+      fstats = {}
+      if not idxs: return fstats
+      idxs = sorted(set(idxs))
+      for i in range(0, len(idxs), self.PGOPT['ANYLMT']):
+         astr = ','.join(map(str, idxs[i:i+self.PGOPT['ANYLMT']]))
+         pgrecs = self.pgmget("wfrqst", "{0}, count(*) fcnt, sum(size) ts".format(fname),
+                              "{} = ANY(ARRAY[{}]) AND status = 'O' GROUP BY {}".format(fname, astr, fname), self.PGOPT['extlog'])
+         cnt = len(pgrecs[fname]) if pgrecs else 0
+         for j in range(cnt):
+            fstats[pgrecs[fname][j]] = [pgrecs['fcnt'][j], pgrecs['ts'][j]]
+      return fstats
+
    def get_request_status(self, pgrecs, cnt = 0):
       """Expand request status codes into detailed status strings with progress info.
 
+      The dscheck records and online file counts of all queued requests are
+      gathered with one query each.
+
       Args:
          pgrecs: Multiple records dictionary with request data.
          cnt: Number of records to process (default 0 means all).
@@ -1490,15 +2530,17 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
       """
       if not cnt: cnt = (len(pgrecs['rindex']) if pgrecs else 0)
       rstats = pgrecs['status']
+      qidxs = [pgrecs['rindex'][i] for i in range(cnt) if rstats[i] == 'Q']
+      ckrecs = self.get_status_dschecks(qidxs, 'R')
+      fstats = self.get_online_file_stats('rindex', [pgrecs['rindex'][i] for i in range(cnt) if rstats[i] == 'Q' and pgrecs['pid'][i]])
       for i in range(cnt):
          pgrec = self.onerecord(pgrecs, i)
          if rstats[i] == 'Q':
-            ckrec = self.pgget("dscheck", "runhost, pid, lockhost, stttime",
-                                "oindex = {} AND command = 'dsrqst' AND otype <> 'P'".format(pgrec['rindex']), self.PGOPT['extlog'])
+            ckrec = ckrecs.get(pgrec['rindex'])
             if pgrec['pid']:
                runhost = ""
                pcnt = 0
-               percent = self.complete_request_percentage(pgrec, ckrec)
+               percent = self.complete_request_percentage(pgrec, ckrec, fstats.get(pgrec['rindex'], [0, None]))
                if percent < 0:
                   rstats[i] += " - pending"
                else:
@@ -1523,12 +2565,14 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
             rstats[i] += " - " + self.request_status(rstats[i])
       return rstats   
 
-   def complete_request_percentage(self, rqst, ckrec):
+   def complete_request_percentage(self, rqst, ckrec, fstat = None):
       """Get percentage of completion of request process.
 
       Args:
          rqst: Request record dictionary.
          ckrec: Dscheck record dictionary, or None.
+         fstat: [count, total size] of the request's online files from
+                get_online_file_stats(), or None to query them.
 
       Returns:
          Percentage (0-99) of completion, or -1 if pending.
@@ -1537,7 +2581,10 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
       percent = 0
       cnd = "rindex = {} AND status = 'O'".format(rqst['rindex'])
       if rqst['fcount'] and rqst['fcount'] > 0:
-         cnt = rqst['pcount'] if rqst['pcount'] else self.pgget("wfrqst", "", cnd)
+         if rqst['pcount']:
+            cnt = rqst['pcount']
+         else:
+            cnt = fstat[0] if fstat else self.pgget("wfrqst", "", cnd)
          if(cnt == 0 and rqst['rqstid'] and 
             (rqst['location'] or self.request_type(rqst['rqsttype'], 1) == 0)):
             files = glob.glob(self.get_file_path("*", rqst['rqstid'], rqst['location'], 1))
@@ -1548,15 +2595,22 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
             else:
                percent = 99
       elif rqst['size_request'] > 0:
-         pgrec = self.pgget("wfrqst", "sum(size) ts", cnd)
-         if pgrec and pgrec['ts']:
-            percent = int(100*pgrec['ts']/rqst['size_request'])
+         if fstat:
+            ts = fstat[1]
+         else:
+            pgrec = self.pgget("wfrqst", "sum(size) ts", cnd)
+            ts = pgrec['ts'] if pgrec else None
+         if ts:
+            percent = int(100*ts/rqst['size_request'])
             if percent > 99: percent = 99
       return percent
 
    def get_partition_status(self, pgrecs, cnt = 0):
       """Expand request partition status codes into detailed status strings.
 
+      The dscheck records and online file counts of all queued partitions are
+      gathered with one query each.
+
       Args:
          pgrecs: Multiple records dictionary with partition data.
          cnt: Number of records to process (default 0 means all).
@@ -1566,15 +2620,17 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
       """
       if not cnt: cnt = (len(pgrecs['rindex']) if pgrecs else 0)
       rstats = [None]*cnt
+      qidxs = [pgrecs['pindex'][i] for i in range(cnt) if pgrecs['status'][i] == 'Q']
+      ckrecs = self.get_status_dschecks(qidxs, 'P')
+      fstats = self.get_online_file_stats('pindex', [pgrecs['pindex'][i] for i in range(cnt) if pgrecs['status'][i] == 'Q' and pgrecs['pid'][i]])
       for i in range(cnt):
          pgrec = self.onerecord(pgrecs, i)
          rstats[i] = pgrec['status']
          if rstats[i] == 'Q':
-            ckrec = self.pgget("dscheck", "runhost, pid, lockhost, stttime",
-                                "oindex = {} AND command = 'dsrqst' AND otype = 'P'".format(pgrec['pindex']), self.PGOPT['extlog'])
+            ckrec = ckrecs.get(pgrec['pindex'])
             if pgrec['pid']:
                runhost = ""
-               percent = self.complete_partition_percentage(pgrec, ckrec)
+               percent = self.complete_partition_percentage(pgrec, ckrec, fstats.get(pgrec['pindex'], [0, None]))
                if percent < 0:
                   rstats[i] += " - pending"
                else:
@@ -1596,12 +2652,178 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
             rstats[i] += " - " + self.request_status(rstats[i])
       return rstats   
 
-   def complete_partition_percentage(self, part, ckrec):
+   def fetch_record_pages(self, tablenames, fields, condition):
+      """Yield query results page by page from a server-side cursor.
+
+      A named cursor is opened inside a transaction so the rows are kept on
+      the database server and fetched PGOPT['PGSIZE'] at a time.
+
+      Args:
+         tablenames: Table names for the FROM clause.
+         fields: Field names to select.
+         condition: Query condition, with ORDER BY clause if any.
+
+      Yields:
+         Multiple records dictionary of one page of rows.
+      """
+      sqlstr = self.prepare_select(tablenames, fields, condition)
+      pgcur = self.pgcursor()     # connect and set schema search path
+      if not pgcur: return
+      pgcur.close()
+      self.starttran()
+      pgcur = self.pgdb.cursor("dsrqst_{}".format(os.getpid()))
+      ended = False
+      try:
+         pgcur.execute(sqlstr)
+         while True:
+            rowvals = pgcur.fetchmany(self.PGOPT['PGSIZE'])
+            if not rowvals: break
+            count = len(rowvals)
+            colvals = list(zip(*rowvals))
+            pgrecs = {}
+            for i in range(len(pgcur.description)):
+               col = pgcur.description[i]
+               vals = list(colvals[i])
+               if col[1] == self.CHCODE:
+                  for j in range(count):
+                     if vals[j] and vals[j][-1] == ' ': vals[j] = vals[j].rstrip()
+               pgrecs[col[0]] = vals
+            yield pgrecs
+         pgcur.close()
+         ended = True
+         self.endtran()
+      except PgSQL.Error as pgerr:
+         ended = True
+         self.aborttran()
+         self.check_dberror(pgerr, 0, sqlstr, None, self.PGOPT['extlog'])
+      finally:
+         if not ended:   # the caller raised or stopped reading pages
+            try:
+               pgcur.close()
+            except PgSQL.Error:
+               pass
+            self.aborttran()
+
+   def stream_column_format(self, tablenames, fields, condition, fnames, hash, pagefunc = None):
+      """Print query results in column format while they are fetched.
+
+      Rows are ordered by the database and written page by page, so memory use
+      does not grow with the result size. With option -FO, a first pass over
+      the cursor gathers the column widths before the rows are printed, and
+      pagefunc is called for the pages of both passes.
+
+      Args:
+         tablenames: Table names for the FROM clause.
+         fields: Field names to select.
+         condition: Query condition, with ORDER BY clause if any.
+         fnames: Field name string for output columns.
+         hash: Table hash of the output fields.
+         pagefunc: Optional function called with each page of records to
+                   fill computed columns before the page is printed.
+
+      Returns:
+         Number of records printed.
+      """
+      if 'OM' in self.params:
+         return self.output_record_pages(self.fetch_record_pages(tablenames, fields, condition), fnames, hash, pagefunc)
+      lens = None
+      if 'FO' in self.params:
+         for pgrecs in self.fetch_record_pages(tablenames, fields, condition):
+            if pagefunc: pagefunc(pgrecs)
+            plens = self.all_column_widths(pgrecs, fnames, hash)
+            lens = [max(lens[i], plens[i]) for i in range(len(plens))] if lens else plens
+      self.OUTPUT.write(self.get_string_titles(fnames, hash, lens) + "\n")
+      cnt = 0
+      for pgrecs in self.fetch_record_pages(tablenames, fields, condition):
+         if pagefunc: pagefunc(pgrecs)
+         cnt += self.print_column_format(pgrecs, fnames, hash, lens)
+      return cnt
+
+   def print_sorted_records(self, pgrecs, fnames, hash, oflds, pagefunc = None):
+      """Print buffered query results sorted by option -OB patterns.
+
+      Args:
+         pgrecs: Multiple records dictionary of all rows.
+         fnames: Field name string for output columns.
+         hash: Table hash of the output fields.
+         oflds: Field name string to order records.
+         pagefunc: Optional function called with the records to fill computed columns.
+
+      Returns:
+         Number of records printed.
+      """
+      lens = None
+      if pgrecs:
+         if pagefunc: pagefunc(pgrecs)
+         if 'FO' in self.params and 'OM' not in self.params: lens = self.all_column_widths(pgrecs, fnames, hash)
+         pgrecs = self.sorthash(pgrecs, oflds, hash, self.params['OB'])
+      if 'OM' in self.params: return self.output_record_pages([pgrecs] if pgrecs else [], fnames, hash)
+      self.OUTPUT.write(self.get_string_titles(fnames, hash, lens) + "\n")
+      return self.print_column_format(pgrecs, fnames, hash, lens) if pgrecs else 0
+
+   def output_record_pages(self, pages, fnames, hash, pagefunc = None):
+      """Write pages of records in the machine readable format given by option -OM.
+
+      JSON writes one object per line, CSV writes a header line of field names
+      followed by the rows, and ARROW writes an Apache Arrow IPC stream with
+      one record batch per page if pyarrow is installed. The Arrow schema is
+      taken from the first page, with string type for columns that are all
+      NULL in it, so later pages are written with the same column types.
+
+      Args:
+         pages: Iterable of multiple records dictionaries.
+         fnames: Field name string for output columns.
+         hash: Table hash of the output fields.
+         pagefunc: Optional function called with each page of records to
+                   fill computed columns before the page is written.
+
+      Returns:
+         Number of records written.
+      """
+      fmt = self.params['OM'].upper()
+      if fmt not in ('JSON', 'CSV', 'ARROW'):
+         self.action_error("{}: Unknown Output Mode, must be JSON, CSV or ARROW".format(self.params['OM']))
+      if fmt == 'ARROW' and not pyarrow:
+         self.action_error("Output Mode ARROW needs python package pyarrow installed")
+      flds = [self.strip_field(hash[fld][1]) for fld in fnames if fld in hash]
+      writer = None
+      if fmt == 'CSV':
+         writer = csv.writer(self.OUTPUT, lineterminator="\n")
+         writer.writerow(flds)
+      cnt = 0
+      for pgrecs in pages:
+         if pagefunc: pagefunc(pgrecs)
+         count = len(pgrecs[flds[0]]) if flds else 0
+         if fmt == 'JSON':
+            for i in range(count):
+               self.OUTPUT.write(json.dumps({fld: pgrecs[fld][i] for fld in flds}, default=str) + "\n")
+         elif fmt == 'CSV':
+            writer.writerows(zip(*[pgrecs[fld] for fld in flds]))
+         else:
+            if not writer:
+               # types are inferred from the first page; a column with no values in it is written as strings
+               schema = pyarrow.RecordBatch.from_pydict({fld: pgrecs[fld] for fld in flds}).schema
+               sflds = set(fld.name for fld in schema if pyarrow.types.is_null(fld.type))
+               schema = pyarrow.schema([pyarrow.field(fld.name, pyarrow.string()) if fld.name in sflds else fld for fld in schema])
+               self.OUTPUT.flush()
+               writer = pyarrow.ipc.new_stream(self.OUTPUT.buffer, schema)
+            cols = {}
+            for fld in flds:
+               vals = pgrecs[fld]
+               cols[fld] = [None if val is None else str(val) for val in vals] if fld in sflds else vals
+            writer.write_batch(pyarrow.RecordBatch.from_pydict(cols, schema))
+         cnt += count
+      if fmt == 'ARROW' and writer: writer.close()
+      return cnt
+
+   def complete_partition_percentage(self, part, ckrec, fstat = None):
       """Get percentage of completion of a partition process.
 
       Args:
          part: Partition record dictionary.
          ckrec: Dscheck record dictionary, or None.
+         fstat: [count, total size] of the partition's online files from
+                get_online_file_stats(), or None to query them.
 
       Returns:
          Percentage (0-99) of completion, or -1 if pending.
@@ -1609,7 +2831,7 @@ class PgRqst(PgOPT, PgCMD, PgSplit):
       if ckrec and not ckrec['stttime']: return -1
       percent = 0
       if part['fcount'] > 0:
-         cnt = self.pgget("wfrqst", "", "pindex = {} AND status = 'O'".format(part['pindex']))
+         cnt = fstat[0] if fstat else self.pgget("wfrqst", "", "pindex = {} AND status = 'O'".format(part['pindex']))
          if cnt > 0:
             if cnt < part['fcount']:
                percent = int(100*cnt/part['fcount'])
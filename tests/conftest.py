@@ -0,0 +1,36 @@
+# conftest.py
+
+import pytest
+
+from .rdadb_standin import RDADBStandIn
+from rda_python_dsrqst.dsrqst import DsRqst
+from rda_python_dsrqst.pg_rdarqst import PgRDARqst
+
+class StandInRqst(RDADBStandIn, DsRqst):
+   """DsRqst on an in-memory SQLite stand-in of RDADB."""
+
+   def __init__(self, workdir):
+      super().__init__()
+      self.init_standin()
+      self.PGLOG['BCKGRND'] = 1
+      self.PGLOG['LOGPATH'] = self.PGLOG['RQSTHOME'] = str(workdir)
+      self.PGOPT['CACT'] = 'BR'
+      self.params['LN'] = 'spec'
+      self.params['WH'] = str(workdir)
+
+class StandInRDARqst(RDADBStandIn, PgRDARqst):
+   """PgRDARqst on an in-memory SQLite stand-in of RDADB."""
+
+   def __init__(self, workdir, db = None):
+      super().__init__()
+      self.init_standin(db)
+      self.PGLOG['BCKGRND'] = 1
+      self.PGLOG['LOGPATH'] = self.PGLOG['RQSTHOME'] = str(workdir)
+
+@pytest.fixture
+def rqst(tmp_path):
+   return StandInRqst(tmp_path)
+
+@pytest.fixture
+def rda(tmp_path):
+   return StandInRDARqst(tmp_path)
@@ -0,0 +1,166 @@
+##################################################################################
+#     Title: rdadb_standin
+#   Purpose: in-memory SQLite stand-in of the RDADB tables used by dsrqst, shared
+#            by the tests, the offline benchmarks and the load simulator
+#    Github: https://github.com/NCAR/rda-python-dsrqst.git
+##################################################################################
+import re
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE dsrqst (rindex INTEGER PRIMARY KEY, rqstid TEXT, dsid TEXT, gindex INTEGER DEFAULT 0,
+   cindex INTEGER DEFAULT 0, rqsttype TEXT, specialist TEXT, email TEXT, status TEXT, priority INTEGER DEFAULT 10,
+   pid INTEGER DEFAULT 0, lockhost TEXT DEFAULT '', hostname TEXT DEFAULT '', ptcount INTEGER DEFAULT 1,
+   fcount INTEGER DEFAULT 0, pcount INTEGER DEFAULT 0, size_request INTEGER DEFAULT 0, size_input INTEGER DEFAULT 0,
+   tarflag TEXT DEFAULT 'N', tarcount INTEGER DEFAULT 0, file_format TEXT, data_format TEXT, location TEXT,
+   date_rqst TEXT, time_rqst TEXT, date_ready TEXT, time_ready TEXT, date_purge TEXT, time_purge TEXT,
+   exectime INTEGER DEFAULT 0, ecount INTEGER DEFAULT 0, note TEXT, rinfo TEXT, subflag INTEGER DEFAULT 0,
+   fromflag TEXT DEFAULT 'C', ip TEXT, task_id TEXT, enotice TEXT, command TEXT, ptlimit INTEGER DEFAULT 0,
+   ptsize INTEGER DEFAULT 0, locktime INTEGER DEFAULT 0, rhash TEXT);
+CREATE INDEX dsrqst_status ON dsrqst (status, specialist);
+CREATE INDEX dsrqst_rhash ON dsrqst (rhash);
+CREATE TABLE wfrqst (findex INTEGER PRIMARY KEY, rindex INTEGER, pindex INTEGER DEFAULT 0, gindex INTEGER DEFAULT 0,
+   tindex INTEGER DEFAULT 0, wfile TEXT, ofile TEXT, type TEXT DEFAULT 'D', srctype TEXT DEFAULT 'W',
+   srcid INTEGER DEFAULT 0, size INTEGER DEFAULT 0, date TEXT, time TEXT, status TEXT DEFAULT 'R', command TEXT,
+   disp_order INTEGER DEFAULT 0, data_format TEXT, file_format TEXT, checksum TEXT, pid INTEGER DEFAULT 0, note TEXT);
+CREATE INDEX wfrqst_rindex ON wfrqst (rindex, wfile);
+CREATE INDEX wfrqst_pindex ON wfrqst (pindex);
+CREATE TABLE ptrqst (pindex INTEGER PRIMARY KEY, rindex INTEGER, dsid TEXT, specialist TEXT, status TEXT,
+   ptorder INTEGER DEFAULT 0, fcount INTEGER DEFAULT 0, ptcmp TEXT DEFAULT 'N', pid INTEGER DEFAULT 0,
+   lockhost TEXT DEFAULT '', hostname TEXT DEFAULT '', tarcount INTEGER DEFAULT 0, exectime INTEGER DEFAULT 0,
+   qoptions TEXT, modules TEXT, environments TEXT, locktime INTEGER DEFAULT 0);
+CREATE INDEX ptrqst_rindex ON ptrqst (rindex);
+CREATE TABLE tfrqst (tindex INTEGER PRIMARY KEY, rindex INTEGER, pindex INTEGER DEFAULT 0, gindex INTEGER DEFAULT 0,
+   wfile TEXT, size INTEGER DEFAULT 0, date TEXT, time TEXT, data_format TEXT, file_format TEXT,
+   fcount INTEGER DEFAULT 0, disp_order INTEGER DEFAULT 0);
+CREATE TABLE wfpurge (rindex INTEGER, gindex INTEGER, srcid INTEGER, srctype TEXT, size INTEGER, type TEXT,
+   data_format TEXT, file_format TEXT, wfile TEXT);
+CREATE TABLE dspurge (rindex INTEGER PRIMARY KEY, dsid TEXT, gindex INTEGER, rqsttype TEXT, specialist TEXT,
+   email TEXT, wuid_request INTEGER, fromflag TEXT, subflag INTEGER, location TEXT, data_format TEXT,
+   file_format TEXT, ip TEXT, note TEXT, task_id TEXT, rinfo TEXT, hostname TEXT, quarter INTEGER,
+   size_request INTEGER, size_input INTEGER, fcount INTEGER, ptcount INTEGER, exectime INTEGER, date_rqst TEXT,
+   time_rqst TEXT, date_ready TEXT, time_ready TEXT, date_purge TEXT, time_purge TEXT);
+CREATE TABLE dscheck (cindex INTEGER PRIMARY KEY, oindex INTEGER, otype TEXT, command TEXT, runhost TEXT,
+   pid INTEGER DEFAULT 0, lockhost TEXT, stttime INTEGER DEFAULT 0);
+CREATE TABLE rcrqst (cindex INTEGER PRIMARY KEY, dsid TEXT, gindex INTEGER DEFAULT 0, rqsttype TEXT,
+   specialist TEXT, control TEXT DEFAULT 'A', maxrqst INTEGER DEFAULT 0, maxperiod TEXT, validsubset TEXT,
+   validperiod INTEGER DEFAULT 0, ccemail TEXT DEFAULT 'N', enotice TEXT, hostname TEXT DEFAULT '', qoptions TEXT,
+   modules TEXT, environments TEXT, ptlimit INTEGER DEFAULT 0, ptsize INTEGER DEFAULT 0, command TEXT,
+   ptflag TEXT DEFAULT 'N', empty_out TEXT DEFAULT 'N', subflag INTEGER, tarflag TEXT, data_format TEXT,
+   file_format TEXT);
+CREATE TABLE dataset (dsid TEXT PRIMARY KEY, title TEXT);
+CREATE TABLE dsgroup (dsid TEXT, gindex INTEGER, pindex INTEGER);
+CREATE TABLE dssgrp (logname TEXT PRIMARY KEY, lstname TEXT, fstname TEXT);
+CREATE TABLE ruser (id INTEGER PRIMARY KEY, email TEXT, lname TEXT, fname TEXT, country TEXT, org_type TEXT,
+   org TEXT, valid_email TEXT, rdate TEXT, end_date TEXT);
+CREATE INDEX ruser_email ON ruser (email);
+CREATE TABLE wuser (wuid INTEGER PRIMARY KEY, email TEXT, ruid INTEGER, fstname TEXT, lstname TEXT, country TEXT,
+   org_type TEXT, start_date TEXT, until_date TEXT, stat_flag TEXT);
+CREATE TABLE ousage (order_number TEXT PRIMARY KEY, wuid_request INTEGER, dss_uname TEXT, dsid TEXT,
+   date_request TEXT, date_closed TEXT, size_request INTEGER, size_input INTEGER, count INTEGER, method TEXT,
+   source TEXT, quarter INTEGER, ip TEXT, project TEXT, data_format TEXT, file_format TEXT);
+"""
+
+class RDADBStandIn:
+   """Mixin serving the RDADB access functions from an in-memory SQLite database.
+
+   Mix it in ahead of a PgRqst based class. PostgreSQL specific conditions
+   used by dsrqst, such as '= ANY(ARRAY[...])', are rewritten into their
+   SQLite equivalents, and every call is counted in self.DBCALLS so the
+   benchmarks and the simulator can report the database round trips.
+   """
+
+   def init_standin(self, db = None):
+      """Attach a SQLite database, creating the RDADB tables if db is not given.
+
+      Args:
+         db: An existing sqlite3 connection to share, or None for a new one.
+      """
+      if db is None:
+         db = sqlite3.connect(":memory:")
+         db.executescript(SCHEMA)
+      self.db = db
+      self.DBCALLS = 0
+
+   @staticmethod
+   def sqlite_string(sqlstr):
+      """Rewrite PostgreSQL syntax used by dsrqst into SQLite syntax."""
+      return re.sub(r'=\s*ANY\(ARRAY\[([^\]]*)\]\)', r'IN (\1)', sqlstr)
+
+   def execute(self, sqlstr, values = ()):
+      """Execute one SQL statement and count it as a database call."""
+      self.DBCALLS += 1
+      return self.db.execute(self.sqlite_string(sqlstr), values)
+
+   def pgget(self, tablenames, fields, condition = None, logact = 0):
+      """Get one record, or a record count if fields is empty."""
+      cur = self.execute(self.prepare_select(tablenames, fields, condition))
+      row = cur.fetchone()
+      if not fields: return row[0] if row else 0
+      return dict(zip([col[0] for col in cur.description], row)) if row else None
+
+   def pgmget(self, tablenames, fields, condition = None, logact = None):
+      """Get multiple records as a dictionary of column lists."""
+      cur = self.execute(self.prepare_select(tablenames, fields, condition))
+      rows = cur.fetchall()
+      if not rows: return {}
+      cols = list(zip(*rows))
+      return {cur.description[i][0] : list(cols[i]) for i in range(len(cols))}
+
+   def starttran(self):
+      """Start a transaction."""
+      if not self.db.in_transaction: self.db.execute("BEGIN")
+      self.curtran = 1
+
+   def endtran(self, autocommit = True):
+      """Commit the current transaction."""
+      self.db.commit()
+      self.curtran = 0
+
+   def aborttran(self, autocommit = True):
+      """Roll back the current transaction."""
+      self.db.rollback()
+      self.curtran = 0
+
+   def batch_savepoint(self, sqlstr):
+      """Execute savepoint commands, separated by ';', in one call."""
+      self.DBCALLS += 1
+      for cmd in sqlstr.split(';'):
+         self.db.execute(cmd)
+
+   def pgtable(self, tablename, logact = None):
+      """Get a dictionary of field names to default values of a table."""
+      cur = self.execute("PRAGMA table_info({})".format(tablename))
+      return {row[1] : row[4] for row in cur.fetchall()}
+
+   def pgadd(self, tablename, record, logact = None, getid = None):
+      """Add one record, returning its auto index if AUTOID is set."""
+      flds = list(record)
+      cur = self.execute("INSERT INTO {} ({}) VALUES ({})".format(tablename, ', '.join(flds), ', '.join(['?']*len(flds))),
+                         [record[fld] for fld in flds])
+      return cur.lastrowid if logact and logact&self.AUTOID else 1
+
+   def add_request_with_id(self, record, lname, logact = None):
+      """Add a dsrqst record, setting rqstid from its new rindex in one statement."""
+      record = {fld: record[fld] for fld in record if fld != 'rindex' and fld != 'rqstid'}
+      flds = list(record)
+      cur = self.execute("INSERT INTO dsrqst (rindex, rqstid, {}) ".format(', '.join(flds)) +
+                         "SELECT n, ? || n{} FROM (SELECT IFNULL(MAX(rindex), 0) + 1 AS n FROM dsrqst) ".format(', ?'*len(flds)) +
+                         "RETURNING rindex", [lname] + [record[fld] for fld in flds])
+      return cur.fetchone()[0]
+
+   def pgupdt(self, tablename, record, condition, logact = None):
+      """Update records, returning the number of records changed."""
+      if not record: return 0
+      flds = list(record)
+      cur = self.execute("UPDATE {} SET {} WHERE {}".format(tablename, ', '.join(fld + " = ?" for fld in flds), condition),
+                         [record[fld] for fld in flds])
+      return cur.rowcount
+
+   def pgdel(self, tablename, condition, logact = None):
+      """Delete records, returning the number of records deleted."""
+      return self.execute("DELETE FROM {} WHERE {}".format(tablename, condition)).rowcount
+
+   def pgexec(self, sqlstr, logact = None):
+      """Execute a SQL statement, returning the number of records affected."""
+      return self.execute(sqlstr).rowcount
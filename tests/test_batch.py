@@ -0,0 +1,70 @@
+# test_batch.py
+
+import pytest
+
+@pytest.fixture
+def rdb(rda):
+   db = rda.db
+   db.execute("INSERT INTO dssgrp VALUES ('spec', 'Specialist', 'Sim')")
+   db.execute("INSERT INTO dataset VALUES ('d000001', 'Test Dataset')")
+   db.execute("INSERT INTO rcrqst (cindex, dsid, rqsttype, specialist, maxrqst) VALUES (1, 'd000001', 'S', 'spec', 3)")
+   for email in ('a@x.org', 'b@x.org'):
+      db.execute("INSERT INTO ruser (email, lname, fname, rdate) VALUES (?, 'Last', 'First', '2000-01-01')", (email,))
+      db.execute("INSERT INTO wuser (email, lstname, fstname, start_date) VALUES (?, 'Last', 'First', '2000-01-01')", (email,))
+   return rda
+
+def subset(email, rinfo, **kw):
+   rqst = {'rtype': 'S', 'dsid': 'd000001', 'email': email, 'fromflag': 'W', 'location': 'web', 'rinfo': rinfo}
+   rqst.update(kw)
+   return rqst
+
+def request_count(rda, cnd = "rindex > 0"):
+   return rda.pgget("dsrqst", "", cnd)
+
+def test_per_item_results(rdb):
+   results = rdb.rda_request_many([subset('a@x.org', 'v=1'), {'rtype': 'S', 'email': 'a@x.org'}, subset('b@x.org', 'v=1')])
+   assert "submitted successfully" in results[0]['message']
+   assert results[1] == "Dataset ID is missing to submit a request\n"
+   assert "submitted successfully" in results[2]['message']
+   assert request_count(rdb) == 2
+   assert request_count(rdb, "rqstid = 'LAST' || rindex") == 2
+
+def test_maxrqst_counted_across_batch(rdb):
+   rdb.db.execute("INSERT INTO dsrqst (rindex, rqstid, dsid, cindex, rqsttype, email, status) VALUES (1, 'LAST1', 'd000001', 1, 'S', 'a@x.org', 'Q')")
+   results = rdb.rda_request_many([subset('a@x.org', 'v={}'.format(i)) for i in range(3)] + [subset('b@x.org', 'v=0')])
+   assert ["error" in result for result in results] == [False, False, True, False]
+   assert results[2]['error']['code'] == 'too_many_requests'
+   assert request_count(rdb, "email = 'a@x.org'") == 3
+
+def test_duplicates_in_batch(rdb):
+   results = rdb.rda_request_many([subset('a@x.org', 'v=1;lat=10'), subset('a@x.org', 'lat=10; v=1'), subset('b@x.org', 'v=1;lat=10')])
+   assert "submitted successfully" in results[0]['message']
+   assert results[1]['error']['code'] == 'duplicate_request'
+   assert "submitted successfully" in results[2]['message']
+   assert request_count(rdb) == 2
+
+def test_failed_insert_rolled_back_alone(rdb):
+   add_request_with_id = rdb.add_request_with_id
+   def failing_add(record, lname, logact = None):
+      ridx = add_request_with_id(record, lname, logact)   # partly done when the failure hits
+      return 0 if record['email'] == 'b@x.org' else ridx
+   rdb.add_request_with_id = failing_add
+   results = rdb.rda_request_many([subset('a@x.org', 'v=1'), subset('b@x.org', 'v=1'), subset('a@x.org', 'v=2')])
+   assert "submitted successfully" in results[0]['message']
+   assert results[1] == "Fail to add request record for 'd000001'\n"
+   assert "submitted successfully" in results[2]['message']
+   assert request_count(rdb, "email = 'b@x.org'") == 0
+   assert request_count(rdb) == 2
+   assert rdb.PGDBI['MTRANS'] == 5000
+
+def test_interrupted_batch_rolled_back(rdb):
+   add_request_record = rdb.add_request_record
+   def interrupted_add(pgrqst, logact, batch = 0):
+      if pgrqst['email'] == 'b@x.org': raise SystemExit(1)
+      return add_request_record(pgrqst, logact, batch)
+   rdb.add_request_record = interrupted_add
+   with pytest.raises(SystemExit):
+      rdb.rda_request_many([subset('a@x.org', 'v=1'), subset('b@x.org', 'v=1')])
+   assert request_count(rdb) == 0
+   assert rdb.curtran == 0
+   assert rdb.BATCH is None
@@ -0,0 +1,28 @@
+# test_clean.py
+
+def test_clean_legacy_dataset_directory(rqst, tmp_path, monkeypatch):
+   ddir = tmp_path / "ds123.4"
+   ddir.mkdir()
+   for name in ("used.nc", "used.tar", "unused.nc"):
+      (ddir / name).write_text("x")
+   rqst.db.execute("INSERT INTO dsrqst (rindex, dsid, status) VALUES (1, 'd123004', 'O')")
+   rqst.db.execute("INSERT INTO wfrqst (rindex, wfile, ofile) VALUES (1, 'used.nc', 'used.tar')")
+   deleted = []
+   rqst.delete_local_paths = lambda files, logact: deleted.extend(files)
+   rqst.params['FP'] = 1
+   monkeypatch.chdir(tmp_path)
+   assert rqst.clean_dataset_data("ds123.4") == 1
+   assert deleted == ["ds123.4/unused.nc"]
+
+def test_clean_unused_requests_keeps_live_directories(rqst, tmp_path, monkeypatch):
+   for rid in ("SMITH1", "JONES2", "LEE3", "SMITH300", "data"):
+      (tmp_path / rid).mkdir()
+      (tmp_path / rid / "file.nc").write_text("x")
+   rqst.db.execute("INSERT INTO dsrqst (rindex, rqstid, status) VALUES (1, 'SMITH1', 'O')")
+   rqst.db.execute("INSERT INTO dsrqst (rindex, rqstid, status) VALUES (3, 'LEE3', 'Q')")
+   rqst.PGOPT['ANYLMT'] = 2   # request indices looked up in chunks
+   rqst.params['FP'] = 1
+   monkeypatch.chdir(tmp_path)
+   rqst.clean_unused_requests()
+   assert sorted(p.name for p in tmp_path.iterdir() if p.is_dir()) == ["LEE3", "SMITH1", "data"]
+   assert (tmp_path / "SMITH1" / "file.nc").exists()
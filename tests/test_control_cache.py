@@ -0,0 +1,29 @@
+# test_control_cache.py
+
+def add_control(rqst, cindex, gindex, rtype, maxrqst):
+   rqst.db.execute("INSERT INTO rcrqst (cindex, dsid, gindex, rqsttype, specialist, maxrqst) VALUES (?, 'd000001', ?, ?, 'spec', ?)",
+                   (cindex, gindex, rtype, maxrqst))
+
+def test_control_record_cached_until_ttl(rqst):
+   add_control(rqst, 1, 0, 'S', 5)
+   rqst.db.execute("INSERT INTO dsgroup (dsid, gindex, pindex) VALUES ('d000001', 3, 0)")
+   assert rqst.get_control_record('d000001', 3, 'T', 0)['cindex'] == 1   # from the parent group, shared by S and T
+   calls = rqst.DBCALLS
+   rqst.db.execute("UPDATE rcrqst SET maxrqst = 9")
+   assert rqst.get_control_record('d000001', 3, 'S', 0)['maxrqst'] == 5
+   assert rqst.DBCALLS == calls
+   rqst.RCNTLS[('d000001', 3, 'ST', 0)][0] -= rqst.PGOPT['RCTTL']   # expired
+   assert rqst.get_control_record('d000001', 3, 'S', 0)['maxrqst'] == 9
+   assert rqst.DBCALLS > calls
+
+def test_missing_control_cached_and_cleared(rqst):
+   assert rqst.get_control_record('d000001', 0, 'C', 0) is None
+   add_control(rqst, 2, 0, 'C', 0)
+   assert rqst.get_control_record('d000001', 0, 'C', 0) is None
+   rqst.clear_control_cache()
+   assert rqst.get_control_record('d000001', 0, 'C', 0)['cindex'] == 2
+
+def test_cached_control_record_is_a_copy(rqst):
+   add_control(rqst, 1, 0, 'S', 5)
+   rqst.get_control_record('d000001', 0, 'S', 0)['maxrqst'] = 0
+   assert rqst.get_control_record('d000001', 0, 'S', 0)['maxrqst'] == 5
@@ -0,0 +1,30 @@
+# test_delete.py
+
+import os
+
+def make_tree(tmp_path):
+   rdir = tmp_path / "R1"
+   (rdir / "sub" / "deep").mkdir(parents = True)
+   (rdir / "a.nc").write_bytes(b"x"*10)
+   (rdir / "sub" / "b.nc").write_bytes(b"x"*20)
+   (rdir / "sub" / "deep" / "c.nc").write_bytes(b"x"*30)
+   (tmp_path / "d.nc").write_bytes(b"x"*40)
+   return rdir
+
+def test_delete_counts_files_and_bytes(rqst, tmp_path):
+   rdir = make_tree(tmp_path)
+   paths = [str(rdir), str(tmp_path / "d.nc"), str(tmp_path / "missing.nc")]
+   assert rqst.delete_local_paths(paths) == (4, 100)
+   assert not rdir.exists() and not (tmp_path / "d.nc").exists()
+
+def test_delete_skips_files_vanishing(rqst, tmp_path, monkeypatch):
+   rdir = make_tree(tmp_path)
+   unlink = os.unlink
+   def vanish(path):   # removed by another process after the scan
+      unlink(path)
+      if path.endswith("b.nc"): raise FileNotFoundError(path)
+   monkeypatch.setattr(os, 'unlink', vanish)
+   logs = []
+   rqst.pglog = lambda msg, logact: logs.append(msg)
+   assert rqst.delete_local_paths(str(rdir), rqst.LOGWRN) == (2, 40)
+   assert not rdir.exists() and logs == []
@@ -0,0 +1,35 @@
+# test_evict.py
+
+def add_online(rqst, ridx, status, date_ready, size, location = None, rqsttype = 'C'):
+   rqst.db.execute("INSERT INTO dsrqst (rindex, rqstid, dsid, specialist, status, rqsttype, location, size_request, date_ready, time_ready) " +
+                   "VALUES (?, ?, 'd000001', 'spec', ?, ?, ?, ?, ?, '00:00:00')", (ridx, "R{}".format(ridx), status, rqsttype, location, size, date_ready))
+
+def test_evict_least_valuable_first(rqst):
+   add_online(rqst, 1, 'O', '2026-01-10', 100)    # newer and smaller
+   add_online(rqst, 2, 'O', '2026-01-01', 1000)   # oldest and largest
+   add_online(rqst, 3, 'H', '2025-01-01', 9999)   # on hold, never evicted
+   add_online(rqst, 4, 'P', '2026-01-05', 500, '')
+   usages = [95, 95, 85, 75, 75]   # drops below the low-water mark after two purges
+   evicted = []
+   rqst.disk_usage_percent = lambda dpath: usages.pop(0) if len(usages) > 1 else usages[0]
+   rqst.purge_one_request = lambda ridx, cdate, ctime, dopurge: evicted.append((ridx, dopurge)) or 1
+   rqst.params['HW'] = 90
+   rqst.params['LW'] = 80
+   assert rqst.evict_requests() == 2
+   assert evicted == [(2, 2), (4, 2)]
+
+def test_evict_skips_requests_not_under_wh(rqst):
+   add_online(rqst, 1, 'O', '2025-01-01', 9999, '/glade/user/data')   # data at its own location
+   add_online(rqst, 2, 'O', '2025-01-01', 9999, None, 'F')            # shared files under data/dsid
+   add_online(rqst, 3, 'O', '2026-01-01', 10)
+   evicted = []
+   rqst.disk_usage_percent = lambda dpath: 95
+   rqst.purge_one_request = lambda ridx, cdate, ctime, dopurge: evicted.append(ridx) or 1
+   assert rqst.evict_requests() == 1
+   assert evicted == [3]
+
+def test_evict_below_high_water(rqst):
+   add_online(rqst, 1, 'O', '2026-01-01', 100)
+   rqst.disk_usage_percent = lambda dpath: 50
+   rqst.purge_one_request = lambda *args: 1 / 0
+   assert rqst.evict_requests() == 0
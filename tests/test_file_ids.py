@@ -0,0 +1,22 @@
+# test_file_ids.py
+
+def add_wfiles(rqst, dsid, wfiles):
+   rqst.db.execute("CREATE TABLE wfile_{} (wid INTEGER PRIMARY KEY, wfile TEXT, type TEXT)".format(dsid))
+   rqst.db.executemany("INSERT INTO wfile_{} (wid, wfile, type) VALUES (?, ?, ?)".format(dsid), wfiles)
+
+def test_file_ids_batched_with_mixed_srctype(rqst):
+   add_wfiles(rqst, 'd000001', [(1, 'a.nc', 'D'), (2, 'a.nc', 'O'), (3, 'b.nc', 'D')])
+   add_wfiles(rqst, 'd000002', [(1, 'c.nc', 'D')])
+   rqst.PGOPT['ANYLMT'] = 1
+   files = ['a.nc', 'a.nc', 'b.nc', None, 'c.nc', 'a.nc']
+   dsids = ['d000001', 'd000001', 'd000001', 'd000001', 'd000002', 'd000001']
+   stypes = ['W', 'O', None, 'W', 'D', 'D']
+   rqst.DBCALLS = 0
+   assert rqst.fname2fid(files, dsids, stypes) == [1, 2, 3, 0, 1, 1]
+   assert rqst.DBCALLS == 3   # one query per chunk of names per dataset
+   assert rqst.fname2fid(files[:3], dsids[:3], None) == [1, 1, 3]
+   assert rqst.DBCALLS == 3   # cached
+   assert rqst.fid2fname([1, 2, 3, 0, 1], dsids[:5], stypes[:5]) == ['a.nc', 'a.nc', 'b.nc', '', 'c.nc']
+   assert rqst.DBCALLS == 7
+   assert rqst.fid2fname(['3', 1], ['d000001', 'd000002'], None) == ['b.nc', 'c.nc']
+   assert rqst.DBCALLS == 7
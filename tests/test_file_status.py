@@ -0,0 +1,24 @@
+# test_file_status.py
+
+def add_files(rqst, files):
+   for (findex, wfile, size) in files:
+      rqst.db.execute("INSERT INTO wfrqst (findex, rindex, wfile, size, status) VALUES (?, 1, ?, ?, 'O')", (findex, wfile, size))
+   return rqst.pgmget("wfrqst", "findex, wfile, size", "rindex = 1 ORDER BY findex")
+
+def test_reset_changed_files_in_one_update(rqst, tmp_path):
+   (tmp_path / "good.nc").write_bytes(b"x"*10)
+   (tmp_path / "short.nc").write_bytes(b"x"*5)
+   (tmp_path / "sub").mkdir()
+   (tmp_path / "sub" / "deep.nc").write_bytes(b"x"*3)
+   pgrecs = add_files(rqst, [(1, "good.nc", 10), (2, "short.nc", 10), (3, "gone.nc", 10), (4, "sub/deep.nc", 3)])
+   rqst.params['FP'] = 1
+   rqst.DBCALLS = 0
+   assert rqst.reset_request_file_status(1, str(tmp_path), 'd000001', pgrecs) == 2
+   assert rqst.DBCALLS == 1
+   pgrecs = rqst.pgmget("wfrqst", "findex, status", "rindex = 1 ORDER BY findex")
+   assert pgrecs['status'] == ['O', 'R', 'R', 'O']
+
+def test_reset_counts_only_without_fp(rqst, tmp_path):
+   pgrecs = add_files(rqst, [(1, "gone.nc", 10)])
+   assert rqst.reset_request_file_status(1, str(tmp_path), 'd000001', pgrecs) == 1
+   assert rqst.pgget("wfrqst", "status", "findex = 1")['status'] == 'O'
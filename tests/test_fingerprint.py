@@ -0,0 +1,49 @@
+# test_fingerprint.py
+
+def subset(rinfo, **kw):
+   rqst = {'dsid': 'd000001', 'gindex': 0, 'rqsttype': 'S', 'email': 'a@b.c', 'rinfo': rinfo}
+   rqst.update(kw)
+   return rqst
+
+def add_request(rda, ridx, rqst, status = 'Q'):
+   rda.db.execute("INSERT INTO dsrqst (rindex, rqstid, dsid, gindex, rqsttype, email, rinfo, rhash, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                  (ridx, "R{}".format(ridx), rqst['dsid'], rqst['gindex'], rqst['rqsttype'], rqst['email'], rqst['rinfo'],
+                   rda.request_fingerprint(rqst), status))
+
+def test_fingerprint_normalized(rda):
+   fp = rda.request_fingerprint(subset("var=T;  lat=10 20;lon=0 30"))
+   assert fp == rda.request_fingerprint(subset(" lon=0  30; var=T;lat=10 20 ;"))
+   assert fp == rda.request_fingerprint(subset("var=T;lat=10 20;lon=0 30", email = 'other@b.c'))
+   assert fp != rda.request_fingerprint(subset("var=T;lat=10 20;lon=0 31"))
+   assert fp != rda.request_fingerprint(subset("var=T;lat=10 20;lon=0 30", gindex = 2))
+   assert fp != rda.request_fingerprint(subset("var=T;lat=10 20;lon=0 30", rqsttype = 'T'))
+   assert rda.request_fingerprint(subset("")) is None
+
+def test_duplicate_found_by_fingerprint(rda):
+   add_request(rda, 1, subset("var=T;lat=10 20"))
+   rda.duplicate_request_message = lambda pgrqst, logact: pgrqst['rindex']
+   rqst = subset("lat=10  20;var=T")
+   rqst['rhash'] = rda.request_fingerprint(rqst)
+   assert rda.subset_request_submitted(rqst, 0) == 1
+   rqst['email'] = 'other@b.c'
+   assert rda.subset_request_submitted(rqst, 0) is None
+   rqst = subset("lat=10  20;var=T")   # no fingerprint, compared by rinfo
+   assert rda.subset_request_submitted(rqst, 0) is None
+
+def test_built_subset_request_by_any_user(rda):
+   add_request(rda, 1, subset("var=T", email = 'x@b.c'), 'O')
+   add_request(rda, 2, subset("var=T", email = 'y@b.c'), 'O')
+   add_request(rda, 3, subset("var=T", email = 'z@b.c'), 'Q')
+   assert rda.built_subset_request(subset(" var=T "), 0)['rindex'] == 2
+   assert rda.built_subset_request(subset("var=U"), 0) is None
+
+def test_duplicate_found_without_stored_fingerprint(rda):
+   add_request(rda, 1, subset("var=T;lat=10 20"))
+   rda.db.execute("UPDATE dsrqst SET rhash = NULL")   # added before rhash was filled
+   rda.duplicate_request_message = lambda pgrqst, logact: pgrqst['rindex']
+   rqst = subset("var=T;lat=10 20")
+   rqst['rhash'] = rda.request_fingerprint(rqst)
+   assert rda.subset_request_submitted(rqst, 0) == 1
+   rqst = subset("lat=10 20;var=T")
+   rqst['rhash'] = rda.request_fingerprint(rqst)   # reordered, only found by fingerprint
+   assert rda.subset_request_submitted(rqst, 0) is None
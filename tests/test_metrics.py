@@ -0,0 +1,14 @@
+# test_metrics.py
+
+def test_staged_metrics_from_online_files(rqst):
+   for (findex, pindex, size, status) in [(1, 1, 10, 'O'), (2, 1, 20, 'O'), (3, 1, 40, 'E'), (4, 2, 80, 'O')]:
+      rqst.db.execute("INSERT INTO wfrqst (findex, rindex, pindex, wfile, size, status) VALUES (?, 1, ?, ?, ?, ?)",
+                      (findex, pindex, "f{}".format(findex), size, status))
+   rqst.add_staged_metrics('pindex', 1)
+   assert rqst.METRICS['dsrqst_files_staged_total'][''] == 2
+   assert rqst.METRICS['dsrqst_bytes_staged_total'][''] == 30
+   rqst.add_staged_metrics('rindex', 1)
+   assert rqst.METRICS['dsrqst_files_staged_total'][''] == 5
+   assert rqst.METRICS['dsrqst_bytes_staged_total'][''] == 140
+   rqst.add_staged_metrics('rindex', 9)   # nothing online
+   assert rqst.METRICS['dsrqst_files_staged_total'][''] == 5
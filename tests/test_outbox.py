@@ -0,0 +1,112 @@
+# test_outbox.py
+
+import os
+import socketserver
+import threading
+
+import pytest
+
+class SMTPStub(socketserver.StreamRequestHandler):
+   """Minimal SMTP server replying to RCPT with the codes set per address."""
+
+   def handle(self):
+      srv = self.server
+      srv.conns += 1
+      self.reply("220 stub")
+      data = None
+      while True:
+         line = self.rfile.readline()
+         if not line: break
+         if data is not None:
+            if line == b".\r\n":
+               srv.messages.append(b''.join(data))
+               data = None
+               self.reply("250 queued")
+            else:
+               data.append(line)
+            continue
+         cmd = line.decode().strip()
+         verb = cmd[:4].upper()
+         if verb == 'RCPT':
+            addr = cmd[cmd.index('<')+1:cmd.index('>')]
+            self.reply("{} rcpt".format(srv.codes.get(addr, 250)))
+         elif verb == 'DATA':
+            data = []
+            self.reply("354 go ahead")
+         elif verb == 'QUIT':
+            self.reply("221 bye")
+            break
+         else:
+            self.reply("250 ok")
+
+   def reply(self, msg):
+      self.wfile.write((msg + "\r\n").encode())
+
+@pytest.fixture
+def smtpd(rqst):
+   srv = socketserver.ThreadingTCPServer(("127.0.0.1", 0), SMTPStub)
+   srv.daemon_threads = True
+   srv.conns = 0
+   srv.messages = []
+   srv.codes = {}
+   threading.Thread(target = srv.serve_forever, daemon = True).start()
+   rqst.PGLOG['EMLSRVR'] = "127.0.0.1"
+   rqst.PGLOG['EMLPORT'] = srv.server_address[1]
+   yield srv
+   srv.shutdown()
+   srv.server_close()
+
+@pytest.fixture
+def obox(rqst, tmp_path):
+   obox = tmp_path / rqst.PGOPT['OUTBOX']
+   obox.mkdir()
+   return obox
+
+def queue(rqst, to):
+   return rqst.send_customized_email("test", "From: spec@b.c\nTo: {}\nSubject: Request ready\nYour request is ready.\n".format(to))
+
+def test_queue_and_send_in_one_connection(rqst, obox, smtpd):
+   for to in ("a@b.c", "b@b.c", "c@b.c"): assert queue(rqst, to)
+   assert len(list(obox.glob("*.eml"))) == 3
+   assert smtpd.conns == 0
+   assert rqst.send_outbox_emails(0) == 3
+   assert smtpd.conns == 1
+   assert [b"To: a@b.c" in msg for msg in smtpd.messages] == [True, False, False]
+   assert os.listdir(obox) == []
+
+def test_rejected_email_moved_to_failed(rqst, obox, smtpd):
+   smtpd.codes['bad@b.c'] = 550
+   queue(rqst, "bad@b.c")
+   queue(rqst, "good@b.c")
+   assert rqst.send_outbox_emails(0) == 1
+   assert len(list((obox / "failed").glob("*.eml"))) == 1
+   assert list(obox.glob("*.eml*")) == []
+
+def test_transient_refusal_retried_later(rqst, obox, smtpd):
+   smtpd.codes['busy@b.c'] = 450
+   queue(rqst, "busy@b.c")
+   queue(rqst, "good@b.c")
+   assert rqst.send_outbox_emails(0) == 1   # the batch goes on after a 4xx reply
+   assert len(list(obox.glob("*.eml"))) == 1
+   assert not (obox / "failed").exists()
+   del smtpd.codes['busy@b.c']
+   assert rqst.send_outbox_emails(0) == 1
+   assert os.listdir(obox) == []
+
+def test_unreachable_server_keeps_queue(rqst, obox, smtpd):
+   queue(rqst, "a@b.c")
+   queue(rqst, "b@b.c")
+   rqst.PGLOG['EMLPORT'] = 1
+   assert rqst.send_outbox_emails(0) == 0
+   assert len(list(obox.glob("*.eml"))) == 2
+
+def test_claimed_emails(rqst, obox, smtpd):
+   queue(rqst, "a@b.c")
+   queue(rqst, "b@b.c")
+   (efile1, efile2) = sorted(obox.glob("*.eml"))
+   host = rqst.PGLOG['HOSTNAME']
+   efile1.rename("{}.{}.{}".format(efile1, host, os.getppid()))   # being sent by a running sender
+   efile2.rename("{}.{}.{}".format(efile2, host, 2**22 + 1))      # left by a stopped sender
+   assert rqst.send_outbox_emails(0) == 1
+   assert [msg for msg in smtpd.messages if b"To: b@b.c" in msg]
+   assert os.listdir(obox) == ["{}.{}.{}".format(efile1.name, host, os.getppid())]
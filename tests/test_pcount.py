@@ -0,0 +1,52 @@
+# test_pcount.py
+
+def add_request(rqst, ridx, pcount):
+   rqst.db.execute("INSERT INTO dsrqst (rindex, rqstid, dsid, specialist, status, pcount) VALUES (?, ?, 'd000001', 'spec', 'Q', ?)",
+                   (ridx, "R{}".format(ridx), pcount))
+   return rqst.pgget("dsrqst", "*", "rindex = {}".format(ridx))
+
+def get_pcount(rqst, ridx):
+   return rqst.pgget("dsrqst", "pcount", "rindex = {}".format(ridx))['pcount']
+
+def test_pcount_coalesced_and_flushed(rqst):
+   add_request(rqst, 1, 0)
+   rqst.PGOPT['PCINTV'] = 3600
+   rqst.add_request_pcount(1, 1, 10)
+   rqst.add_request_pcount(1, 2, 20)
+   assert get_pcount(rqst, 1) == 0
+   rqst.add_request_pcount(1, 0, 0, 0, True)
+   assert get_pcount(rqst, 1) == 3
+
+def test_pcount_from_null(rqst):
+   add_request(rqst, 1, None)
+   rqst.add_request_pcount(1, 2, 0, 0, True)
+   assert get_pcount(rqst, 1) == 2
+
+def test_pcount_reset_on_rebuild(rqst):
+   pgrqst = add_request(rqst, 1, 5)
+   rqst.PGOPT['PCINTV'] = 3600
+   rqst.add_request_pcount(1, 4)   # unwritten counts of a previous build
+   rqst.reset_request_pcount(1, "rindex = 1", pgrqst)
+   assert pgrqst['pcount'] == 0 and get_pcount(rqst, 1) == 0
+   rqst.add_request_pcount(1, 1, 0, 0, True)
+   assert get_pcount(rqst, 1) == 1
+
+def test_pcount_counts_online_files_on_rebuild(rqst):
+   import os
+   rqst.db.execute("INSERT INTO dsrqst (rindex, rqstid, dsid, specialist, status, pcount, ptcount) " +
+                   "VALUES (1, 'R1', 'd000001', 'spec', 'Q', 5, -1)")
+   rdir = os.path.join(rqst.params['WH'], "R1")
+   os.makedirs(rdir)
+   for i in range(3):
+      wfile = "file{}.nc".format(i)
+      with open(os.path.join(rdir, wfile), 'wb') as f: f.write(b"x"*64)
+      if i < 2:   # built and online by the previous build
+         rqst.db.execute("INSERT INTO wfrqst (rindex, wfile, size, status, date, time) " +
+                         "VALUES (1, ?, 64, 'O', '2026-01-01', '00:00:00')", (wfile,))
+      else:
+         rqst.db.execute("INSERT INTO wfrqst (rindex, wfile, size, status) VALUES (1, ?, 64, 'R')", (wfile,))
+   rqst.PGOPT['RCNTL'] = {'cindex' : 0, 'command' : "true", 'ptlimit' : 0, 'ptsize' : 0, 'ptflag' : 'N', 'empty_out' : 'N'}
+   pgrqst = rqst.pgget("dsrqst", "*", "rindex = 1")
+   rqst.reset_request_pcount(1, "rindex = 1", pgrqst)
+   rqst.call_command(1, "rindex = 1", "true", "R1", pgrqst, 0, None)
+   assert get_pcount(rqst, 1) == 3
@@ -0,0 +1,31 @@
+# test_phase.py
+
+import json
+
+def test_set_phase_times(rqst):
+   pgrecs = {'rindex' : [1, 2, 3, 4],
+             'phasetime' : ['{"tar": 2.5, "command": 30.04}', {'db': 0.26}, None, '']}
+   rqst.set_phase_times(pgrecs)
+   assert pgrecs['phasetime'] == ["command=30.0s tar=2.5s", "db=0.3s", '', '']
+   pgrecs = {'rindex' : [1, 2]}   # no field phasetime in RDADB
+   rqst.set_phase_times(pgrecs)
+   assert pgrecs['phasetime'] == ['', '']
+
+def test_save_phase_times_accumulate(rqst):
+   rqst.db.execute("ALTER TABLE dsrqst ADD COLUMN phasetime TEXT")
+   rqst.db.execute("INSERT INTO dsrqst (rindex, status, phasetime) VALUES (1, 'Q', ?)", (json.dumps({'command' : 10}),))
+   pgrec = rqst.pgget("dsrqst", "*", "rindex = 1")
+   rqst.PHASES = {'command' : 5.0, 'tar' : 1.25}
+   rqst.save_phase_times("dsrqst", "rindex = 1", pgrec)
+   assert rqst.PHASES == {}
+   assert json.loads(rqst.pgget("dsrqst", "phasetime", "rindex = 1")['phasetime']) == {'command' : 15.0, 'tar' : 1.25}
+   pgrecs = rqst.pgmget("dsrqst", "rindex, phasetime", "rindex = 1")
+   rqst.set_phase_times(pgrecs)
+   assert pgrecs['phasetime'] == ["command=15.0s tar=1.2s"]
+
+def test_save_phase_times_from_empty(rqst):
+   rqst.db.execute("ALTER TABLE dsrqst ADD COLUMN phasetime TEXT")
+   rqst.db.execute("INSERT INTO dsrqst (rindex, status, phasetime) VALUES (1, 'Q', '')")
+   rqst.PHASES = {'check' : 0.5}
+   rqst.save_phase_times("dsrqst", "rindex = 1", rqst.pgget("dsrqst", "*", "rindex = 1"))
+   assert json.loads(rqst.pgget("dsrqst", "phasetime", "rindex = 1")['phasetime']) == {'check' : 0.5}
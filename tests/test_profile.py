@@ -0,0 +1,17 @@
+# test_profile.py
+
+import os
+
+def test_profile_named_by_saving_process(rqst, tmp_path, monkeypatch):
+   rqst.params['PA'] = 5
+   ppid = os.getpid()
+   def child_action():   # the action continues in a forked child
+      rqst.pgget("dsrqst", "", "rindex = 1")
+      monkeypatch.setattr(os, 'getpid', lambda: ppid + 1)
+   rqst.profile_actions(child_action)
+   monkeypatch.undo()
+   rqst.profile_actions(lambda: rqst.pgget("dsrqst", "", "rindex = 1"))
+   for pid in (ppid, ppid + 1):
+      assert (tmp_path / "dsrqst_BR_{}.prof".format(pid)).exists()
+      summary = (tmp_path / "dsrqst_BR_{}.txt".format(pid)).read_text()
+      assert "in process {}".format(pid) in summary and "1 RDADB calls" in summary
@@ -0,0 +1,96 @@
+# test_purge.py
+
+import heapq
+
+def add_files(rqst, ridx, wfiles):
+   for wfile in wfiles:
+      rqst.db.execute("INSERT INTO wfrqst (rindex, wfile, size, status) VALUES (?, ?, 10, 'O')", (ridx, wfile))
+
+def test_record_purge_files_once(rqst):
+   add_files(rqst, 1, ["a.nc", "b.nc"])
+   add_files(rqst, 2, ["a.nc"])
+   rqst.DBCALLS = 0
+   assert rqst.record_purge_files("rindex = 1") == 2
+   assert rqst.DBCALLS == 2
+   add_files(rqst, 1, ["c.nc"])   # added after an interrupted purge
+   assert rqst.record_purge_files("rindex = 1") == 1
+   assert rqst.record_purge_files("rindex = 1") == 0
+   pgrecs = rqst.pgmget("wfpurge", "rindex, wfile", "rindex > 0 ORDER BY rindex, wfile")
+   assert list(zip(pgrecs['rindex'], pgrecs['wfile'])) == [(1, "a.nc"), (1, "b.nc"), (1, "c.nc")]
+
+def test_record_purge_files_none(rqst):
+   assert rqst.record_purge_files("rindex = 1") == 0
+
+def set_purge(rqst, ridx, ptime, insert = False):
+   (pdate, ptm) = ptime.split()
+   if insert:
+      rqst.db.execute("INSERT INTO dsrqst (rindex, specialist, status, date_purge, time_purge) VALUES (?, 'spec', 'O', ?, ?)",
+                      (ridx, pdate, ptm))
+   else:
+      rqst.db.execute("UPDATE dsrqst SET date_purge = ?, time_purge = ? WHERE rindex = ?", (pdate, ptm, ridx))
+
+def epoch(rqst, ptime):
+   return rqst.datetime_epoch(*ptime.split())
+
+def pop_due(pheap, pdues, ntime):
+   ridxs = []
+   while pheap and pheap[0][0] <= ntime:
+      (ptime, ridx) = heapq.heappop(pheap)
+      if pdues.get(ridx) != ptime: continue
+      del pdues[ridx]
+      ridxs.append(ridx)
+   return ridxs
+
+def test_refresh_purge_heap_catches_earlier_purge_times(rqst):
+   set_purge(rqst, 1, "2026-01-01 12:00:00", True)
+   set_purge(rqst, 2, "2026-01-01 18:00:00", True)
+   set_purge(rqst, 3, "2026-01-03 00:00:00", True)   # beyond the refresh window
+   pheap = []
+   pdues = {}
+   rqst.refresh_purge_heap(pheap, pdues, epoch(rqst, "2026-01-02 00:00:00"))
+   assert pdues == {1: epoch(rqst, "2026-01-01 12:00:00"), 2: epoch(rqst, "2026-01-01 18:00:00")}
+   set_purge(rqst, 2, "2026-01-01 06:00:00")   # moved earlier between refreshes
+   ntime = epoch(rqst, "2026-01-01 07:00:00")
+   pstarts = set()
+   rqst.refresh_purge_heap(pheap, pdues, ntime, pstarts)
+   assert pop_due(pheap, pdues, ntime) == [2]
+   pstarts.add((2, epoch(rqst, "2026-01-01 06:00:00")))
+   ntime = epoch(rqst, "2026-01-01 13:00:00")
+   rqst.refresh_purge_heap(pheap, pdues, ntime, pstarts)   # request 2 still being purged
+   assert pop_due(pheap, pdues, epoch(rqst, "2026-01-02 00:00:00")) == [1]
+   assert pheap == [] and pdues == {}
+
+def test_refresh_purge_heap_drops_gone_requests(rqst):
+   set_purge(rqst, 1, "2026-01-01 12:00:00", True)
+   pheap = []
+   pdues = {}
+   etime = epoch(rqst, "2026-01-02 00:00:00")
+   rqst.refresh_purge_heap(pheap, pdues, etime)
+   rqst.db.execute("UPDATE dsrqst SET status = 'H'")
+   rqst.refresh_purge_heap(pheap, pdues, etime)
+   assert pdues == {} and pop_due(pheap, pdues, etime) == []
+
+def add_shared(rqst, ridx, wfile, status):
+   rqst.db.execute("INSERT INTO wfrqst (rindex, wfile, ofile, size, status) VALUES (?, ?, ?, 10, ?)", (ridx, wfile, wfile, status))
+
+def test_shared_file_kept_for_other_request(rqst, tmp_path):
+   ddir = tmp_path / "data" / "d000001"
+   ddir.mkdir(parents = True)
+   for ridx in (1, 2, 3):
+      rqst.db.execute("INSERT INTO dsrqst (rindex, dsid, rqsttype, status) VALUES (?, ?, 'M', 'O')",
+                      (ridx, 'd000002' if ridx == 3 else 'd000001'))
+   for wfile in ("a.nc", "b.nc", "c.nc"):
+      (ddir / wfile).write_bytes(b"x"*10)
+      add_shared(rqst, 1, wfile, 'O')
+   add_shared(rqst, 2, "a.nc", 'R')   # shared by a request of the same dataset
+   add_shared(rqst, 3, "b.nc", 'O')   # same name in another dataset
+   pgrqst = rqst.pgget("dsrqst", "*", "rindex = 1")
+   refs = rqst.get_shared_file_refs(pgrqst)
+   assert refs == {'wfile' : {"a.nc" : [1, 1]}, 'ofile' : {"a.nc" : 1}}
+   cnts = [0]*4
+   for wfile in ("a.nc", "b.nc"):
+      rqst.delete_one_file(pgrqst, wfile, wfile, "data/d000001", 1, cnts, refs)
+   rqst.delete_one_file(pgrqst, "c.nc", "c.nc", "data/d000001", 1, cnts)   # references gathered for the file
+   assert cnts == [3, 3, 2, 20]
+   assert (ddir / "a.nc").exists() and not (ddir / "b.nc").exists() and not (ddir / "c.nc").exists()
+   assert rqst.pgget("wfrqst", "status", "rindex = 2")['status'] == 'O'
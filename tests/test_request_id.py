@@ -0,0 +1,23 @@
+# test_request_id.py
+
+from rda_python_dsrqst.pg_rqst import PgRqst
+
+class FakeCursor:
+   def __init__(self, sqls):
+      self.sqls = sqls
+   def execute(self, sqlstr, values):
+      self.sqls.append((sqlstr, values))
+   def fetchone(self):
+      return (7,)
+   def close(self):
+      pass
+
+def test_request_id_ignores_given_index_and_id(rqst):
+   sqls = []
+   rqst.pgcursor = lambda: FakeCursor(sqls)
+   record = {'rindex': 3, 'rqstid': 'OLD3', 'dsid': 'd000001', 'email': 'a@b.c'}
+   assert PgRqst.add_request_with_id(rqst, record, 'SMITH', 0) == 7
+   (sqlstr, values) = sqls[0]
+   assert "INSERT INTO dsrqst (rindex, rqstid, dsid, email) " in sqlstr
+   assert values == ('SMITH', 'd000001', 'a@b.c')
+   assert record['rqstid'] == 'OLD3'   # caller record left unchanged
@@ -0,0 +1,42 @@
+# test_status.py
+
+FIELDS = "rindex, rqstid, rqsttype, status, pid, lockhost, hostname, location, fcount, pcount, size_request, ptcount"
+
+def add_request(rqst, ridx, status, **kw):
+   rec = {'rindex' : ridx, 'rqstid' : "R{}".format(ridx), 'rqsttype' : 'C', 'status' : status}
+   rec.update(kw)
+   rqst.db.execute("INSERT INTO dsrqst ({}) VALUES ({})".format(', '.join(rec), ', '.join('?'*len(rec))), list(rec.values()))
+
+def add_online_files(rqst, ridx, sizes):
+   for size in sizes:
+      rqst.db.execute("INSERT INTO wfrqst (rindex, wfile, size, status) VALUES (?, 'f.nc', ?, 'O')", (ridx, size))
+
+def add_dscheck(rqst, ridx, pid, lockhost, stttime):
+   rqst.db.execute("INSERT INTO dscheck (oindex, otype, command, runhost, pid, lockhost, stttime) " +
+                   "VALUES (?, 'R', 'dsrqst', ?, ?, ?, ?)", (ridx, lockhost, pid, lockhost, stttime))
+
+def test_batched_status_matches_per_row(rqst):
+   add_request(rqst, 1, 'Q', hostname = 'casper')
+   add_request(rqst, 2, 'Q')
+   add_dscheck(rqst, 2, 77, 'derecho', 0)
+   add_request(rqst, 3, 'Q', pid = 123, lockhost = 'casper', fcount = 4)
+   add_online_files(rqst, 3, [10, 10])
+   add_dscheck(rqst, 3, 123, 'casper', 1000)
+   add_request(rqst, 4, 'Q', pid = 124, lockhost = 'casper', size_request = 100)
+   add_online_files(rqst, 4, [30])
+   add_request(rqst, 5, 'Q', pid = 125, lockhost = 'casper', fcount = 2)
+   add_dscheck(rqst, 5, 125, 'casper', 0)
+   add_request(rqst, 6, 'O', location = '/glade/out')
+   add_request(rqst, 7, 'E')
+   rqst.PGOPT['ANYLMT'] = 2
+   pgrecs = rqst.pgmget("dsrqst", FIELDS, "rindex > 0 ORDER BY rindex")
+   rows = [rqst.pgmget("dsrqst", FIELDS, "rindex = {}".format(ridx)) for ridx in pgrecs['rindex']]
+   rqst.DBCALLS = 0
+   rstats = rqst.get_request_status(pgrecs)
+   assert rqst.DBCALLS == 5   # 5 queued requests for dscheck and 3 building for online files, 2 per chunk
+   assert rstats == [rqst.get_request_status(row)[0] for row in rows]
+   assert rstats[0] == "Q -  queued on casper"
+   assert rstats[1] == "Q - building on derecho(77)"
+   assert rstats[2].startswith("Q - 50% built casper<123>")
+   assert rstats[3].startswith("Q - 30% built casper<124>")
+   assert rstats[4].startswith("Q - pending casper<125>")
@@ -0,0 +1,96 @@
+# test_stream.py
+
+import io
+import csv
+import json
+
+import pytest
+
+class PagingCursor:
+   """Named cursor of the SQLite stand-in, for fetch_record_pages()."""
+
+   def __init__(self, rqst):
+      self.rqst = rqst
+      self.cur = None
+
+   @property
+   def description(self):
+      return [(col[0], None) for col in self.cur.description]
+
+   def execute(self, sqlstr):
+      self.cur = self.rqst.execute(sqlstr)
+
+   def fetchmany(self, size):
+      return self.cur.fetchmany(size)
+
+   def close(self):
+      pass
+
+class PagingDB:
+   def __init__(self, rqst):
+      self.rqst = rqst
+
+   def cursor(self, name = None):
+      return PagingCursor(self.rqst)
+
+@pytest.fixture
+def prqst(rqst):
+   rqst.pgcursor = lambda: PagingCursor(rqst)
+   rqst.pgdb = PagingDB(rqst)
+   rqst.OUTPUT = io.StringIO()
+   rqst.PGOPT['PGSIZE'] = 1
+   for (ridx, status) in [(1, 'Q'), (2, 'O'), (3, 'Q')]:
+      rqst.db.execute("INSERT INTO dsrqst (rindex, rqstid, dsid, specialist, status) VALUES (?, ?, 'd000001', 'spec', ?)",
+                      (ridx, "R{}".format(ridx), status))
+   return rqst
+
+def output_rows(rqst):
+   return [line.split("<:>") for line in rqst.OUTPUT.getvalue().splitlines()[1:]]
+
+def test_formatted_status_columns(prqst):
+   pages = []
+   pagefunc = prqst.set_request_columns
+   prqst.set_request_columns = lambda pgrecs: pages.append(pgrecs['rindex']) or pagefunc(pgrecs)
+   prqst.params['FO'] = 1
+   prqst.params['CS'] = 1
+   prqst.params['FN'] = "RA"
+   prqst.get_request_info()
+   assert pages == [[1], [2], [3]]*2    # called for both passes
+   rows = output_rows(prqst)
+   assert [row[0].strip() for row in rows] == ['1', '2', '3']
+   status = [row[1] for row in rows]
+   assert status[0].strip() == "Q -  queued"
+   assert status[1].startswith("O - ")
+   assert len(set(len(stat) for stat in status)) == 1   # padded to the widest status
+
+def test_stopped_reading_rolls_back(prqst):
+   calls = []
+   prqst.aborttran = lambda autocommit = True: calls.append('abort')
+   prqst.endtran = lambda autocommit = True: calls.append('end')
+   for pgrecs in prqst.fetch_record_pages("dsrqst", "rindex", "rindex > 0 ORDER BY rindex"): break
+   assert calls == ['abort']
+   assert sum(len(pgrecs['rindex']) for pgrecs in prqst.fetch_record_pages("dsrqst", "rindex", "rindex > 0")) == 3
+   assert calls == ['abort', 'end']
+
+def test_json_output(prqst):
+   prqst.params['OM'] = "json"
+   prqst.params['CS'] = 1
+   prqst.params['FN'] = "RA"
+   prqst.get_request_info()
+   rows = [json.loads(line) for line in prqst.OUTPUT.getvalue().splitlines()]
+   assert [row['rindex'] for row in rows] == [1, 2, 3]
+   assert rows[0] == {'rindex' : 1, 'status' : "Q -  queued"}
+   assert rows[1]['status'].startswith("O - ")
+
+def test_csv_output(prqst):
+   prqst.params['OM'] = "CSV"
+   prqst.params['FN'] = "RAQ"
+   prqst.db.execute("UPDATE dsrqst SET rqstid = 'R1, \"a\"' WHERE rindex = 1")   # quoted by the csv writer
+   prqst.get_request_info()
+   rows = list(csv.reader(io.StringIO(prqst.OUTPUT.getvalue())))
+   assert rows == [['rindex', 'status', 'rqstid'], ['1', 'Q', 'R1, "a"'], ['2', 'O', 'R2'], ['3', 'Q', 'R3']]
+
+def test_unknown_output_mode(prqst):
+   prqst.params['OM'] = "XML"
+   with pytest.raises(SystemExit):
+      prqst.output_record_pages([], "R", prqst.TBLHASH['dsrqst'])
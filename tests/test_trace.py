@@ -0,0 +1,17 @@
+# test_trace.py
+
+import json
+import subprocess
+from rda_python_common import pg_log
+
+def test_trace_success_of_output_commands(rqst, tmp_path):
+   rqst.params['TL'] = str(tmp_path / "trace.json")
+   rqst.TRACEIDS = [1, 0]
+   assert rqst.pgsystem("echo built", rqst.LOGWRN, 48) == "built\n"
+   rqst.pgsystem("echo failed; exit 3", rqst.LOGWRN, 304)
+   rqst.pgsystem("true", rqst.LOGWRN, 5)
+   assert pg_log.Popen is subprocess.Popen
+   with open(rqst.params['TL']) as f:
+      spans = [json.loads(line) for line in f]
+   assert [span['success'] for span in spans] == [True, False, True]
+   assert spans[0]['command'] == "echo built" and spans[0]['rindex'] == 1